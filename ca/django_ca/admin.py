@@ -24,7 +24,6 @@ from django.conf.urls import url
 from django.contrib import admin
 from django.http import HttpResponse
 from django.http import HttpResponseBadRequest
-from django.utils import timezone
 from django.utils.html import mark_safe
 from django.utils.translation import ugettext_lazy as _
 
@@ -125,7 +124,7 @@ class StatusListFilter(admin.SimpleListFilter):
 class CertificateAdmin(CertificateMixin, admin.ModelAdmin):
     actions = ['revoke', ]
     change_form_template = 'django_ca/admin/change_form.html'
-    list_display = ('cn', 'serial', 'status', 'expires_date')
+    list_display = ('cn', 'serial', 'status_display', 'expires_date')
     list_filter = (StatusListFilter, 'ca')
     readonly_fields = [
         'expires', 'csr', 'pub', 'cn', 'serial', 'revoked', 'revoked_date', 'revoked_reason',
@@ -236,14 +235,10 @@ class CertificateAdmin(CertificateMixin, admin.ModelAdmin):
             return []
         return super(CertificateAdmin, self).get_readonly_fields(request, obj=obj)
 
-    def status(self, obj):
-        if obj.revoked:
-            return _('Revoked')
-        if obj.expires < timezone.now():
-            return _('Expired')
-        else:
-            return _('Valid')
-    status.short_description = _('Status')
+    def status_display(self, obj):
+        # The status column may not be up to date for certificates that expired recently
+        return dict(obj.STATUSES)[obj.get_status()]
+    status_display.short_description = _('Status')
 
     def expires_date(self, obj):
         return obj.expires.date()
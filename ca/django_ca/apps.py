@@ -21,3 +21,9 @@ from django.utils.translation import ugettext_lazy as _
 class DjangoCAConfig(AppConfig):
     name = 'django_ca'
     verbose_name = _('Certificate Authority')
+
+    def ready(self):
+        from .crl import invalidate_crls
+        from .signals import revoked_cert
+
+        revoked_cert.connect(invalidate_crls, dispatch_uid='django_ca.crl.invalidate_crls')
@@ -135,7 +135,17 @@ for name, profile in _CA_PROFILE_OVERRIDES.items():
 CA_DEFAULT_EXPIRES = getattr(settings, 'CA_DEFAULT_EXPIRES', 730)
 CA_DEFAULT_PROFILE = getattr(settings, 'CA_DEFAULT_PROFILE', 'webserver')
 CA_DIGEST_ALGORITHM = getattr(settings, 'CA_DIGEST_ALGORITHM', "sha512")
+CA_SIGNING_PROCESSES = getattr(settings, 'CA_SIGNING_PROCESSES', None)
+CA_SIGNING_QUEUE_SIZE = getattr(settings, 'CA_SIGNING_QUEUE_SIZE', 100)
+CA_SIGNING_TIMEOUT = getattr(settings, 'CA_SIGNING_TIMEOUT', 30)
+CA_CRL_DIR = getattr(settings, 'CA_CRL_DIR', None)
+CA_CRL_SENDFILE = getattr(settings, 'CA_CRL_SENDFILE', None)
+CA_CRL_SENDFILE_PREFIX = getattr(settings, 'CA_CRL_SENDFILE_PREFIX', None)
+CA_CRL_SHARDS = getattr(settings, 'CA_CRL_SHARDS', None)
+CA_CRL_DELTA_URL = getattr(settings, 'CA_CRL_DELTA_URL', None)
+CA_CRL_BACKEND = getattr(settings, 'CA_CRL_BACKEND', 'pyopenssl')
 
 # Undocumented options, e.g. to share values between different parts of code
 CA_MIN_KEY_SIZE = getattr(settings, 'CA_MIN_KEY_SIZE', 2048)
 CA_PROVIDE_GENERIC_CRL = getattr(settings, 'CA_PROVIDE_GENERIC_CRL', True)
+CA_PROVIDE_METRICS = getattr(settings, 'CA_PROVIDE_METRICS', False)
@@ -13,13 +13,44 @@
 # You should have received a copy of the GNU General Public License along with django-ca.  If not,
 # see <http://www.gnu.org/licenses/>.
 
+import calendar
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from contextlib import contextmanager
+from datetime import datetime
+from datetime import timedelta
 from decimal import Decimal
 
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
 from OpenSSL import crypto
 
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.db.models import Q
 from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.encoding import force_text
 
+from django_ca import ca_settings
 from django_ca.models import Certificate
+from django_ca.models import CertificateAuthority
+from django_ca.signing import build_crl
+from django_ca.signing import can_write_crl
+from django_ca.signing import create_crl
+from django_ca.signing import export_crl
+from django_ca.signing import get_signing_pool
+from django_ca.signing import write_crl
+from django_ca.utils import format_date
+from django_ca.utils import get_crl_shard
+from django_ca.utils import get_crl_shard_urls
+from django_ca.utils import parse_date
 
 
 def get_crl(ca, **kwargs):
@@ -43,12 +74,352 @@ def get_crl(ca, **kwargs):
     Returns
     -------
 
-    Returns the CRL as bytes (since this is what pyOpenSSL returns).
+    Returns the CRL as bytes (since this is what pyOpenSSL returns). If ``CA_SIGNING_PROCESSES``
+    is set, the CRL is signed in the signing pool and
+    :py:class:`~django_ca.signing.SigningQueueFull` is raised if the pool is busy. If
+    ``CA_CRL_BACKEND`` is ``"cryptography"``, the CRL is built with :py:func:`build_crl
+    <django_ca.signing.build_crl>` instead and only the ``type``, ``expires`` and ``digest``
+    arguments are supported.
     """
     kwargs.setdefault('digest', b'sha512')
+    if ca_settings.CA_CRL_BACKEND == 'cryptography':
+        return _get_cryptography_crl(ca, **kwargs)
+
     kwargs['days'] = Decimal(kwargs.pop('expires', 86400)) / 86400
 
-    crl = crypto.CRL()
-    for cert in Certificate.objects.filter(ca=ca, expires__gt=timezone.now()).revoked():
-        crl.add_revoked(cert.get_revocation())
-    return crl.export(ca.x509, ca.key, **kwargs)
+    revoked = _get_revoked(ca)
+    pool = get_signing_pool()
+    if pool is not None:
+        return pool.export_crl(force_bytes(ca.pub), ca.private_key_path, list(revoked), **kwargs)
+
+    return create_crl(revoked).export(ca.x509, ca.key, **kwargs)
+
+
+def _get_cryptography_crl(ca, type=crypto.FILETYPE_PEM, expires=86400, digest=b'sha512'):
+    # Same defaults as crypto.CRL.export(), so that both backends return the same CRL
+    args = _prepare_crl(ca, expires)
+    pool = get_signing_pool()
+    if pool is not None:
+        crl = pool.build_crl(*args, digest=force_text(digest))
+    else:
+        crl = build_crl(*args, digest=force_text(digest))
+    return _convert_crl(crl, type)
+
+
+def stream_crl(ca, stream, expires=86400, digest=b'sha512'):
+    """Write a complete CRL in DER format to ``stream`` using bounded memory.
+
+    The CRL is the same as returned by :py:func:`get_crl`, but revoked certificates are encoded
+    straight from the database iterator (see :py:func:`~django_ca.signing.write_crl`), so this
+    function is suitable for CRLs with millions of entries. The signing pool is not used. Use
+    :py:func:`can_stream_crl` to check if the private key of ``ca`` supports the digest.
+    """
+    now = datetime.utcnow().replace(microsecond=0)
+    write_crl(stream, force_bytes(ca.pub), ca.private_key_path, _get_revoked_values(ca), now,
+              now + timedelta(seconds=expires), force_text(digest))
+
+
+def can_stream_crl(ca, digest=b'sha512'):
+    """Check if :py:func:`stream_crl` can sign a CRL of ``ca`` with the given digest.
+
+    Some combinations are not supported, e.g. DSA keys with SHA-384 or SHA-512.
+    """
+    return can_write_crl(ca.private_key_path, force_text(digest))
+
+
+def _get_revoked_values(ca):
+    """Get revoked certificates as expected by :py:func:`~django_ca.signing.build_crl`."""
+    # Only load the columns required for the CRL, without creating model instances
+    qs = Certificate.objects.filter(ca=ca, expires__gt=timezone.now()).revoked().values_list(
+        'serial', 'revoked_reason', 'revoked_date')
+    return ((serial.replace(':', ''), reason or None, date)
+            for serial, reason, date in qs.iterator())
+
+
+def _get_revoked(ca):
+    """Get revoked certificates as expected by :py:func:`~django_ca.signing.create_crl`."""
+    return ((force_bytes(serial), force_bytes(reason) if reason else None,
+             force_bytes(format_date(date))) for serial, reason, date in _get_revoked_values(ca))
+
+
+def _prepare_crl(ca, expires):
+    """Get positional arguments for :py:func:`~django_ca.signing.build_crl` for a CRL without a
+    CRL number, except for the digest."""
+    now = datetime.utcnow().replace(microsecond=0)
+    return (force_bytes(ca.pub), ca.private_key_path, list(_get_revoked_values(ca)), now,
+            now + timedelta(seconds=expires))
+
+
+def _convert_crl(crl, type):
+    """Convert a DER encoded CRL to the given ``OpenSSL.crypto.FILETYPE_*``.
+
+    ``FILETYPE_TEXT`` requires :py:func:`OpenSSL.crypto.dump_crl`, added in pyOpenSSL 16.1.0.
+    """
+    if type == crypto.FILETYPE_PEM:
+        crl = x509.load_der_x509_crl(crl, default_backend()).public_bytes(
+            serialization.Encoding.PEM)
+    elif type != crypto.FILETYPE_ASN1:
+        if not hasattr(crypto, 'dump_crl'):  # pragma: no cover - pyOpenSSL < 16.1.0
+            raise ValueError('Text output of CRLs requires pyOpenSSL 16.1.0 or later.')
+        crl = crypto.dump_crl(type, crypto.load_crl(crypto.FILETYPE_ASN1, crl))
+    return crl
+
+
+def get_base_crl(ca, type=crypto.FILETYPE_ASN1, expires=86400, digest=b'sha512'):
+    """Generate a complete CRL with a CRL number that delta CRLs may refer to.
+
+    Unlike :py:func:`get_crl`, the CRL includes a CRLNumber extension. The number is incremented
+    for every base or delta CRL and stored in the database, as is the number and the time of the
+    last base CRL. Only the first base CRL in a period of ``expires`` seconds (counted from the
+    UNIX epoch) gets a new number, base CRLs generated later in the same period (e.g. in other
+    formats, with other digests or by other processes) reuse it, so they all match the delta
+    CRLs.
+
+    If ``CA_CRL_DELTA_URL`` is set, the CRL includes a FreshestCRL extension pointing to the delta
+    CRLs. Parameters and return value are the same as for :py:func:`get_crl`.
+    """
+    return _get_numbered_crl(ca, type, expires, digest, delta=False)
+
+
+def get_delta_crl(ca, type=crypto.FILETYPE_ASN1, expires=86400, digest=b'sha512'):
+    """Generate a delta CRL for the last base CRL (see :py:func:`get_base_crl`).
+
+    The delta CRL contains only certificates revoked since the last base CRL was generated and
+    refers to it with a deltaCRLIndicator extension. Raises ``ValueError`` if no base CRL was
+    generated yet. Parameters and return value are the same as for :py:func:`get_crl`.
+    """
+    return _get_numbered_crl(ca, type, expires, digest, delta=True)
+
+
+def get_shard_crl(ca, shards, shard, type=crypto.FILETYPE_ASN1, expires=86400,
+                  digest=b'sha512'):
+    """Generate the CRL for a shard of the certificates of a certificate authority.
+
+    If ``CA_CRL_SHARDS`` is set, certificates are assigned to a shard by their serial (see
+    :py:func:`~django_ca.utils.get_crl_shard`) and their crlDistributionPoints extension points to
+    the CRL of that shard. The CRL only contains revoked certificates of the given shard and
+    includes an issuingDistributionPoint extension with the URLs of the shard, so URLs of
+    :py:attr:`~django_ca.models.CertificateAuthority.crl_url` with a ``{shard}`` placeholder are
+    required. Raises ``ValueError`` if there are no such URLs or the shard is out of range.
+
+    The CRL includes a CRL number like :py:func:`get_base_crl`, but can not be used as a base CRL.
+    Other parameters and return value are the same as for :py:func:`get_crl`.
+    """
+    urls = [force_text(url) for url in get_crl_shard_urls(ca.crl_url, shards, shard)]
+    if not 0 <= shard < shards:
+        raise ValueError('%s: Invalid CRL shard: %s/%s' % (ca.serial, shard, shards))
+    if not urls:
+        raise ValueError('%s: No CRL URL with a shard placeholder.' % ca.serial)
+    return _get_numbered_crl(ca, type, expires, digest, shard=(shards, shard, urls))
+
+
+def _get_numbered_crl(ca, type, expires, digest, delta=False, shard=None):
+    args, kwargs = _prepare_numbered_crl(ca, expires, delta=delta, shard=shard)
+    kwargs['digest'] = force_text(digest)
+
+    pool = get_signing_pool()
+    if pool is not None:
+        crl = pool.build_crl(*args, **kwargs)
+    else:
+        crl = build_crl(*args, **kwargs)
+    return _convert_crl(crl, type)
+
+
+def _prepare_numbered_crl(ca, expires, delta=False, shard=None):
+    """Allocate a CRL number and load revoked certificates.
+
+    Returns positional and keyword arguments for :py:func:`~django_ca.signing.build_crl`, except
+    for the digest.
+    """
+    # thisUpdate and nextUpdate are in UTC, while the database stores local time if USE_TZ=False
+    last_update = datetime.utcnow().replace(microsecond=0)
+    now = timezone.now().replace(microsecond=0)
+    period_start = now - timedelta(seconds=calendar.timegm(last_update.utctimetuple()) % expires)
+    qs = CertificateAuthority.objects.filter(pk=ca.pk)
+
+    # The row is locked by the update until the transaction ends, so every delta or shard CRL gets
+    # a unique number and only one base CRL per period allocates a new number
+    with transaction.atomic():
+        if delta is True:
+            if qs.values_list('crl_base_number', flat=True).get() is None:
+                raise ValueError('%s: No base CRL was generated yet.' % ca.serial)
+            qs.update(crl_number=F('crl_number') + 1)
+        elif shard is not None:
+            qs.update(crl_number=F('crl_number') + 1)
+        else:
+            # Only the first base CRL of a period gets a new number
+            qs.filter(Q(crl_base_date__isnull=True) | Q(crl_base_date__lt=period_start)).update(
+                crl_number=F('crl_number') + 1, crl_base_number=F('crl_number') + 1,
+                crl_base_date=now)
+        crl_number, base_number, base_date = qs.values_list(
+            'crl_number', 'crl_base_number', 'crl_base_date').get()
+        if delta is False and shard is None:
+            crl_number = base_number
+
+    certs = Certificate.objects.filter(ca=ca, expires__gt=now).revoked()
+    if delta is True:
+        # Certificates revoked shortly before the base CRL are included as well, in case the
+        # revocation was committed only after the base CRL was generated.
+        certs = certs.filter(revoked_date__gte=base_date - timedelta(seconds=60))
+    revoked = [(serial.replace(':', ''), reason or None, date) for serial, reason, date
+               in certs.values_list('serial', 'revoked_reason', 'revoked_date').iterator()]
+
+    next_update = last_update + timedelta(seconds=expires)
+    args = (force_bytes(ca.pub), ca.private_key_path, revoked, last_update, next_update)
+    kwargs = {
+        'crl_number': crl_number,
+        'delta_crl_indicator': base_number if delta is True else None,
+    }
+    if delta is False and shard is None and ca_settings.CA_CRL_DELTA_URL:
+        kwargs['freshest_crl'] = [ca_settings.CA_CRL_DELTA_URL.replace('{serial}', ca.serial)]
+    if shard is not None:
+        # The shard is derived from the serial, so it can't be filtered in the database
+        shards, shard, kwargs['distribution_point'] = shard
+        revoked[:] = [r for r in revoked if get_crl_shard(r[0], shards) == shard]
+    return args, kwargs
+
+
+def get_crl_tasks(ca, digests, scope=None, expires=86400):
+    """Prepare CRLs of a certificate authority for signing, e.g. in a process pool.
+
+    Revoked certificates are loaded only once for all digests and base and delta CRLs
+    (``scope="base"`` or ``scope="delta"``) get the same CRL number, so the CRLs only differ in the
+    signature. Raises ``ValueError`` if a delta CRL is requested, but no base CRL was generated
+    yet.
+
+    Returns a list of tuples of the digest, a function of :py:mod:`django_ca.signing` and its
+    positional and keyword arguments. The function returns the CRL in DER format.
+    """
+    if scope is None and ca_settings.CA_CRL_BACKEND == 'cryptography':
+        args = _prepare_crl(ca, expires)
+        return [(digest, build_crl, args, {'digest': force_text(digest)}) for digest in digests]
+    elif scope is None:
+        revoked = list(_get_revoked(ca))
+        args = (force_bytes(ca.pub), ca.private_key_path, revoked)
+        kwargs = {'type': crypto.FILETYPE_ASN1, 'days': Decimal(expires) / 86400}
+        return [(digest, export_crl, args, dict(kwargs, digest=force_bytes(digest)))
+                for digest in digests]
+
+    args, kwargs = _prepare_numbered_crl(ca, expires, delta=scope == 'delta')
+    return [(digest, build_crl, args, dict(kwargs, digest=force_text(digest)))
+            for digest in digests]
+
+
+def get_crl_path(directory, serial, scope=None, digest='sha512'):
+    """Get the path of stored CRL files, without the file extension.
+
+    See :py:func:`write_crl_files` for the files stored at this path.
+    """
+    return os.path.join(directory, serial.replace(':', ''), '%s-%s' % (scope or 'full', digest))
+
+
+def read_crl_metadata(path):
+    """Read the metadata of the CRL stored at ``path``.
+
+    Returns ``None`` if there is no CRL at the path, otherwise a dictionary as returned by
+    :py:func:`write_crl_files`.
+    """
+    try:
+        with open('%s.json' % path) as stream:
+            metadata = json.load(stream)
+    except (IOError, OSError, ValueError):
+        return None
+
+    metadata['this_update'] = parse_date(metadata['this_update'])
+    metadata['next_update'] = parse_date(metadata['next_update'])
+    return metadata
+
+
+@contextmanager
+def open_atomic(path):
+    """Context manager to write a file that replaces ``path`` atomically when the block ends.
+
+    Data is written to a temporary file in the same directory that is removed if the block raises
+    an exception, so a partially written file is never found at ``path``.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                    prefix='.%s.' % os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'wb') as stream:
+            yield stream
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def _write_atomic(path, data):
+    with open_atomic(path) as stream:
+        stream.write(data)
+
+
+def write_crl_files(path, crl):
+    """Store a CRL in DER and PEM format together with a metadata sidecar file.
+
+    The files are named ``<path>.der``, ``<path>.pem`` and ``<path>.json`` and each file is
+    replaced atomically. The sidecar is written last, so the CRL files are always at least as new
+    as the metadata.
+
+    Parameters
+    ----------
+
+    path : str
+        The path of the files without the file extension, see :py:func:`get_crl_path`.
+    crl : bytes
+        The CRL in DER format.
+
+    Returns
+    -------
+
+    dict
+        The metadata stored in the sidecar: ``this_update`` and ``next_update`` of the CRL (as
+        ``datetime``), the ``crl_number`` (or ``None``), the ``size`` of the DER encoded CRL and
+        its SHA-256 hash (``sha256``).
+    """
+    parsed = x509.load_der_x509_crl(crl, default_backend())
+    try:
+        crl_number = parsed.extensions.get_extension_for_class(x509.CRLNumber).value.crl_number
+    except x509.ExtensionNotFound:
+        crl_number = None
+
+    metadata = {
+        'this_update': format_date(parsed.last_update),
+        'next_update': format_date(parsed.next_update),
+        'crl_number': crl_number,
+        'size': len(crl),
+        'sha256': hashlib.sha256(crl).hexdigest(),
+    }
+
+    try:
+        os.makedirs(os.path.dirname(path))
+    except OSError:  # directory already exists (maybe created by a different process)
+        if not os.path.isdir(os.path.dirname(path)):
+            raise
+    _write_atomic('%s.der' % path, crl)
+    _write_atomic('%s.pem' % path, parsed.public_bytes(serialization.Encoding.PEM))
+    _write_atomic('%s.json' % path, force_bytes(json.dumps(metadata, sort_keys=True)))
+
+    metadata['this_update'] = parsed.last_update
+    metadata['next_update'] = parsed.next_update
+    return metadata
+
+
+def get_invalidation_key(serial):
+    return 'crl_invalidated_%s' % serial
+
+
+def invalidate_crls(sender, cert, **kwargs):
+    """Signal handler marking all CRLs of the certificate authority of ``cert`` as outdated.
+
+    This function is connected to :py:data:`~django_ca.signals.revoked_cert`.
+    :py:class:`~django_ca.views.CertificateRevocationListView` regenerates CRLs created before
+    this time on the next request.
+    """
+    cache.set(get_invalidation_key(cert.ca.serial), time.time(), None)
+
+
+def get_invalidation_time(serial):
+    """Get the timestamp of the last revocation of a certificate of the given CA, or ``None``."""
+
+    return cache.get(get_invalidation_key(serial))
@@ -13,13 +13,33 @@
 # You should have received a copy of the GNU General Public License along with django-ca.  If not,
 # see <http://www.gnu.org/licenses/>.
 
+import multiprocessing
+import os
+
+from OpenSSL import crypto
+
 from django.core.management.base import CommandError
 
+from django_ca.crl import can_stream_crl
+from django_ca.crl import get_base_crl
 from django_ca.crl import get_crl
+from django_ca.crl import get_crl_path
+from django_ca.crl import get_crl_tasks
+from django_ca.crl import get_delta_crl
+from django_ca.crl import open_atomic
+from django_ca.crl import stream_crl
+from django_ca.crl import write_crl_files
 from django_ca.management.base import BaseCommand
+from django_ca.models import CertificateAuthority
+from django_ca.signing import get_hash_algorithm
 from django.utils.encoding import force_bytes
 
 
+def _sign(task):
+    path, func, args, kwargs = task
+    return path, func(*args, **kwargs)
+
+
 class Command(BaseCommand):
     help = "Write the certificate revocation list (CRL)."
     binary_output = True
@@ -28,22 +48,77 @@ class Command(BaseCommand):
         parser.add_argument(
             '-e', '--expires', type=int, default=86400, metavar='SECONDS',
             help="Seconds until a new CRL will be available (default: %(default)s).")
-        parser.add_argument('--digest', default='sha512',
-                            help="The name of the message digest to use (default: %(default)s).")
+        parser.add_argument(
+            '--digest', action='append',
+            help="The name of the message digest to use (default: sha512). With --all, this "
+                 "option may be given multiple times.")
         parser.add_argument('path', nargs='?', default='-',
                             help='Path for the output file. Use "-" for stdout.')
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--base', default=False, action='store_true',
+                           help="Write a complete CRL with a CRL number that delta CRLs refer to.")
+        group.add_argument('--delta', default=False, action='store_true',
+                           help="Write a delta CRL for the last base CRL.")
+        parser.add_argument(
+            '--all', default=False, action='store_true',
+            help="Write CRLs of all enabled certificate authorities in DER and PEM format to "
+                 "the directory given as path, using the same layout as CA_CRL_DIR.")
+        parser.add_argument(
+            '--processes', type=int, default=multiprocessing.cpu_count(), metavar='NUM',
+            help="With --all, number of processes used for signing CRLs (default: %(default)s).")
+        parser.add_argument(
+            '--stream', default=False, action='store_true',
+            help="Encode a complete DER CRL while reading revoked certificates from the database "
+                 "and write it to path, so that memory usage is bounded. This ignores "
+                 "CA_CRL_BACKEND and CA_SIGNING_PROCESSES.")
         self.add_format(parser)
         self.add_ca(parser)
         super(Command, self).add_arguments(parser)
 
     def handle(self, path, **options):
+        digests = options['digest'] or ['sha512']
+        for digest in digests:
+            try:
+                get_hash_algorithm(digest)
+            except ValueError as e:
+                raise CommandError(e)
+
+        if options['stream'] is True and (
+                options['all'] or options['base'] or options['delta'] or path == '-'
+                or options['format'] != crypto.FILETYPE_ASN1):
+            raise CommandError('--stream requires DER format and a path, and can not be used with '
+                               '--all, --base or --delta.')
+
+        if options['all'] is True:
+            scope = 'base' if options['base'] else 'delta' if options['delta'] else None
+            return self.handle_all(path, scope, digests, **options)
+        if len(digests) > 1:
+            raise CommandError('--digest may only be given once without --all.')
+
         kwargs = {
             'type': options['format'],
             'expires': options['expires'],
-            'digest': force_bytes(options['digest']),
+            'digest': force_bytes(digests[0]),
         }
 
-        crl = get_crl(ca=options['ca'], **kwargs)
+        if options['stream'] is True and can_stream_crl(options['ca'], kwargs['digest']):
+            try:
+                with open_atomic(path) as stream:
+                    stream_crl(options['ca'], stream, expires=options['expires'],
+                               digest=kwargs['digest'])
+            except (IOError, OSError) as e:
+                raise CommandError(e)
+            return
+
+        if options['base'] is True:
+            crl = get_base_crl(options['ca'], **kwargs)
+        elif options['delta'] is True:
+            try:
+                crl = get_delta_crl(options['ca'], **kwargs)
+            except ValueError as e:
+                raise CommandError(e)
+        else:
+            crl = get_crl(ca=options['ca'], **kwargs)
 
         if path == '-':
             self.stdout.write(crl, ending=b'')
@@ -55,3 +130,35 @@ class Command(BaseCommand):
                     stream.write(crl)
             except IOError as e:
                 raise CommandError(e)
+
+    def handle_all(self, path, scope, digests, **options):
+        if not os.path.isdir(path):
+            raise CommandError('%s: Not a directory.' % path)
+
+        # Revoked certificates are loaded here, so that the processes only sign CRLs
+        tasks = []
+        for ca in CertificateAuthority.objects.enabled():
+            try:
+                ca_tasks = get_crl_tasks(ca, digests, scope=scope, expires=options['expires'])
+            except ValueError as e:  # delta CRL requested, but there is no base CRL yet
+                self.stderr.write(force_bytes(e))
+                continue
+            tasks += [(get_crl_path(path, ca.serial, scope, digest), func, args, kwargs)
+                      for digest, func, args, kwargs in ca_tasks]
+
+        processes = min(options['processes'], len(tasks))
+        if processes > 1:
+            pool = multiprocessing.Pool(processes)
+            crls = pool.imap_unordered(_sign, tasks)
+        else:
+            pool = None
+            crls = (_sign(task) for task in tasks)
+
+        try:
+            for crl_path, crl in crls:
+                write_crl_files(crl_path, crl)
+                if options['verbosity'] > 1:
+                    self.stdout.write(force_bytes('Wrote %s.der' % crl_path))
+        finally:
+            if pool is not None:
+                pool.terminate()
@@ -13,24 +13,83 @@
 # You should have received a copy of the GNU General Public License along with django-ca.  If not,
 # see <http://www.gnu.org/licenses/>.
 
+import filecmp
+import os
+import tempfile
+import time
+
+from django.core.management.base import CommandError
+
+from ...ocsp import OCSPIndex
 from ...ocsp import get_index
 from ..base import BaseCommand
 
 
 class Command(BaseCommand):
-    help = "Write an OCSP index file."
+    help = """Write an OCSP index file. Files are replaced atomically and only if the index has
+        changed."""
 
     def add_arguments(self, parser):
         self.add_ca(parser, allow_disabled=True)
         parser.add_argument('path', type=str, default='-', nargs='?',
                             help="Where to write the index (default: stdout)")
+        parser.add_argument(
+            '--watch', default=False, action='store_true',
+            help="Keep running and update the index with certificates added or modified since "
+                 "the last update.")
+        parser.add_argument(
+            '--interval', type=int, default=60, metavar='SECONDS',
+            help="With --watch, check for changes every SECONDS seconds (default: %(default)s).")
 
     def handle(self, ca, path, **options):
         if path == '-':
+            if options['watch'] is True:
+                raise CommandError('--watch requires a path.')
+
+            # Write chunks of lines, writing every line separately is slow for large CAs
+            lines = []
             for line in get_index(ca):
-                self.stdout.write(line)
+                lines.append(line)
+                if len(lines) >= 1000:
+                    self.stdout.write(''.join(lines), ending='')
+                    lines = []
+            if lines:
+                self.stdout.write(''.join(lines), ending='')
+        elif options['watch'] is True:
+            index = OCSPIndex(ca)
+            while True:
+                if index.update():
+                    self.write(path, index.get_lines(), options['verbosity'])
+                time.sleep(options['interval'])
         else:
-            with open(path, 'w') as stream:
-                for line in get_index(ca):
-                    stream.write(line)
+            self.write(path, get_index(ca), options['verbosity'])
+
+    def write(self, path, lines, verbosity):
+        """Atomically replace ``path`` with the given lines, unless the content is unchanged."""
+
+        # Write to a temporary file in the same directory, so that it can be renamed atomically
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                            prefix='.%s.' % os.path.basename(path))
+        except (IOError, OSError) as e:
+            raise CommandError(e)
+
+        try:
+            with os.fdopen(fd, 'w', 1024 * 1024) as stream:
+                stream.writelines(lines)
+                stream.flush()
+                os.fsync(stream.fileno())
+
+            if os.path.exists(path) and filecmp.cmp(tmp_path, path, shallow=False):
+                os.remove(tmp_path)
+                return
+
+            os.chmod(tmp_path, 0o644)
+            os.rename(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
 
+        if verbosity > 1:
+            self.stdout.write('Updated %s.' % path)
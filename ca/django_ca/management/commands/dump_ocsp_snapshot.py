@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+
+from django.core.management.base import CommandError
+
+from ...ocsp import RevocationSnapshot
+from ..base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = """Write a binary snapshot of the status of all certificates for OCSP responders that
+        do not use the database. The file is replaced atomically."""
+
+    def add_arguments(self, parser):
+        self.add_ca(parser, allow_disabled=True)
+        parser.add_argument('path', help="Where to write the snapshot.")
+
+    def handle(self, ca, path, **options):
+        # Write to a temporary file in the same directory, so that it can be renamed atomically
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                            prefix='.%s.' % os.path.basename(path))
+        except (IOError, OSError) as e:
+            raise CommandError(e)
+
+        try:
+            with os.fdopen(fd, 'wb') as stream:
+                RevocationSnapshot.write(ca, stream)
+                stream.flush()
+                os.fsync(stream.fileno())
+            os.chmod(tmp_path, 0o644)
+            os.rename(tmp_path, path)
+        except ValueError as e:
+            os.remove(tmp_path)
+            raise CommandError(e)
+        except Exception:
+            os.remove(tmp_path)
+            raise
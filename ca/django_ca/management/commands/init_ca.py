@@ -24,12 +24,11 @@ from getpass import getpass
 
 from django.core.management.base import CommandError
 
-from OpenSSL import crypto
-
 from django_ca import ca_settings
 from django_ca.models import CertificateAuthority
 from django_ca.management.base import BaseCommand
 from django_ca.management.base import KeySizeAction
+from django_ca.utils import ECC_CURVES
 from ..base import CertificateAuthorityDetailMixin
 
 
@@ -39,15 +38,16 @@ class Command(BaseCommand, CertificateAuthorityDetailMixin):
     def add_arguments(self, parser):
         self.add_algorithm(parser)
 
-        type_choices = [t[5:] for t in dir(crypto) if t.startswith('TYPE_')]
-        type_default = 'RSA' if 'RSA' in type_choices else type_choices[0]
         parser.add_argument(
-            '--key-type', choices=type_choices, default=type_default,
+            '--key-type', choices=['RSA', 'DSA', 'EC'], default='RSA',
             help="Key type for the CA private key (default: %(default)s).")
         parser.add_argument(
             '--key-size', type=int, action=KeySizeAction, default=4096,
             metavar='{2048,4096,8192,...}',
-            help="Size of the key to generate (default: %(default)s).")
+            help="Size of the key to generate (default: %(default)s, ignored for EC keys).")
+        parser.add_argument(
+            '--ecc-curve', choices=sorted(ECC_CURVES), default='P-256',
+            help="Elliptic curve used for EC keys (default: %(default)s).")
 
         parser.add_argument(
             '--expires', metavar='DAYS', type=int, default=365 * 10,
@@ -92,6 +92,7 @@ class Command(BaseCommand, CertificateAuthorityDetailMixin):
         try:
             CertificateAuthority.objects.init(
                 key_size=options['key_size'], key_type=options['key_type'],
+                ecc_curve=options['ecc_curve'],
                 algorithm=options['algorithm'],
                 expires=options['expires'],
                 parent=options['parent'],
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+import binascii
+import multiprocessing
+import os
+import tempfile
+import time
+
+from datetime import datetime
+from datetime import timedelta
+
+from oscrypto.asymmetric import load_certificate
+from oscrypto.asymmetric import load_private_key
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import CommandError
+from django.utils import timezone
+
+from ...models import Certificate
+from ...ocsp import get_cert_id
+from ...ocsp import get_responder_context
+from ...ocsp import get_single_response
+from ...ocsp import sign_ocsp_response
+from ...utils import get_ocsp_cache_key
+from ...views import OCSPView
+from ..base import BaseCommand
+
+# Keys and certificates loaded in the signing processes
+_signer = None
+
+
+def _init_signer(responder_key, responder_cert, ca_cert):
+    global _signer
+    _signer = (load_private_key(responder_key), load_certificate(responder_cert),
+               load_certificate(ca_cert))
+
+
+def _sign(args):
+    serial, status, revoked_date, this_update, next_update = args
+    responder_key, responder_cert, ca_cert = _signer
+
+    cert_id = get_cert_id(ca_cert.asn1, serial)
+    single = get_single_response(cert_id, status, revoked_date, this_update=this_update,
+                                 next_update=next_update, issuer=ca_cert.asn1)
+    response = sign_ocsp_response([single], responder_key, responder_cert,
+                                  produced_at=this_update)
+    return serial, status, binascii.hexlify(cert_id.dump()).decode('utf-8'), response.dump()
+
+
+class Command(BaseCommand):
+    help = """Pre-generate OCSP responses for all certificates of a certificate authority.
+        Responses are stored in the cache, where OCSPView finds them, or written to a
+        directory."""
+
+    def add_arguments(self, parser):
+        self.add_ca(parser)
+        parser.add_argument('--responder-key', metavar='PATH', required=True,
+                            help="Private key used for signing OCSP responses.")
+        parser.add_argument('--responder-cert', metavar='SERIAL|PATH', required=True,
+                            help="Serial or path of the certificate used for signing responses.")
+        parser.add_argument(
+            '-e', '--expires', type=int, default=OCSPView.expires, metavar='SECONDS',
+            help="Seconds that the responses remain valid. Must match the expires parameter of "
+                 "the OCSP view, otherwise it does not find the responses (default: "
+                 "%(default)s).")
+        parser.add_argument(
+            '--refresh', type=float, default=0.5, metavar='FRACTION',
+            help="Regenerate responses after this fraction of their validity has passed "
+                 "(default: %(default)s).")
+        parser.add_argument(
+            '--processes', type=int, default=multiprocessing.cpu_count(), metavar='NUM',
+            help="Number of processes used for signing responses (default: %(default)s).")
+        parser.add_argument(
+            '--path', metavar='DIR',
+            help="Write responses to files in DIR named by the hex-encoded CertID instead of "
+                 "storing them in the cache.")
+        parser.add_argument(
+            '--worker', default=False, action='store_true',
+            help="Keep running and regenerate responses when they are due or a certificate "
+                 "changes.")
+        parser.add_argument(
+            '--interval', type=int, default=60, metavar='SECONDS',
+            help="In worker mode, check for due responses every SECONDS seconds "
+                 "(default: %(default)s).")
+
+    def handle(self, ca, **options):
+        if not 0 < options['refresh'] <= 1:
+            raise CommandError('%s: --refresh must be between 0 and 1.' % options['refresh'])
+        if options['path'] is not None and not os.path.isdir(options['path']):
+            raise CommandError('%s: Not a directory.' % options['path'])
+
+        try:
+            context = get_responder_context(ca.serial, options['responder_key'],
+                                            options['responder_cert'])
+        except ImproperlyConfigured as e:
+            raise CommandError(e)
+
+        self.ca = ca
+        self.responder_serial = context.responder_cert.asn1.serial_number
+        self.path = options['path']
+        self.verbosity = options['verbosity']
+        self.expires = options['expires']
+        self.refresh_after = options['expires'] * options['refresh']
+        self.scheduled = {}  # serial -> (status, revoked_date, expires, due)
+        self.stagger = {}  # serial -> seconds until the second regeneration
+        self.last_modified = None
+
+        signer_args = (context.responder_key.asn1.dump(), context.responder_cert.asn1.dump(),
+                       context.ca_cert.asn1.dump())
+        if options['processes'] > 1:
+            self.pool = multiprocessing.Pool(options['processes'], initializer=_init_signer,
+                                             initargs=signer_args)
+        else:
+            self.pool = None
+            _init_signer(*signer_args)
+
+        try:
+            self.run_pass()
+            while options['worker'] is True:
+                time.sleep(options['interval'])
+                self.run_pass()
+        finally:
+            if self.pool is not None:
+                self.pool.terminate()
+
+    def update_schedule(self):
+        """Update the schedule from certificates added or modified since the last pass.
+
+        Responses for new or changed certificates are due immediately. On the first pass, the
+        second regeneration is spread evenly over the refresh interval, so that responses are not
+        all regenerated at the same time from then on.
+        """
+        qs = Certificate.objects.filter(ca=self.ca, expires__gt=timezone.now())
+        first_pass = self.last_modified is None
+        if not first_pass:
+            qs = qs.filter(created__gte=self.last_modified - timedelta(seconds=60))
+
+        # Rows are streamed from the database, so they are counted separately for the stagger
+        count = qs.count() if first_pass else 0
+        rows = qs.values_list('serial', 'revoked', 'revoked_date', 'revoked_reason', 'expires',
+                              'created').iterator()
+        for i, (serial, revoked, revoked_date, reason, expires, created) in enumerate(rows):
+            status = Certificate.get_ocsp_status(revoked, reason)
+            scheduled = self.scheduled.get(serial)
+
+            if scheduled is None or scheduled[:3] != (status, revoked_date, expires):
+                self.scheduled[serial] = (status, revoked_date, expires, None)
+                if first_pass:
+                    # certificates added after counting are due at the end of the interval
+                    fraction = min(float(i + 1) / max(count, 1), 1)
+                    self.stagger[serial] = self.refresh_after * fraction
+
+            if self.last_modified is None or created > self.last_modified:
+                self.last_modified = created
+
+    def run_pass(self):
+        """Generate all responses that are due."""
+
+        self.update_schedule()
+
+        # remove expired certificates
+        now = timezone.now()
+        for serial in [s for s, v in self.scheduled.items() if v[2] <= now]:
+            del self.scheduled[serial]
+
+        this_update = datetime.utcnow().replace(microsecond=0)
+        next_update = this_update + timedelta(seconds=self.expires)
+        timestamp = time.time()
+        tasks = [(serial, status, revoked_date, this_update, next_update)
+                 for serial, (status, revoked_date, expires, due) in self.scheduled.items()
+                 if due is None or due <= timestamp]
+
+        if self.pool is None:
+            responses = (_sign(task) for task in tasks)
+        else:
+            responses = self.pool.imap_unordered(_sign, tasks, chunksize=100)
+
+        for serial, status, cert_id, response in responses:
+            status, revoked_date, expires, due = self.scheduled[serial]
+            self.store(serial, status, revoked_date, cert_id, response)
+
+            due = timestamp + self.stagger.pop(serial, self.refresh_after)
+            self.scheduled[serial] = (status, revoked_date, expires, due)
+
+        if self.verbosity > 1:
+            self.stdout.write('Generated %s OCSP responses.' % len(tasks))
+
+    def store(self, serial, status, revoked_date, cert_id, response):
+        if self.path is None:
+            timeout = self.expires - OCSPView.cache_margin
+            cache_key = get_ocsp_cache_key(self.ca.serial, serial, status, revoked_date,
+                                           self.responder_serial, self.expires)
+            cache.set(cache_key, response, timeout)
+        else:
+            path = os.path.join(self.path, '%s.der' % cert_id)
+
+            # Unique temporary files, so that concurrent workers don't write to the same file
+            fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.%s.' % cert_id)
+            try:
+                with os.fdopen(fd, 'wb') as stream:
+                    stream.write(response)
+                os.chmod(tmp_path, 0o644)
+                os.rename(tmp_path, path)
+            except Exception:
+                os.remove(tmp_path)
+                raise
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+import multiprocessing
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import CommandError
+
+from ..base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = """Run a standalone HTTP server for OCSP responses and CRLs. The server provides the
+        same URLs as django_ca.urls and requires Python 3.4 or later."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1',
+                            help="Address to listen on (default: %(default)s).")
+        parser.add_argument('--port', type=int, default=8080,
+                            help="Port to listen on (default: %(default)s).")
+        parser.add_argument('--prefix', default='/django_ca/',
+                            help="Path prefix of all URLs (default: %(default)s).")
+        parser.add_argument(
+            '--threads', type=int, default=multiprocessing.cpu_count() * 5, metavar='NUM',
+            help="Threads used for database lookups and signing (default: %(default)s).")
+        parser.add_argument(
+            '--reuse-port', default=False, action='store_true',
+            help="Set SO_REUSEPORT, so that multiple processes can listen on the same port.")
+
+    def handle(self, **options):
+        try:
+            import asyncio
+        except ImportError:  # pragma: no cover
+            raise CommandError('This command requires Python 3.4 or later.')
+        from ...server import Responder
+        from ...server import create_server
+
+        try:
+            responder = Responder(prefix=options['prefix'])
+        except ImproperlyConfigured as e:
+            raise CommandError(e)
+
+        kwargs = {}
+        if options['reuse_port'] is True:
+            kwargs['reuse_port'] = True
+
+        loop = asyncio.get_event_loop()
+        server = loop.run_until_complete(create_server(
+            responder, options['host'], options['port'], threads=options['threads'], loop=loop,
+            **kwargs))
+        self.stdout.write('Listening on http://%s:%s%s' % (options['host'], options['port'],
+                                                            options['prefix']))
+
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
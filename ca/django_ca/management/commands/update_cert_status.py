@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+from django.core.management.base import BaseCommand
+
+from django_ca.models import Certificate
+
+
+class Command(BaseCommand):
+    help = "Mark expired certificates as expired, run this command e.g. once a day."
+
+    def handle(self, *args, **options):
+        count = Certificate.objects.update_status()
+        if options['verbosity'] > 1:
+            self.stdout.write('Marked %s certificate(s) as expired.' % count)
@@ -22,8 +22,12 @@ from django.db import models
 from django.utils.encoding import force_bytes
 
 from . import ca_settings
+from .utils import ECC_CURVES
 from .utils import SAN_OPTIONS_RE
+from .utils import generate_private_key
 from .utils import get_basic_cert
+from .utils import get_crl_shard
+from .utils import get_crl_shard_urls
 from .utils import sort_subject_dict
 from .utils import get_subjectAltName
 from .utils import is_power2
@@ -31,19 +35,26 @@ from .utils import is_power2
 
 class CertificateAuthorityManager(models.Manager):
     def init(self, name, key_size, key_type, algorithm, expires, parent, pathlen, subject,
-             issuer_url=None, issuer_alt_name=None, crl_url=None, ocsp_url=None, password=None):
-        """Create a Certificate Authority."""
+             issuer_url=None, issuer_alt_name=None, crl_url=None, ocsp_url=None, password=None,
+             ecc_curve='P-256'):
+        """Create a Certificate Authority.
+
+        ``key_type`` is either ``"RSA"``, ``"DSA"`` or ``"EC"``. For EC keys, ``key_size`` is
+        ignored and the curve is given by ``ecc_curve`` (``"P-256"`` or ``"P-384"``).
+        """
 
         # NOTE: This is already verified by KeySizeAction, so none of these checks should ever be
         #       True in the real world. None the less they are here as a safety precaution.
-        if not is_power2(key_size):
+        if key_type == 'EC':
+            if ecc_curve not in ECC_CURVES:
+                raise RuntimeError("%s: Unknown elliptic curve." % ecc_curve)
+        elif not is_power2(key_size):
             raise RuntimeError("%s: Key size must be a power of two." % key_size)
         elif key_size < ca_settings.CA_MIN_KEY_SIZE:
             raise RuntimeError("%s: Key size must be least %s bits."
                                % (key_size, ca_settings.CA_MIN_KEY_SIZE))
 
-        private_key = crypto.PKey()
-        private_key.generate_key(getattr(crypto, 'TYPE_%s' % key_type), key_size)
+        private_key = generate_private_key(key_type, key_size, ecc_curve)
 
         # set basic properties
         cert = get_basic_cert(expires)
@@ -195,11 +206,18 @@ class CertificateManager(models.Manager):
         if subjectAltName:
             extensions.append(crypto.X509Extension(b'subjectAltName', 0, subjectAltName))
 
-        # Set CRL distribution points:
+        # Set CRL distribution points, URLs of CRL shards point to the shard of this certificate.
+        # Clients usually only use the first distribution point, so shards are listed first.
         if ca.crl_url:
-            crl_urls = [url.strip() for url in ca.crl_url.split()]
-            value = force_bytes(','.join(['URI:%s' % uri for uri in crl_urls]))
-            extensions.append(crypto.X509Extension(b'crlDistributionPoints', 0, value))
+            crl_urls = []
+            shards = ca_settings.CA_CRL_SHARDS
+            if shards:
+                crl_urls += get_crl_shard_urls(ca.crl_url, shards,
+                                               get_crl_shard(cert.get_serial_number(), shards))
+            crl_urls += [url.strip() for url in ca.crl_url.split() if '{shard}' not in url]
+            if crl_urls:
+                value = force_bytes(','.join(['URI:%s' % uri for uri in crl_urls]))
+                extensions.append(crypto.X509Extension(b'crlDistributionPoints', 0, value))
 
         # Add issuerAltName
         if ca.issuer_alt_name:
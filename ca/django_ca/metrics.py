@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+"""Metrics for OCSP responders and CRLs in the Prometheus text format.
+
+Metrics are collected in memory of the current process, so every process of a WSGI server reports
+its own values.
+"""
+
+import threading
+import time
+
+from contextlib import contextmanager
+
+from .signing import get_signing_pool
+
+
+def _format_labels(labelnames, values, extra=()):
+    labels = list(zip(labelnames, values)) + list(extra)
+    if not labels:
+        return ''
+
+    labels = ['%s="%s"' % (k, str(v).replace('\\', r'\\').replace('"', r'\"')) for k, v in labels]
+    return '{%s}' % ','.join(labels)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric(object):
+    """Base class for metrics.
+
+    Parameters
+    ----------
+
+    name : str
+        Name of the metric.
+    documentation : str
+        Help text of the metric.
+    labelnames : tuple, optional
+        Names of the labels of this metric. Values are passed as keyword arguments when updating
+        the metric.
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def get_key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError('%s: Invalid labels: %s' % (self.name, ', '.join(sorted(labels))))
+        return tuple(labels[name] for name in self.labelnames)
+
+    def get_samples(self):
+        """Get a list of tuples of name suffix, label values, extra labels and value."""
+
+        with self._lock:
+            return [('', key, (), value) for key, value in sorted(self.values.items())]
+
+    def render(self):
+        lines = [
+            '# HELP %s %s' % (self.name, self.documentation),
+            '# TYPE %s %s' % (self.name, self.type),
+        ]
+        for suffix, key, extra, value in self.get_samples():
+            lines.append('%s%s%s %s' % (self.name, suffix,
+                                        _format_labels(self.labelnames, key, extra),
+                                        _format_value(value)))
+        return lines
+
+
+class Counter(Metric):
+    """A value that only increases."""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.get_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that may go up and down."""
+
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self.get_key(labels)
+        with self._lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    """Count observed values (e.g. durations) in buckets.
+
+    ``buckets`` is a list of upper bounds of the buckets, a bucket for ``+Inf`` is added
+    automatically.
+    """
+
+    type = 'histogram'
+    default_buckets = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=None):
+        super(Histogram, self).__init__(name, documentation, labelnames=labelnames)
+        self.buckets = tuple(buckets or self.default_buckets) + (float('inf'), )
+
+    def observe(self, value, **labels):
+        key = self.get_key(labels)
+        with self._lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Context manager observing the time spent in the block."""
+
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - start, **labels)
+
+    def get_samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    samples.append(('_bucket', key, [('le', _format_value(bound))], count))
+                samples.append(('_sum', key, (), total))
+                samples.append(('_count', key, (), counts[-1]))
+        return samples
+
+
+class Registry(object):
+    """A collection of metrics."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Get all metrics in the Prometheus text format."""
+
+        lines = []
+        for metric in self.metrics + self.get_signing_pool_metrics():
+            lines += metric.render()
+        return '%s\n' % '\n'.join(lines)
+
+    def get_signing_pool_metrics(self):
+        """Get metrics for the statistics of the signing pool, if it was already created."""
+
+        pool = get_signing_pool(create=False)
+        if pool is None:
+            return []
+
+        metrics = []
+        stats = pool.get_stats()
+        for key, metric_cls, name, documentation in [
+                ('processes', Gauge, 'processes', 'Number of signing processes.'),
+                ('max_pending', Gauge, 'max_pending', 'Maximum number of pending requests.'),
+                ('pending', Gauge, 'pending', 'Number of pending signing requests.'),
+                ('submitted', Counter, 'submitted_total', 'Signing requests submitted.'),
+                ('rejected', Counter, 'rejected_total', 'Signing requests rejected.'),
+                ('failed', Counter, 'failed_total', 'Signing requests that failed.'),
+                ('seconds', Counter, 'seconds_total', 'Time spent waiting for signatures.'),
+        ]:
+            metric = metric_cls('django_ca_signing_pool_%s' % name, documentation)
+            metric.values[()] = stats[key]
+            metrics.append(metric)
+        return metrics
+
+
+registry = Registry()
+
+OCSP_PHASE_SECONDS = registry.register(Histogram(
+    'django_ca_ocsp_phase_seconds',
+    'Time spent in the phases (parse, key_load, db, sign) of OCSP requests.', ['phase']))
+OCSP_RESPONSES = registry.register(Counter(
+    'django_ca_ocsp_responses_total',
+    'OCSP responses by certificate status (good, revoked) or response status.', ['status']))
+CRL_CACHE = registry.register(Counter(
+    'django_ca_crl_cache_total', 'CRL cache lookups by result (hit, miss, stale).', ['result']))
+CRL_GENERATION_SECONDS = registry.register(Histogram(
+    'django_ca_crl_generation_seconds', 'Time spent generating CRLs.'))
+CRL_SIZE_BYTES = registry.register(Gauge(
+    'django_ca_crl_size_bytes', 'Size of the last generated CRL of a certificate authority.',
+    ['ca']))
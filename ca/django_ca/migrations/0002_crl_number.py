@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-17 08:48
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_ca', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificateauthority',
+            name='crl_base_date',
+            field=models.DateTimeField(blank=True, help_text='When the last base CRL was generated.', null=True),
+        ),
+        migrations.AddField(
+            model_name='certificateauthority',
+            name='crl_base_number',
+            field=models.PositiveIntegerField(blank=True, help_text='The CRL number of the last base CRL.', null=True),
+        ),
+        migrations.AddField(
+            model_name='certificateauthority',
+            name='crl_number',
+            field=models.PositiveIntegerField(default=0, help_text='The CRL number of the last numbered CRL.'),
+        ),
+    ]
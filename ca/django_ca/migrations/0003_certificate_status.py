@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-17 09:11
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def set_status(apps, schema_editor):
+    Certificate = apps.get_model('django_ca', 'Certificate')
+    Certificate.objects.filter(revoked=True).update(status='revoked')
+    Certificate.objects.filter(revoked=False, expires__lte=timezone.now()).update(status='expired')
+
+
+# Partial index for CRLs, covering all columns read from revoked certificates. Only PostgreSQL
+# considers partial indexes for queries with bound parameters, as used by Django.
+REVOKED_INDEX = 'django_ca_certificate_revoked'
+
+
+def create_revoked_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX %s ON django_ca_certificate "
+            "(ca_id, expires, serial, revoked_reason, revoked_date) "
+            "WHERE revoked" % REVOKED_INDEX)
+
+
+def drop_revoked_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX %s' % REVOKED_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_ca', '0002_crl_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificate',
+            name='status',
+            field=models.CharField(choices=[('valid', 'Valid'), ('expired', 'Expired'), ('revoked', 'Revoked')], default='valid', editable=False, max_length=8),
+        ),
+        migrations.RunPython(set_status, migrations.RunPython.noop),
+        migrations.AlterIndexTogether(
+            name='certificate',
+            index_together=set([('status', 'expires'), ('ca', 'revoked', 'expires')]),
+        ),
+        migrations.RunPython(create_revoked_index, drop_revoked_index),
+    ]
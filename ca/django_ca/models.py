@@ -29,6 +29,7 @@ from .managers import CertificateAuthorityManager
 from .managers import CertificateManager
 from .querysets import CertificateAuthorityQuerySet
 from .querysets import CertificateQuerySet
+from .signals import revoked_cert
 from .utils import format_date
 from .utils import format_subject
 from .utils import multiline_url_validator
@@ -202,6 +203,14 @@ class CertificateAuthority(X509CertMixin):
     issuer_alt_name = models.URLField(blank=True, null=True, verbose_name=_('issuerAltName'),
                                       help_text=_("URL for your CA."))
 
+    # CRL numbers used by base and delta CRLs
+    crl_number = models.PositiveIntegerField(
+        default=0, help_text=_("The CRL number of the last numbered CRL."))
+    crl_base_number = models.PositiveIntegerField(
+        null=True, blank=True, help_text=_("The CRL number of the last base CRL."))
+    crl_base_date = models.DateTimeField(
+        null=True, blank=True, help_text=_("When the last base CRL was generated."))
+
     _key = None
 
     @property
@@ -256,6 +265,12 @@ class Certificate(X509CertMixin):
         'aACompromise': 'aa_compromise',
     }
 
+    STATUSES = (
+        ('valid', _('Valid')),
+        ('expired', _('Expired')),
+        ('revoked', _('Revoked')),
+    )
+
     watchers = models.ManyToManyField(Watcher, related_name='certificates', blank=True)
 
     ca = models.ForeignKey(CertificateAuthority, verbose_name=_('Certificate Authority'))
@@ -267,12 +282,40 @@ class Certificate(X509CertMixin):
         max_length=32, null=True, blank=True, verbose_name=_('Reason for revokation'),
         choices=REVOCATION_REASONS)
 
+    # Maintained by save() and CertificateQuerySet.update_status(), used by valid() and expired()
+    # of CertificateQuerySet so that they can use the indexes defined below. CRLs and OCSP always
+    # use the revoked flag.
+    status = models.CharField(max_length=8, choices=STATUSES, default='valid', editable=False)
+
+    class Meta:
+        index_together = [
+            ('ca', 'revoked', 'expires'),
+            ('status', 'expires'),
+        ]
+
+    def get_status(self):
+        """Get the current status of this certificate, see ``STATUSES``."""
+
+        if self.revoked:
+            return 'revoked'
+        if self.expires <= timezone.now():
+            return 'expired'
+        return 'valid'
+
+    def save(self, *args, **kwargs):
+        self.status = self.get_status()
+        super(Certificate, self).save(*args, **kwargs)
+
     def revoke(self, reason=None):
+        # NOTE: Pre-signed OCSP responses do not have to be evicted, since the cache key includes
+        #       the status and revocation date (see get_ocsp_cache_key()).
         self.revoked = True
         self.revoked_date = timezone.now()
         self.revoked_reason = reason
         self.save()
 
+        revoked_cert.send(sender=self.__class__, cert=self)
+
     def get_revocation(self):
         """Get a crypto.Revoked object or None if the cert is not revoked."""
 
@@ -287,13 +330,20 @@ class Certificate(X509CertMixin):
         r.set_rev_date(force_bytes(format_date(self.revoked_date)))
         return r
 
-    @property
-    def ocsp_status(self):
+    @classmethod
+    def get_ocsp_status(cls, revoked, revoked_reason):
+        """Get the OCSP status for the given values of the ``revoked`` and ``revoked_reason``
+        fields."""
+
         # NOTE: The OCSP status 'good' does not say if the certificate has expired.
-        if self.revoked is False:
+        if revoked is False:
             return 'good'
 
-        return self.OCSP_REASON_MAPPINGS.get(self.revoked_reason, 'revoked')
+        return cls.OCSP_REASON_MAPPINGS.get(revoked_reason, 'revoked')
+
+    @property
+    def ocsp_status(self):
+        return self.get_ocsp_status(self.revoked, self.revoked_reason)
 
     def __str__(self):
         return self.cn
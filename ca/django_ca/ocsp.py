@@ -13,35 +13,763 @@
 # You should have received a copy of the GNU General Public License along with django-ca.  If not,
 # see <http://www.gnu.org/licenses/>.
 
+import binascii
+import calendar
+import heapq
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from collections import OrderedDict
 from datetime import datetime
+from datetime import timedelta
+
+from asn1crypto import core
+from asn1crypto import ocsp as asn1_ocsp
+from asn1crypto import x509
+from oscrypto import asymmetric
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+
+from .models import Certificate
+from .models import CertificateAuthority
+from .utils import format_date
+
+log = logging.getLogger(__name__)
 
 # We need a two-letter year, otherwise OCSP doesn't work
 date_format = '%y%m%d%H%M%SZ'
 
 
+def _get_index_entry(expires, revoked, revoked_date, revoked_reason, cn):
+    revocation = ''
+    if revoked:
+        revocation = revoked_date.strftime(date_format)
+        if revoked_reason:
+            revocation += ',%s' % revoked_reason
+    return expires, revocation, '/CN=%s' % cn
+
+
+def _get_index_line(serial, entry, now):
+    expires, revocation, subject = entry
+    if expires < now:
+        status = 'E'
+        revocation = ''
+    elif revocation:
+        status = 'R'
+    else:
+        status = 'V'
+
+    # Format see: http://pki-tutorial.readthedocs.org/en/latest/cadb.html
+    return '%s\n' % '\t'.join([
+        status,
+        format_date(expires),
+        revocation,
+        serial,
+        'unknown',  # we don't save to any file
+        subject,
+    ])
+
+
 def get_index(ca):
+    """Generate the lines of an index file as used by ``openssl ocsp``.
+
+    The index is generated only from columns stored in the database without parsing any
+    certificates, so the distinguished name of certificates only contains the CommonName.
+    """
     now = datetime.utcnow()
 
     # Write index file (required by "openssl ocsp")
-    for cert in ca.certificate_set.all():
-        revocation = ''
-        if cert.expires < now:
-            status = 'E'
-        elif cert.revoked:
-            status = 'R'
-
-            revocation = cert.revoked_date.strftime(date_format)
-            if cert.revoked_reason:
-                revocation += ',%s' % cert.revoked_reason
+    qs = ca.certificate_set.values_list(
+        'serial', 'expires', 'revoked', 'revoked_date', 'revoked_reason', 'cn')
+    for row in qs.iterator():
+        yield _get_index_line(row[0].replace(':', ''), _get_index_entry(*row[1:]), now)
+
+
+class OCSPIndex(object):
+    """An index file as used by ``openssl ocsp`` that is maintained incrementally.
+
+    The first call to :py:meth:`update` loads all certificates of the certificate authority, any
+    later call only loads certificates added or modified since the last update (the high-water
+    mark), based on the ``created`` field that is updated whenever a certificate is saved.
+    """
+
+    overlap = 60
+    """Updates also load certificates modified this many seconds before the high-water mark, so
+    that transactions that commit late are not missed."""
+
+    def __init__(self, ca):
+        self.ca = ca
+        self.entries = OrderedDict()  # serial without colons -> (expires, revocation, subject)
+        self.last_modified = None
+        self.last_update = None
+
+    def update(self):
+        """Load certificates added or modified since the last update.
+
+        Returns ``True`` if the index file has changed since the last update, either because
+        certificates where added or modified or because certificates have expired in the meantime.
+        """
+        now = datetime.utcnow()
+        qs = Certificate.objects.filter(ca=self.ca)
+        if self.last_modified is not None:
+            qs = qs.filter(created__gte=self.last_modified - timedelta(seconds=self.overlap))
+
+        changed = self.last_update is None
+        fields = ('serial', 'expires', 'revoked', 'revoked_date', 'revoked_reason', 'cn',
+                  'created')
+        for row in qs.values_list(*fields).iterator():
+            serial = row[0].replace(':', '')
+            entry = _get_index_entry(*row[1:6])
+            if self.entries.get(serial) != entry:
+                self.entries[serial] = entry
+                changed = True
+
+            if self.last_modified is None or row[6] > self.last_modified:
+                self.last_modified = row[6]
+
+        if not changed:
+            changed = any(self.last_update <= e[0] < now for e in self.entries.values())
+        self.last_update = now
+        return changed
+
+    def get_lines(self):
+        """Generate the lines of the index file, as of the last update."""
+
+        for serial, entry in self.entries.items():
+            yield _get_index_line(serial, entry, self.last_update)
+
+
+def get_cert_status(status, revocation_date=None):
+    """Get the ``CertStatus`` for a single OCSP response.
+
+    Parameters
+    ----------
+
+    status : str
+        The OCSP status as returned by :py:attr:`~django_ca.models.Certificate.ocsp_status`, or
+        ``"unknown"``.
+    revocation_date : datetime, optional
+        When the certificate was revoked, required if the status is not ``"good"`` or
+        ``"unknown"``.
+    """
+    if status in ('good', 'unknown'):
+        return asn1_ocsp.CertStatus(name=status, value=core.Null())
+
+    return asn1_ocsp.CertStatus(name='revoked', value={
+        'revocation_time': revocation_date,
+        'revocation_reason': 'unspecified' if status == 'revoked' else status,
+    })
+
+
+def get_cert_id(ca_cert, serial, hash_algo='sha1'):
+    """Get the ``CertId`` identifying a certificate in OCSP requests and responses.
+
+    Parameters
+    ----------
+
+    ca_cert : :py:class:`asn1crypto.x509.Certificate`
+        The certificate of the certificate authority that issued the certificate.
+    serial : str
+        The serial of the certificate, as stored in the database.
+    hash_algo : str, optional
+        The hash algorithm used for the issuer name and key hashes, the default is ``"sha1"``.
+    """
+    return asn1_ocsp.CertId({
+        'hash_algorithm': {'algorithm': hash_algo},
+        'issuer_name_hash': getattr(ca_cert.subject, hash_algo),
+        'issuer_key_hash': getattr(ca_cert.public_key, hash_algo),
+        'serial_number': int(serial.replace(':', ''), 16),
+    })
+
+
+def is_issuer(ca_cert, cert_id):
+    """Check if the issuer name and key hashes of a ``CertId`` match a certificate authority.
+
+    The hashes are computed with the hash algorithm of the ``CertId``. ``CertId`` objects using
+    any other hash algorithm than SHA-1 or SHA-256 never match.
+
+    Parameters
+    ----------
+
+    ca_cert : :py:class:`asn1crypto.x509.Certificate`
+        The certificate of the certificate authority.
+    cert_id : :py:class:`asn1crypto.ocsp.CertId`
+        The ``CertId`` from an OCSP request.
+    """
+    hash_algo = cert_id['hash_algorithm']['algorithm'].native
+    if hash_algo not in ('sha1', 'sha256'):
+        return False
+    return cert_id['issuer_name_hash'].native == getattr(ca_cert.subject, hash_algo) \
+        and cert_id['issuer_key_hash'].native == getattr(ca_cert.public_key, hash_algo)
+
+
+def get_single_response(cert_id, status, revocation_date, this_update, next_update, issuer=None):
+    """Get a ``SingleResponse`` for the given ``CertId`` from an OCSP request.
+
+    The ``cert_id`` is echoed as-is, so responses use the same hash algorithm as the request.
+    If ``issuer`` (an :py:class:`asn1crypto.x509.Certificate`) is given, the ``certificate_issuer``
+    extension is added to the response.
+    """
+    extensions = None
+    if issuer is not None:
+        extensions = [{
+            'extn_id': 'certificate_issuer',
+            'critical': False,
+            'extn_value': [x509.GeneralName(name='directory_name', value=issuer.subject)],
+        }]
+
+    return {
+        'cert_id': cert_id,
+        'cert_status': get_cert_status(status, revocation_date),
+        'this_update': this_update,
+        'next_update': next_update,
+        'single_extensions': extensions,
+    }
+
+
+def sign_ocsp_response(responses, responder_key, responder_cert, nonce=None,
+                       hash_algo='sha256', produced_at=None, signing_pool=None,
+                       responder_key_path=None):
+    """Sign a list of single responses (see :py:func:`get_single_response`).
+
+    All single responses are signed with one signature, so this function can answer OCSP requests
+    for multiple certificates at once.
+
+    Parameters
+    ----------
+
+    responses : list
+        A list of single responses as returned by :py:func:`get_single_response`.
+    responder_key : :py:class:`oscrypto.asymmetric.PrivateKey`
+        The private key used for signing the response.
+    responder_cert : :py:class:`oscrypto.asymmetric.Certificate`
+        The certificate of the private key, included in the response.
+    nonce : bytes, optional
+        The nonce from the request, if any.
+    hash_algo : str, optional
+        The hash algorithm used for the signature, the default is ``"sha256"``.
+    produced_at : datetime, optional
+        When the response was produced, the default is now.
+    signing_pool : :py:class:`~django_ca.signing.SigningPool`, optional
+        If given, the response is signed in this pool with the key at ``responder_key_path``.
+    responder_key_path : str, optional
+        Path to ``responder_key``, required if ``signing_pool`` is given.
+
+    Returns
+    -------
+
+    :py:class:`asn1crypto.ocsp.OCSPResponse`
+    """
+    if produced_at is None:
+        produced_at = datetime.utcnow()
+
+    response_extensions = None
+    if nonce is not None:
+        response_extensions = [{'extn_id': 'nonce', 'critical': False, 'extn_value': nonce}]
+
+    response_data = asn1_ocsp.ResponseData({
+        'responder_id': asn1_ocsp.ResponderId(name='by_key',
+                                              value=responder_cert.asn1.public_key.sha1),
+        'produced_at': produced_at,
+        'responses': responses,
+        'response_extensions': response_extensions,
+    })
+
+    if signing_pool is not None:
+        signature = signing_pool.sign(responder_key_path, response_data.dump(), hash_algo)
+    else:
+        if responder_key.algorithm == 'rsa':
+            sign_func = asymmetric.rsa_pkcs1v15_sign
+        elif responder_key.algorithm == 'dsa':
+            sign_func = asymmetric.dsa_sign
         else:
-            status = 'V'
-
-        # Format see: http://pki-tutorial.readthedocs.org/en/latest/cadb.html
-        yield '%s\n' % '\t'.join([
-            status,
-            cert.x509.get_notAfter().decode('utf-8'),
-            revocation,
-            cert.serial.replace(':', ''),
-            'unknown',  # we don't save to any file
-            cert.distinguishedName(),
-        ])
+            sign_func = asymmetric.ecdsa_sign
+        signature = sign_func(responder_key, response_data.dump(), hash_algo)
+    signature_algo = 'ecdsa' if responder_key.algorithm == 'ec' else responder_key.algorithm
+
+    return asn1_ocsp.OCSPResponse({
+        'response_status': 'successful',
+        'response_bytes': {
+            'response_type': 'basic_ocsp_response',
+            'response': {
+                'tbs_response_data': response_data,
+                'signature_algorithm': {'algorithm': '%s_%s' % (hash_algo, signature_algo)},
+                'signature': signature,
+                'certs': [responder_cert.asn1],
+            },
+        },
+    })
+
+
+class OCSPResponderContext(object):
+    """Parsed keys and certificates used by an OCSP responder.
+
+    Instances are created by :py:func:`get_responder_context`, which loads the responder key,
+    responder certificate and certificate authority only once per process.
+
+    Attributes
+    ----------
+
+    ca : :py:class:`~django_ca.models.CertificateAuthority`
+        The certificate authority that this responder answers requests for. ``None`` if the
+        context was loaded from a :py:class:`RevocationSnapshot`.
+    ca_serial : str
+        The serial of the certificate authority.
+    ca_cert : :py:class:`oscrypto.asymmetric.Certificate`
+        The parsed certificate of the certificate authority.
+    responder_key : :py:class:`oscrypto.asymmetric.PrivateKey`
+        The parsed private key used for signing responses.
+    responder_cert : :py:class:`oscrypto.asymmetric.Certificate`
+        The parsed certificate of the responder.
+    responder_key_path : str
+        The path to the responder key.
+    key_mtime : float
+        Modification time of the responder key when it was loaded.
+    """
+
+    def __init__(self, ca, responder_key, responder_cert, snapshot=None):
+        self.responder_key_path = responder_key
+        try:
+            self.key_mtime = os.stat(responder_key).st_mtime
+            # mistakenly reported by coverage 4.0.3 as missed branch, fixed in 4.1:
+            # https://bitbucket.org/ned/coveragepy/issues/146/context-managers-confuse-branch-coverage#comment-24552176
+            with open(responder_key, 'rb') as stream:  # pragma: no branch
+                self.responder_key = asymmetric.load_private_key(stream.read())
+        except Exception:
+            raise ImproperlyConfigured('%s: Could not read private key.' % responder_key)
+
+        responder_pem = None
+        if snapshot is None:  # snapshots are used without any database access
+            responder_pem = Certificate.objects.filter(serial=responder_cert).values_list(
+                'pub', flat=True).first()
+            if responder_pem is None:
+                # A certificate authority may also sign OCSP responses itself
+                responder_pem = CertificateAuthority.objects.filter(
+                    serial=responder_cert).values_list('pub', flat=True).first()
+
+        if responder_pem is None:
+            try:
+                # mistakenly reported by coverage 4.0.3 as missed branch, fixed in 4.1:
+                # https://bitbucket.org/ned/coveragepy/issues/146/context-managers-confuse-branch-coverage#comment-24552176
+                with open(responder_cert, 'rb') as stream:  # pragma: no branch
+                    responder_pem = stream.read()
+            except Exception:
+                raise ImproperlyConfigured('%s: Could not read public key.' % responder_cert)
+        self.responder_cert = asymmetric.load_certificate(force_bytes(responder_pem))
+
+        if snapshot is not None:
+            self.ca = None
+            self.ca_serial = snapshot.ca_serial
+            self.ca_cert = asymmetric.load_certificate(snapshot.ca_cert)
+            return
+
+        try:
+            self.ca = CertificateAuthority.objects.get(serial=ca)
+        except CertificateAuthority.DoesNotExist:
+            raise ImproperlyConfigured('%s: Unknown certificate authority.' % ca)
+        self.ca_serial = self.ca.serial
+        self.ca_cert = asymmetric.load_certificate(force_bytes(self.ca.pub))
+
+
+_responder_contexts = {}
+
+
+def get_responder_context(ca, responder_key, responder_cert, snapshot=None):
+    """Get the :py:class:`OCSPResponderContext` for the given responder configuration.
+
+    The context is created on first use and shared by all views with the same configuration in
+    this process. It is reloaded if the modification time of the responder key changes, so
+    responder keys can be rotated without restarting the process.
+
+    Parameters
+    ----------
+
+    ca : str
+        Serial of the certificate authority.
+    responder_key : str
+        Absolute path to the private key used for signing responses.
+    responder_cert : str
+        Serial or absolute path of the certificate used for signing responses. The serial may also
+        be the serial of a certificate authority.
+    snapshot : :py:class:`RevocationSnapshot`, optional
+        If given, the certificate authority is loaded from the snapshot and the database is not
+        used. ``responder_cert`` must be a path in this case.
+
+    Raises
+    ------
+
+    ImproperlyConfigured
+        If the CA is not found or the responder key or certificate could not be loaded.
+    """
+    key = (ca, responder_key, responder_cert, snapshot is not None)
+    context = _responder_contexts.get(key)
+
+    if context is not None:
+        try:
+            mtime = os.stat(responder_key).st_mtime
+        except OSError:
+            mtime = None  # keep using the loaded key if it was removed
+        if mtime is None or mtime == context.key_mtime:
+            return context
+
+    context = OCSPResponderContext(ca, responder_key, responder_cert, snapshot=snapshot)
+    _responder_contexts[key] = context
+    return context
+
+
+class RevocationIndex(object):
+    """In-memory index of the OCSP status of all certificates of a certificate authority.
+
+    The index is loaded completely on the first refresh. Any later refresh only loads certificates
+    that were added or modified (e.g. revoked) since the last refresh, based on the
+    ``created`` field that is updated whenever a certificate is saved.
+
+    Use :py:func:`get_revocation_index` to get the index shared by all views in this process.
+    """
+
+    overlap = 60
+    """Refreshes also load certificates modified this many seconds before the last known
+    modification, so that transactions that commit late are not missed."""
+
+    # Shared value for all certificates that are not revoked, to keep the index small
+    _good = ('good', None)
+
+    def __init__(self, ca):
+        self.ca = ca
+        self.statuses = {}
+        self.last_modified = None
+        self.last_refresh = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Load certificates added or modified since the last refresh from the database."""
+
+        qs = Certificate.objects.filter(ca=self.ca)
+        if self.last_modified is not None:
+            qs = qs.filter(created__gte=self.last_modified - timedelta(seconds=self.overlap))
+
+        last_modified = self.last_modified
+        fields = ('serial', 'revoked', 'revoked_date', 'revoked_reason', 'created')
+        for serial, revoked, revoked_date, revoked_reason, created in \
+                qs.values_list(*fields).iterator():
+            if revoked is False:
+                self.statuses[serial] = self._good
+            else:
+                status = Certificate.get_ocsp_status(revoked, revoked_reason)
+                self.statuses[serial] = (status, revoked_date)
+
+            if last_modified is None or created > last_modified:
+                last_modified = created
+
+        self.last_modified = last_modified
+        self.last_refresh = time.time()
+
+    def get(self, serials, max_age):
+        """Get the status of the given serials.
+
+        The index is refreshed first if the last refresh is older than ``max_age`` seconds. If the
+        refresh fails (e.g. because the database is unavailable), the previously loaded statuses
+        are returned.
+
+        Returns
+        -------
+
+        dict
+            A dictionary mapping serials to a tuple of the OCSP status and the revocation date.
+            Serials not found in the index are not included.
+        """
+        if self.last_refresh is None or time.time() - self.last_refresh > max_age:
+            with self._lock:
+                # check again, another thread might have refreshed the index in the meantime
+                if self.last_refresh is None or time.time() - self.last_refresh > max_age:
+                    try:
+                        self.refresh()
+                    except DatabaseError as e:
+                        if self.last_refresh is None:
+                            raise
+                        log.warning('Could not refresh revocation index for %s: %s', self.ca, e)
+                        self.last_refresh = time.time()  # don't retry on every request
+
+        return {serial: self.statuses[serial] for serial in serials if serial in self.statuses}
+
+
+_revocation_indexes = {}
+
+
+def get_revocation_index(ca):
+    """Get the :py:class:`RevocationIndex` for the given certificate authority.
+
+    The index is shared by all views in this process.
+    """
+    index = _revocation_indexes.get(ca.serial)
+    if index is None:
+        index = _revocation_indexes[ca.serial] = RevocationIndex(ca)
+    return index
+
+
+class RevocationSnapshot(object):
+    """A memory-mapped, read-only snapshot of the OCSP status of all certificates of a CA.
+
+    Snapshots are written by :py:meth:`write` (or ``manage.py dump_ocsp_snapshot``) and contain the
+    serial, the CA certificate and one fixed-width record per certificate, sorted by serial. Since
+    the file is memory-mapped, all processes on a host share one copy in the page cache, and
+    lookups use a binary search without loading the file into memory.
+
+    The file starts with the header described by ``header``, followed by the serial of the CA, the
+    CA certificate (DER) and the records described by ``record``. Records consist of the serial as
+    a 20 byte big endian integer, the index of the status in ``statuses`` and the revocation date
+    as UNIX timestamp (``0`` if the certificate is not revoked).
+
+    Use :py:func:`get_revocation_snapshot` to get a snapshot shared by all views in this process.
+    """
+
+    magic = b'DJCAOCS1'
+    header = struct.Struct('>8sQqHH')  # magic, record count, generated, serial length, CA length
+    record = struct.Struct('>20sBq')  # serial, status, revocation date
+    statuses = (
+        'good', 'revoked', 'key_compromise', 'ca_compromise', 'affiliation_changed', 'superseded',
+        'cessation_of_operation', 'certificate_hold', 'remove_from_crl', 'privilege_withdrawn',
+        'aa_compromise',
+    )
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as stream:
+            stat = os.fstat(stream.fileno())
+            self.mtime = (stat.st_ino, stat.st_mtime)
+            self.mmap = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, self.count, self.generated, serial_length, ca_length = \
+                self.header.unpack_from(self.mmap)
+        except struct.error:
+            magic = None
+        if magic != self.magic:
+            raise ValueError('%s: Not a revocation snapshot.' % path)
+
+        offset = self.header.size
+        self.ca_serial = self.mmap[offset:offset + serial_length].decode('utf-8')
+        offset += serial_length
+        self.ca_cert = self.mmap[offset:offset + ca_length]
+        self.offset = offset + ca_length
+
+        if len(self.mmap) != self.offset + self.count * self.record.size:
+            raise ValueError('%s: Truncated revocation snapshot.' % path)
+
+    @classmethod
+    def write(cls, ca, stream, chunk_size=100000):
+        """Write a snapshot for the given certificate authority to a binary stream.
+
+        The database cannot sort serials numerically, so records are sorted in chunks of
+        ``chunk_size`` records that are written to a temporary file and then merged into
+        ``stream``. This way, memory usage does not grow with the number of certificates.
+
+        Raises ``ValueError`` if a serial does not fit into a record (RFC 5280 limits serials to
+        20 bytes).
+        """
+
+        qs = Certificate.objects.filter(ca=ca).values_list(
+            'serial', 'revoked', 'revoked_date', 'revoked_reason')
+
+        with tempfile.TemporaryFile() as runs:
+            offsets = []  # (offset, record count) of every sorted chunk in ``runs``
+            count = 0
+            chunk = []
+            for serial, revoked, revoked_date, revoked_reason in qs.iterator():
+                key = cls.get_key(serial)
+                if len(key) > 20:
+                    raise ValueError('%s: Serial is longer than 20 bytes.' % serial)
+
+                status = cls.statuses.index(Certificate.get_ocsp_status(revoked, revoked_reason))
+                if revoked_date is None:
+                    timestamp = 0
+                else:
+                    timestamp = calendar.timegm(revoked_date.utctimetuple())
+                chunk.append(cls.record.pack(key, status, timestamp))
+
+                if len(chunk) >= chunk_size:
+                    offsets.append(cls._write_run(runs, chunk))
+                    count += len(chunk)
+                    chunk = []
+            if chunk:
+                offsets.append(cls._write_run(runs, chunk))
+                count += len(chunk)
+
+            ca_serial = ca.serial.encode('utf-8')
+            ca_cert = asymmetric.load_certificate(force_bytes(ca.pub)).asn1.dump()
+            stream.write(cls.header.pack(cls.magic, count, int(time.time()), len(ca_serial),
+                                         len(ca_cert)))
+            stream.write(ca_serial)
+            stream.write(ca_cert)
+
+            for record in heapq.merge(*[cls._read_run(runs, offset, length)
+                                        for offset, length in offsets]):
+                stream.write(record)
+
+    @classmethod
+    def _write_run(cls, runs, chunk):
+        """Sort ``chunk`` and append it to ``runs``, returning its offset and length."""
+
+        chunk.sort()
+        runs.seek(0, os.SEEK_END)
+        offset = runs.tell()
+        runs.write(b''.join(chunk))
+        return offset, len(chunk)
+
+    @classmethod
+    def _read_run(cls, runs, offset, length, buffer_size=1000):
+        """Yield the records of a run written by :py:meth:`_write_run`."""
+
+        size = cls.record.size
+        while length > 0:
+            read = min(length, buffer_size)
+            runs.seek(offset)
+            data = runs.read(read * size)
+            for i in range(read):
+                yield data[i * size:(i + 1) * size]
+            offset += read * size
+            length -= read
+
+    @classmethod
+    def get_key(cls, serial):
+        """Get the key used in records for the serial as stored in the database."""
+
+        return binascii.unhexlify('%040x' % int(serial.replace(':', ''), 16))
+
+    def lookup(self, key):
+        """Binary search for the given key, returns a tuple of status and revocation date or
+        ``None`` if the serial is not found."""
+
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = self.offset + middle * self.record.size
+            current = self.mmap[offset:offset + 20]
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                _key, status, timestamp = self.record.unpack_from(self.mmap, offset)
+                if timestamp == 0:
+                    return self.statuses[status], None
+
+                revoked_date = datetime.utcfromtimestamp(timestamp)
+                if settings.USE_TZ:
+                    revoked_date = timezone.make_aware(revoked_date, timezone.utc)
+                return self.statuses[status], revoked_date
+        return None
+
+    def get(self, serials):
+        """Get the status of the given serials.
+
+        Returns a dictionary mapping serials to a tuple of the OCSP status and the revocation date,
+        like :py:meth:`RevocationIndex.get`. Serials not found in the snapshot are not included.
+        """
+        statuses = {}
+        for serial in serials:
+            status = self.lookup(self.get_key(serial))
+            if status is not None:
+                statuses[serial] = status
+        return statuses
+
+
+_revocation_snapshots = {}
+
+
+def get_revocation_snapshot(path, max_age):
+    """Get the :py:class:`RevocationSnapshot` at the given path.
+
+    The snapshot is shared by all views in this process. If the file was replaced (e.g. by a new
+    snapshot renamed to ``path``), the new snapshot is loaded. The file is checked at most every
+    ``max_age`` seconds. If the new file cannot be loaded, the old snapshot is used.
+    """
+    snapshot, last_check = _revocation_snapshots.get(path, (None, None))
+    now = time.time()
+    if snapshot is not None and now - last_check <= max_age:
+        return snapshot
+
+    try:
+        stat = os.stat(path)
+        if snapshot is None or snapshot.mtime != (stat.st_ino, stat.st_mtime):
+            snapshot = RevocationSnapshot(path)
+    except (OSError, ValueError) as e:
+        if snapshot is None:
+            raise
+        log.warning('Could not reload revocation snapshot: %s', e)
+
+    _revocation_snapshots[path] = (snapshot, now)
+    return snapshot
+
+
+class IssuerIndex(object):
+    """In-memory index of all enabled certificate authorities by the issuer hashes in a CertID.
+
+    The index maps tuples of the hash algorithm, the hash of the issuer name and the hash of the
+    issuer public key to the serial and the private key path of the certificate authority. It is
+    used by :py:class:`~django_ca.views.MultiCAOCSPView` to find the certificate authority for a
+    request. Use :py:func:`get_issuer_index` to get the index shared by all views in this process.
+    """
+
+    hash_algorithms = ('sha1', 'sha256')
+    """Hash algorithms supported in CertIDs."""
+
+    def __init__(self):
+        self.issuers = {}
+        self.last_refresh = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Load all enabled certificate authorities from the database."""
+
+        issuers = {}
+        qs = CertificateAuthority.objects.enabled().values_list(
+            'serial', 'pub', 'private_key_path')
+        for serial, pub, private_key_path in qs.iterator():
+            cert = asymmetric.load_certificate(force_bytes(pub)).asn1
+            for algo in self.hash_algorithms:
+                key = (algo, getattr(cert.subject, algo), getattr(cert.public_key, algo))
+                issuers[key] = (serial, private_key_path)
+
+        self.issuers = issuers
+        self.last_refresh = time.time()
+
+    def get(self, cert_id, max_age):
+        """Get the certificate authority for the given CertID.
+
+        The index is refreshed first if the last refresh is older than ``max_age`` seconds.
+
+        Returns
+        -------
+
+        tuple
+            A tuple of the serial and the private key path of the certificate authority, or
+            ``None`` if no enabled certificate authority matches.
+        """
+        if self.last_refresh is None or time.time() - self.last_refresh > max_age:
+            with self._lock:
+                # check again, another thread might have refreshed the index in the meantime
+                if self.last_refresh is None or time.time() - self.last_refresh > max_age:
+                    self.refresh()
+
+        key = (cert_id['hash_algorithm']['algorithm'].native,
+               cert_id['issuer_name_hash'].native, cert_id['issuer_key_hash'].native)
+        return self.issuers.get(key)
+
+
+_issuer_index = IssuerIndex()
+
+
+def get_issuer_index():
+    """Get the :py:class:`IssuerIndex` shared by all views in this process."""
+
+    return _issuer_index
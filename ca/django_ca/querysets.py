@@ -32,19 +32,37 @@ class CertificateAuthorityQuerySet(models.QuerySet, SerialMixin):
 
 
 class CertificateQuerySet(models.QuerySet, SerialMixin):
+    # NOTE: The status column is only used to narrow down the rows to look at, the revoked flag
+    #       always decides if a certificate is revoked, even if the status is not up to date.
+
     def valid(self):
         """Return valid certificates."""
 
-        return self.filter(revoked=False, expires__gt=timezone.now())
+        return self.filter(status='valid', revoked=False, expires__gt=timezone.now())
 
     def expired(self):
         """Returns expired certificates.
 
         Note that this method does not return revoked certificates that would otherwise be expired.
+        Certificates are returned even if :py:meth:`update_status` did not mark them as expired
+        yet.
         """
-        return self.filter(revoked=False, expires__lt=timezone.now())
+        return self.filter(status__in=['valid', 'expired'], revoked=False,
+                           expires__lt=timezone.now())
 
     def revoked(self):
         """Return revoked certificates."""
 
         return self.filter(revoked=True)
+
+    def update_status(self):
+        """Update the status of certificates that expired since the last call or that were revoked
+        without being saved (e.g. with :py:meth:`~django.db.models.query.QuerySet.update`).
+
+        The ``status`` column is updated when a certificate is saved, but expiry happens without
+        any update. Returns the number of updated certificates.
+        """
+        revoked = self.filter(revoked=True).exclude(status='revoked').update(status='revoked')
+        expired = self.filter(status='valid', revoked=False, expires__lte=timezone.now()).update(
+            status='expired')
+        return revoked + expired
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+"""A standalone asyncio HTTP server for OCSP responses and CRLs.
+
+The server answers requests with the same views that are used in the URL configuration, but
+without the overhead of Django's request handling and middleware. Requests are parsed on the event
+loop, database lookups and signing run in a thread pool. This module requires Python 3.4 or later.
+"""
+
+import asyncio
+import base64
+import binascii
+import collections
+import logging
+import re
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections
+from django.http import Http404
+from django.utils.six.moves import http_client
+from django.utils.six.moves.urllib.parse import unquote
+
+from . import ca_settings
+from .metrics import registry
+from .signing import SigningQueueFull
+from .views import CertificateRevocationListView
+from .views import MetricsView
+from .views import MultiCAOCSPView
+from .views import OCSPView
+from .views import get_crl_cache_headers
+from .views import is_not_modified
+
+log = logging.getLogger(__name__)
+
+
+class Responder(object):
+    """Route requests to OCSP and CRL views.
+
+    Parameters
+    ----------
+
+    ocsp_urls : dict, optional
+        OCSP responders in the same format as the ``CA_OCSP_URLS`` setting, which is also the
+        default.
+    crl : bool, optional
+        If CRLs should be served, the default is the ``CA_PROVIDE_GENERIC_CRL`` setting.
+    metrics : bool, optional
+        If metrics should be served at ``<prefix>metrics/``, the default is the
+        ``CA_PROVIDE_METRICS`` setting.
+    prefix : str, optional
+        Path prefix of all URLs, the default is ``"/"``. URLs are the same as in
+        ``django_ca.urls``, e.g. ``<prefix>ocsp/<name>/`` and ``<prefix>crl/<serial>/``.
+    """
+
+    ocsp_post_re = re.compile(r'^ocsp/(?P<name>[^/]+)/$')
+    ocsp_get_re = re.compile(r'^ocsp/(?P<name>[^/]+)/(?P<data>[a-zA-Z0-9=+/%]+)$')
+    crl_re = re.compile(r'^crl/(?P<serial>[0-9A-F:]+)/(?:(?P<scope>base|delta)/|'
+                        r'shard/(?P<shards>[0-9]+)/(?P<shard>[0-9]+)/)?$')
+
+    def __init__(self, ocsp_urls=None, crl=None, prefix='/', metrics=None):
+        if ocsp_urls is None:
+            ocsp_urls = getattr(settings, 'CA_OCSP_URLS', {})
+        if crl is None:
+            crl = ca_settings.CA_PROVIDE_GENERIC_CRL
+        if metrics is None:
+            metrics = ca_settings.CA_PROVIDE_METRICS
+
+        self.prefix = prefix
+        self.crl = crl
+        self.metrics = metrics
+        self.ocsp_views = {}
+        for name, kwargs in ocsp_urls.items():
+            # Entries with a "responders" key serve all certificate authorities, like in urls.py
+            view = MultiCAOCSPView if 'responders' in kwargs else OCSPView
+            for key in kwargs:
+                if not hasattr(view, key):
+                    raise ImproperlyConfigured('%s: Invalid parameter for %s: %s' % (
+                        name, view.__name__, key))
+            self.ocsp_views[name] = view(**kwargs)
+
+    def handle(self, method, path, body, headers=None):
+        """Handle a request.
+
+        ``headers`` is a dictionary of request headers with lower case names. Returns a tuple of
+        the HTTP status code, a list of headers and the body of the response. This method performs
+        blocking database queries and should not be called from the event loop.
+        """
+        try:
+            return self.dispatch(method, path, body, headers or {})
+        except Exception:
+            log.exception('Error handling %s %s', method, path)
+            return 500, [('Content-Type', 'text/plain')], b'Internal Server Error'
+
+    def dispatch(self, method, path, body, headers):
+        path = path.split('?', 1)[0]
+        if not path.startswith(self.prefix):
+            return self.not_found()
+        path = path[len(self.prefix):]
+
+        match = self.ocsp_post_re.match(path)
+        if match is not None and match.group('name') in self.ocsp_views:
+            if method != 'POST':
+                return self.not_allowed('POST')
+            return self.ocsp(self.ocsp_views[match.group('name')], body)
+
+        match = self.ocsp_get_re.match(path)
+        if match is not None and match.group('name') in self.ocsp_views:
+            if method not in ('GET', 'HEAD'):
+                return self.not_allowed('GET, HEAD')
+            try:
+                data = base64.b64decode(unquote(match.group('data')))
+            except (TypeError, binascii.Error):
+                data = b''  # OCSPView will return a malformedRequest response
+            return self.ocsp(self.ocsp_views[match.group('name')], data, http_cache=True)
+
+        match = self.crl_re.match(path)
+        if self.crl is True and match is not None:
+            if method not in ('GET', 'HEAD'):
+                return self.not_allowed('GET, HEAD')
+            return self.crl_response(headers=headers, **match.groupdict())
+
+        if self.metrics is True and path == 'metrics/':
+            if method not in ('GET', 'HEAD'):
+                return self.not_allowed('GET, HEAD')
+            return 200, [('Content-Type', MetricsView.content_type)], \
+                registry.render().encode('utf-8')
+
+        return self.not_found()
+
+    def ocsp(self, view, data, http_cache=False):
+        status, response = view.handle_ocsp_request(data)
+        content = response.dump()
+        headers = [('Content-Type', 'application/ocsp-response')]
+        if http_cache is True and response['response_status'].native == 'successful':
+            headers += view.get_cache_headers(response, content)
+        return status, headers, content
+
+    def crl_response(self, serial, scope=None, shards=None, shard=None, headers=None):
+        kwargs = {'serial': serial}
+        if shards is not None:
+            scope = 'shard'
+            kwargs.update(shards=shards, shard=shard)
+        view = CertificateRevocationListView(kwargs=kwargs, scope=scope)
+        if scope == 'base':  # same as in urls.py
+            view.expires = 86400
+        try:
+            crl, path, etag, this_update, next_update = view.get_crl_info(serial)
+        except Http404:
+            return self.not_found()
+        except SigningQueueFull as e:
+            log.warning('Could not sign CRL: %s', e)
+            return 503, [('Content-Type', 'text/plain'), ('Retry-After', '1')], \
+                b'Service Unavailable'
+
+        headers = headers or {}
+        cache_headers = get_crl_cache_headers(etag, this_update, next_update)
+        if is_not_modified(headers.get('if-none-match'), headers.get('if-modified-since'), etag,
+                           this_update):
+            return 304, cache_headers, b''
+
+        if crl is None:
+            with open(path, 'rb') as stream:
+                crl = stream.read()
+        return 200, [('Content-Type', view.content_type)] + cache_headers, crl
+
+    def not_found(self):
+        return 404, [('Content-Type', 'text/plain')], b'Not Found'
+
+    def not_allowed(self, allow):
+        return 405, [('Content-Type', 'text/plain'), ('Allow', allow)], b'Method Not Allowed'
+
+
+class ResponderExecutor(ThreadPoolExecutor):
+    """Thread pool that manages database connections like Django does for every request."""
+
+    def submit(self, fn, *args, **kwargs):
+        return super(ResponderExecutor, self).submit(self._run, fn, *args, **kwargs)
+
+    def _run(self, fn, *args, **kwargs):
+        close_old_connections()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+
+class ResponderProtocol(asyncio.Protocol):
+    """A minimal HTTP/1.1 server protocol supporting keep-alive and pipelining.
+
+    Requests are handled by :py:meth:`Responder.handle` in the given executor, responses are sent
+    in the order the requests were received.
+    """
+
+    max_header_size = 8192
+    """Maximum size of the request line and headers."""
+
+    max_body_size = 65536
+    """Maximum size of the request body. OCSP requests are usually much smaller."""
+
+    max_pipelined = 32
+    """Stop reading from a connection if this many requests are pending."""
+
+    def __init__(self, responder, executor, loop, keepalive_timeout=75):
+        self.responder = responder
+        self.executor = executor
+        self.loop = loop
+        self.keepalive_timeout = keepalive_timeout
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.buffer = b''
+        self.pending = collections.deque()  # futures of responses in request order
+        self.closing = False  # no more requests are read from this connection
+        self.paused = False
+        self.timeout = None
+        self.reset_timeout()
+
+    def connection_lost(self, exc):
+        self.closing = True
+        self.transport = None
+        if self.timeout is not None:
+            self.timeout.cancel()
+
+    def reset_timeout(self):
+        if self.timeout is not None:
+            self.timeout.cancel()
+        self.timeout = self.loop.call_later(self.keepalive_timeout, self.on_timeout)
+
+    def on_timeout(self):
+        self.timeout = None
+        if self.transport is not None and not self.pending:
+            self.transport.close()
+
+    def data_received(self, data):
+        if self.closing:
+            return
+
+        self.reset_timeout()
+        self.buffer += data
+        while not self.closing and self.buffer:
+            request = self.parse_request()
+            if request is None:  # request is incomplete
+                break
+            self.handle_request(*request)
+
+        if len(self.pending) >= self.max_pipelined and not self.paused:
+            self.paused = True
+            self.transport.pause_reading()
+
+    def parse_request(self):
+        """Parse the next request from the buffer.
+
+        Returns ``None`` if the request is incomplete, otherwise a tuple of method, path, body,
+        headers and if the connection should be kept alive.
+        """
+        end = self.buffer.find(b'\r\n\r\n')
+        if end < 0:
+            if len(self.buffer) > self.max_header_size:
+                self.error(431)
+            return None
+
+        try:
+            head = self.buffer[:end].decode('iso-8859-1').split('\r\n')
+            method, path, version = head[0].split(' ')
+            headers = {}
+            for line in head[1:]:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            self.error(400)
+            return None
+
+        if 'transfer-encoding' in headers:
+            self.error(411)
+            return None
+        if length > self.max_body_size:
+            self.error(413)
+            return None
+        if len(self.buffer) < end + 4 + length:
+            return None
+
+        body = self.buffer[end + 4:end + 4 + length]
+        self.buffer = self.buffer[end + 4 + length:]
+
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.1':
+            keep_alive = connection != 'close'
+        else:
+            keep_alive = connection == 'keep-alive'
+        return method, path, body, headers, keep_alive
+
+    def handle_request(self, method, path, body, headers, keep_alive):
+        future = self.loop.run_in_executor(self.executor, self.responder.handle, method, path,
+                                           body, headers)
+        self.pending.append((future, method, keep_alive))
+        future.add_done_callback(self.flush)
+        if not keep_alive:
+            self.closing = True
+
+    def error(self, status):
+        """Respond with an error and close the connection."""
+
+        future = asyncio.Future(loop=self.loop)
+        future.set_result((status, [('Content-Type', 'text/plain')],
+                           http_client.responses[status].encode('utf-8')))
+        self.pending.append((future, 'GET', False))
+        self.closing = True
+        self.flush()
+
+    def flush(self, future=None):
+        """Write all finished responses at the start of the queue."""
+
+        while self.pending and self.pending[0][0].done():
+            future, method, keep_alive = self.pending.popleft()
+            if self.transport is None:  # connection was lost in the meantime
+                continue
+
+            status, headers, body = future.result()
+            self.write_response(status, headers, body, method, keep_alive)
+            if not keep_alive:
+                self.transport.close()
+                self.transport = None
+
+        if self.paused and self.transport is not None and len(self.pending) < self.max_pipelined:
+            self.paused = False
+            self.transport.resume_reading()
+
+    def write_response(self, status, headers, body, method, keep_alive):
+        lines = ['HTTP/1.1 %s %s' % (status, http_client.responses[status])]
+        lines += ['%s: %s' % header for header in headers]
+        lines.append('Content-Length: %s' % len(body))
+        if not keep_alive:
+            lines.append('Connection: close')
+
+        data = ('\r\n'.join(lines) + '\r\n\r\n').encode('iso-8859-1')
+        if method != 'HEAD':
+            data += body
+        self.transport.write(data)
+
+
+def create_server(responder, host, port, threads=None, loop=None, executor=None, **kwargs):
+    """Create a server for the given :py:class:`Responder`.
+
+    Returns the coroutine of :py:meth:`asyncio.AbstractEventLoop.create_server`, all keyword
+    arguments are passed to that method.
+    """
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    if executor is None:
+        executor = ResponderExecutor(threads)
+
+    return loop.create_server(lambda: ResponderProtocol(responder, executor, loop),
+                              host, port, **kwargs)
@@ -0,0 +1,500 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+"""Optional process pool for signing OCSP responses and CRLs.
+
+Signing with large RSA keys is CPU-bound. If ``CA_SIGNING_PROCESSES`` is set, OCSP responses and
+CRLs are signed in a pool of processes, so that signing scales with the number of CPU cores even if
+requests are handled by threads of a single process.
+"""
+
+import binascii
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+import asn1crypto.algos
+import asn1crypto.x509
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
+from cryptography.x509.oid import CRLEntryExtensionOID
+from OpenSSL import crypto
+from oscrypto import asymmetric
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import six
+from django.utils import timezone
+from django.utils.encoding import force_text
+
+from . import ca_settings
+
+# Private keys loaded in this process, mapping paths to a tuple of mtime and the loaded key
+_keys = {}
+
+
+def _load_key(path, loader):
+    mtime = os.stat(path).st_mtime
+    cached = _keys.get((path, loader))
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as stream:
+            cached = _keys[(path, loader)] = (mtime, loader(stream.read()))
+    return cached[1]
+
+
+def _load_pkey(data):
+    return crypto.load_privatekey(crypto.FILETYPE_PEM, data)
+
+
+def _load_private_key(data):
+    return serialization.load_pem_private_key(data, None, default_backend())
+
+
+# Map lower case reason names stored in the database to CRL entry extensions of cryptography
+_reasons = {
+    reason.value.lower(): x509.Extension(CRLEntryExtensionOID.CRL_REASON, False,
+                                         x509.CRLReason(reason))
+    for reason in x509.ReasonFlags
+}
+
+
+def sign(key_path, data, hash_algo):
+    """Sign ``data`` with the private key at ``key_path``, as used for OCSP responses."""
+
+    key = _load_key(key_path, asymmetric.load_private_key)
+    if key.algorithm == 'rsa':
+        return asymmetric.rsa_pkcs1v15_sign(key, data, hash_algo)
+    elif key.algorithm == 'dsa':
+        return asymmetric.dsa_sign(key, data, hash_algo)
+    return asymmetric.ecdsa_sign(key, data, hash_algo)
+
+
+def create_crl(revoked):
+    """Create an unsigned :py:class:`OpenSSL.crypto.CRL` from an iterable of revoked certificates.
+
+    ``revoked`` yields tuples of the serial (without colons), reason and revocation date (ASN1
+    GENERALIZEDTIME) of revoked certificates as bytes. The reason may be ``None``.
+    """
+    crl = crypto.CRL()
+    for serial, reason, date in revoked:
+        r = crypto.Revoked()
+        r.set_serial(serial)
+        if reason:
+            r.set_reason(reason)
+        r.set_rev_date(date)
+        crl.add_revoked(r)
+    return crl
+
+
+def export_crl(ca_pem, key_path, revoked, **kwargs):
+    """Create and sign a CRL.
+
+    Parameters
+    ----------
+
+    ca_pem : str
+        The certificate of the certificate authority in PEM format.
+    key_path : str
+        Path to the private key of the certificate authority.
+    revoked : list
+        List of revoked certificates, see :py:func:`create_crl`.
+    **kwargs
+        Passed to :py:func:`OpenSSL.crypto.CRL.export`.
+    """
+    ca_cert = crypto.load_certificate(crypto.FILETYPE_PEM, ca_pem)
+    return create_crl(revoked).export(ca_cert, _load_key(key_path, _load_pkey), **kwargs)
+
+
+def build_crl(ca_pem, key_path, revoked, last_update, next_update, digest, crl_number=None,
+              delta_crl_indicator=None, distribution_point=None, freshest_crl=None):
+    """Create and sign a CRL, optionally with a CRL number or as a delta CRL.
+
+    Parameters
+    ----------
+
+    ca_pem : bytes
+        The certificate of the certificate authority in PEM format.
+    key_path : str
+        Path to the private key of the certificate authority.
+    revoked : list
+        List of tuples of the serial (hex-encoded, without colons), reason and revocation date of
+        revoked certificates. The reason may be ``None``.
+    last_update : datetime
+        The ``thisUpdate`` value of the CRL.
+    next_update : datetime
+        The ``nextUpdate`` value of the CRL.
+    digest : str
+        Name of the message digest to use, e.g. ``"sha512"``.
+    crl_number : int, optional
+        The value of the CRLNumber extension. If omitted, the CRL has no CRLNumber extension.
+    delta_crl_indicator : int, optional
+        If given, the CRL is a delta CRL and this is the CRL number of its base CRL.
+    distribution_point : list of str, optional
+        If given, the CRL includes an issuingDistributionPoint extension with these URLs. The CRL
+        then only covers end-entity certificates with one of these URLs as distribution point.
+    freshest_crl : list of str, optional
+        If given, the CRL includes a FreshestCRL extension pointing to delta CRLs at these URLs.
+
+    Returns
+    -------
+
+    bytes
+        The CRL in DER format.
+    """
+    backend = default_backend()
+    ca_cert = x509.load_pem_x509_certificate(ca_pem, backend)
+
+    revoked_certs = []
+    for serial, reason, date in revoked:
+        extensions = []
+        if reason:
+            extensions.append(_reasons[reason.lower()])
+        revoked_certs.append(x509.RevokedCertificateBuilder(
+            int(serial, 16), extensions=extensions).revocation_date(date).build(backend))
+
+    # add_revoked_certificate() copies the list for every certificate, so pass all at once
+    builder = x509.CertificateRevocationListBuilder(revoked_certificates=revoked_certs)
+    builder = builder.issuer_name(ca_cert.subject).last_update(last_update).next_update(
+        next_update)
+    if crl_number is not None:
+        builder = builder.add_extension(x509.CRLNumber(crl_number), critical=False)
+    if delta_crl_indicator is not None:
+        builder = builder.add_extension(x509.DeltaCRLIndicator(delta_crl_indicator),
+                                        critical=True)
+    if distribution_point is not None:
+        idp = x509.IssuingDistributionPoint(
+            full_name=[x509.UniformResourceIdentifier(url) for url in distribution_point],
+            relative_name=None, only_contains_user_certs=True, only_contains_ca_certs=False,
+            only_some_reasons=None, indirect_crl=False, only_contains_attribute_certs=False)
+        builder = builder.add_extension(idp, critical=True)
+    if freshest_crl is not None:
+        freshest = x509.FreshestCRL([x509.DistributionPoint(
+            full_name=[x509.UniformResourceIdentifier(url) for url in freshest_crl],
+            relative_name=None, reasons=None, crl_issuer=None)])
+        builder = builder.add_extension(freshest, critical=False)
+
+    algorithm = get_hash_algorithm(digest)
+    crl = builder.sign(_load_key(key_path, _load_private_key), algorithm, backend)
+    return crl.public_bytes(serialization.Encoding.DER)
+
+
+def _der_header(tag, length):
+    """Get the tag and length octets of a DER element."""
+
+    if length < 0x80:
+        return bytes(bytearray([tag, length]))
+
+    encoded = bytearray()
+    while length:
+        encoded.insert(0, length & 0xff)
+        length >>= 8
+    return bytes(bytearray([tag, 0x80 | len(encoded)]) + encoded)
+
+
+def _der(tag, content):
+    return _der_header(tag, len(content)) + content
+
+
+def _der_integer(value):
+    if not isinstance(value, six.string_types):
+        value = '%x' % value
+    data = binascii.unhexlify(value if len(value) % 2 == 0 else '0%s' % value)
+    data = data.lstrip(b'\0') or b'\0'
+    if bytearray(data[:1])[0] & 0x80:
+        data = b'\0' + data
+    return _der(0x02, data)
+
+
+def _der_time(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+
+    # RFC 5280, section 5.1.2.4: UTCTime until 2049, GeneralizedTime after that
+    if value.year < 2050:
+        return _der(0x17, value.strftime('%y%m%d%H%M%SZ').encode('ascii'))
+    return _der(0x18, value.strftime('%Y%m%d%H%M%SZ').encode('ascii'))
+
+
+def _der_extension(oid, value, critical=False):
+    content = _der(0x06, oid)
+    if critical is True:
+        content += b'\x01\x01\xff'
+    return _der(0x30, content + _der(0x04, value))
+
+
+# Encoded crlEntryExtensions with a CRLReason extension (OID 2.5.29.21) by lower case reason
+_reason_codes = {
+    'unspecified': 0, 'keycompromise': 1, 'cacompromise': 2, 'affiliationchanged': 3,
+    'superseded': 4, 'cessationofoperation': 5, 'certificatehold': 6, 'removefromcrl': 8,
+    'privilegewithdrawn': 9, 'aacompromise': 10,
+}
+_reason_extensions = {
+    reason: _der(0x30, _der_extension(b'\x55\x1d\x15', _der(0x0a, bytes(bytearray([code])))))
+    for reason, code in _reason_codes.items()
+}
+
+
+def get_hash_algorithm(digest):
+    """Get the :py:mod:`cryptography` hash algorithm for a digest name like ``"sha512"``.
+
+    Raises ``ValueError`` if the digest is unknown.
+    """
+    algorithm = getattr(hashes, force_text(digest).upper(), None)
+    if not isinstance(algorithm, type) or not issubclass(algorithm, hashes.HashAlgorithm):
+        raise ValueError('%s: Unknown digest.' % force_text(digest))
+    return algorithm()
+
+
+def _get_crl_signer(key, digest):
+    """Get the hash algorithm, the DER encoded signature algorithm and the arguments for signing
+    the hash with ``key`` for :py:func:`write_crl`.
+
+    Raises ``ValueError`` if the digest is unknown or can't be used with this type of key.
+    """
+    algorithm = get_hash_algorithm(digest)
+    if isinstance(key, rsa.RSAPrivateKey):
+        key_algorithm = 'rsa'
+        sign_args = (padding.PKCS1v15(), Prehashed(algorithm))
+    elif isinstance(key, ec.EllipticCurvePrivateKey):
+        key_algorithm = 'ecdsa'
+        sign_args = (ec.ECDSA(Prehashed(algorithm)), )
+    else:
+        key_algorithm = 'dsa'
+        sign_args = (Prehashed(algorithm), )
+
+    # asn1crypto raises ValueError for unknown combinations, e.g. sha512 with DSA
+    signature_algorithm = asn1crypto.algos.SignedDigestAlgorithm({
+        'algorithm': '%s_%s' % (algorithm.name, key_algorithm)}).dump()
+    return algorithm, signature_algorithm, sign_args
+
+
+def can_write_crl(key_path, digest):
+    """Check if :py:func:`write_crl` can sign CRLs with the private key at ``key_path`` and the
+    given digest."""
+
+    try:
+        _get_crl_signer(_load_key(key_path, _load_private_key), digest)
+    except ValueError:
+        return False
+    return True
+
+
+def write_crl(stream, ca_pem, key_path, revoked, last_update, next_update, digest,
+              crl_number=None, delta_crl_indicator=None):
+    """Create and sign a CRL in DER format and write it to ``stream``, using bounded memory.
+
+    Unlike :py:func:`build_crl`, revoked certificates are encoded one at a time, so ``revoked`` may
+    be an iterator (e.g. of a database query) of millions of entries. Encoded entries are buffered
+    in a temporary file, since the length of the list has to be known before the CRL is written.
+    The signed data is hashed incrementally and only the digest is signed.
+
+    Parameters are the same as for :py:func:`build_crl`.
+    """
+    backend = default_backend()
+    ca_cert = asn1crypto.x509.Certificate.load(x509.load_pem_x509_certificate(
+        ca_pem, backend).public_bytes(serialization.Encoding.DER))
+    key = _load_key(key_path, _load_private_key)
+    algorithm, signature_algorithm, sign_args = _get_crl_signer(key, digest)
+
+    extensions = b''
+    if crl_number is not None:
+        extensions += _der_extension(b'\x55\x1d\x14', _der_integer(crl_number))
+    if delta_crl_indicator is not None:
+        extensions += _der_extension(b'\x55\x1d\x1b', _der_integer(delta_crl_indicator),
+                                     critical=True)
+    if extensions:
+        extensions = _der(0xa0, _der(0x30, extensions))
+
+    head = b'\x02\x01\x01' + signature_algorithm + ca_cert.subject.dump() + \
+        _der_time(last_update) + _der_time(next_update)
+
+    with tempfile.TemporaryFile() as entries:
+        length = 0
+        for serial, reason, date in revoked:
+            entry = _der_integer(serial) + _der_time(date)
+            if reason:
+                entry += _reason_extensions[reason.lower()]
+            entry = _der(0x30, entry)
+            entries.write(entry)
+            length += len(entry)
+
+        if length:  # revokedCertificates must be absent if there are no entries
+            head += _der_header(0x30, length)
+        tbs_length = len(head) + length + len(extensions)
+        head = _der_header(0x30, tbs_length) + head
+
+        def tbs_chunks():
+            yield head
+            entries.seek(0)
+            for chunk in iter(lambda: entries.read(65536), b''):
+                yield chunk
+            yield extensions
+
+        hasher = hashes.Hash(algorithm, backend)
+        for chunk in tbs_chunks():
+            hasher.update(chunk)
+        signature = _der(0x03, b'\0' + key.sign(hasher.finalize(), *sign_args))
+
+        stream.write(_der_header(0x30, len(head) + length + len(extensions) +
+                                 len(signature_algorithm) + len(signature)))
+        for chunk in tbs_chunks():
+            stream.write(chunk)
+        stream.write(signature_algorithm + signature)
+
+
+class SigningQueueFull(Exception):
+    """Raised if too many signing requests are pending."""
+
+
+class SigningTimeout(SigningQueueFull):
+    """Raised if a signing request did not finish in time, e.g. because a process hangs."""
+
+
+class SigningPool(object):
+    """A pool of processes used for signing.
+
+    Private keys are loaded by path in each process when they are first used and cached until the
+    file is modified. At most ``max_pending`` signing requests may be pending at any time, any
+    further request raises :py:class:`SigningQueueFull` immediately. Requests that do not finish
+    within ``timeout`` seconds raise :py:class:`SigningTimeout`.
+
+    Note that every process using a pool creates its own pool, so the number of processes should
+    be small (e.g. the number of CPU cores divided by the number of web server processes).
+
+    Parameters
+    ----------
+
+    processes : int, optional
+        Number of processes, the default is ``2``.
+    max_pending : int, optional
+        Maximum number of pending signing requests, the default is ``100``.
+    timeout : int, optional
+        Seconds to wait for the result of a signing request, the default is ``30``.
+    """
+
+    def __init__(self, processes=2, max_pending=100, timeout=30):
+        self.config = (processes, max_pending, timeout)
+        self.processes = processes
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pool = multiprocessing.Pool(self.processes)
+
+        # statistics
+        self.pending = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.failed = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def apply(self, func, *args, **kwargs):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise SigningQueueFull('%s signing requests are pending.' % self.pending)
+            self.pending += 1
+            self.submitted += 1
+
+        start = time.time()
+        try:
+            return self.pool.apply_async(func, args, kwargs).get(self.timeout)
+        except multiprocessing.TimeoutError:
+            with self._lock:
+                self.failed += 1
+            raise SigningTimeout('Signing request did not finish within %s seconds.'
+                                 % self.timeout)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.seconds += time.time() - start
+
+    def sign(self, key_path, data, hash_algo):
+        """Sign data in the pool, see :py:func:`sign`."""
+
+        return self.apply(sign, key_path, data, hash_algo)
+
+    def export_crl(self, ca_pem, key_path, revoked, **kwargs):
+        """Create and sign a CRL in the pool, see :py:func:`export_crl`."""
+
+        return self.apply(export_crl, ca_pem, key_path, revoked, **kwargs)
+
+    def build_crl(self, *args, **kwargs):
+        """Create and sign a CRL in the pool, see :py:func:`build_crl`."""
+
+        return self.apply(build_crl, *args, **kwargs)
+
+    def get_stats(self):
+        """Get a dictionary of statistics about this pool.
+
+        ``pending`` is the number of signing requests currently pending, ``submitted``,
+        ``rejected`` and ``failed`` count requests since the pool was created and ``seconds`` is
+        the total time spent waiting for results (including time spent in the queue).
+        """
+        with self._lock:
+            return {
+                'processes': self.processes,
+                'max_pending': self.max_pending,
+                'pending': self.pending,
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'failed': self.failed,
+                'seconds': self.seconds,
+            }
+
+    def close(self):
+        self.pool.terminate()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_signing_pool(create=True):
+    """Get the :py:class:`SigningPool` of this process.
+
+    Returns ``None`` if ``CA_SIGNING_PROCESSES`` is not set. The pool is created on first use,
+    unless ``create`` is ``False``, in which case ``None`` is returned if it wasn't created yet.
+    Raises ``ImproperlyConfigured`` if ``CA_SIGNING_PROCESSES`` is smaller than one.
+    """
+    global _pool
+
+    if ca_settings.CA_SIGNING_PROCESSES is None:
+        return None
+    if create is False:
+        return _pool
+    if ca_settings.CA_SIGNING_PROCESSES < 1:
+        raise ImproperlyConfigured('CA_SIGNING_PROCESSES must be at least 1.')
+
+    config = (ca_settings.CA_SIGNING_PROCESSES, ca_settings.CA_SIGNING_QUEUE_SIZE,
+              ca_settings.CA_SIGNING_TIMEOUT)
+    if _pool is None or _pool.config != config:
+        with _pool_lock:
+            if _pool is None or _pool.config != config:
+                if _pool is not None:
+                    _pool.close()
+                _pool = SigningPool(*config)
+    return _pool
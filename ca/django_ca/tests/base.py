@@ -19,9 +19,11 @@ from django.utils.six import StringIO
 from django.utils.six.moves import reload_module
 
 from django_ca import ca_settings
+from django_ca import signing
 from django_ca.models import Certificate
 from django_ca.models import CertificateAuthority
 from django_ca.utils import sort_subject_dict
+from django_ca.utils import generate_private_key
 from django_ca.utils import get_cert_profile_kwargs
 from django_ca.utils import parse_date
 
@@ -140,6 +142,16 @@ class DjangoCATestCase(TestCase):
     def setUp(self):
         reload_module(ca_settings)
 
+    def close_signing_pool(self):
+        """Terminate the signing pool, so that its handler threads do not outlive the test.
+
+        The handler threads of a ``multiprocessing.Pool`` call ``time.sleep()``, which would
+        otherwise show up in tests that mock it.
+        """
+        if signing._pool is not None:
+            signing._pool.close()
+            signing._pool = None
+
     def settings(self, **kwargs):
         return override_settings(**kwargs)
 
@@ -163,10 +175,9 @@ class DjangoCATestCase(TestCase):
         return ca
 
     @classmethod
-    def create_csr(cls, **fields):
+    def create_csr(cls, key_type='RSA', **fields):
         # see also: https://github.com/msabramo/pyOpenSSL/blob/master/examples/certgen.py
-        pkey = crypto.PKey()
-        pkey.generate_key(crypto.TYPE_RSA, 1024)
+        pkey = generate_private_key(key_type, 1024)
 
         req = crypto.X509Req()
 
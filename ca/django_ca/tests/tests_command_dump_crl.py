@@ -13,20 +13,41 @@
 # You should have received a copy of the GNU General Public License along with django-ca.  If not,
 # see <http://www.gnu.org/licenses/>
 
+import json
 import os
 
+from datetime import datetime
+from datetime import timedelta
 from io import BytesIO
 
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from mock import patch
 from OpenSSL import crypto
 
 from django.core.management.base import CommandError
+from django.db.models import F
 
 from ..models import Certificate
+from ..models import CertificateAuthority
 from .. import ca_settings
+from ..utils import serial_from_int
 from .base import DjangoCAWithCertTestCase
+from .base import override_settings
 from .base import override_tmpcadir
 
 
+class InlinePool(object):
+    def __init__(self, processes):
+        self.processes = processes
+
+    def imap_unordered(self, func, iterable):
+        return (func(item) for item in iterable)
+
+    def terminate(self):
+        pass
+
+
 @override_tmpcadir(CA_MIN_KEY_SIZE=1024, CA_PROFILES={}, CA_DEFAULT_SUBJECT={})
 class DumpCRLTestCase(DjangoCAWithCertTestCase):
     def assertSerial(self, revokation, cert):
@@ -54,6 +75,66 @@ class DumpCRLTestCase(DjangoCAWithCertTestCase):
         with self.assertRaises(CommandError):
             self.cmd('dump_crl', path, stdout=BytesIO(), stderr=BytesIO())
 
+    def test_der(self):
+        cert = Certificate.objects.get(serial=self.cert.serial)
+        cert.revoke('keyCompromise')
+
+        # DER CRLs written to a file are only streamed if requested
+        path = os.path.join(ca_settings.CA_DIR, 'crl-test.der')
+        with patch('django_ca.crl.write_crl') as write_mock:
+            self.cmd('dump_crl', path, format=crypto.FILETYPE_ASN1, stdout=BytesIO(),
+                     stderr=BytesIO())
+        write_mock.assert_not_called()
+
+        stdout, stderr = self.cmd('dump_crl', path, format=crypto.FILETYPE_ASN1, expires=3600,
+                                  stream=True, stdout=BytesIO(), stderr=BytesIO())
+        self.assertEqual((stdout, stderr), (b'', b''))
+        with open(path, 'rb') as stream:
+            crl = x509.load_der_x509_crl(stream.read(), default_backend())
+        self.assertTrue(crl.is_signature_valid(self.ca.x509.get_pubkey().to_cryptography_key()))
+        self.assertEqual(crl.next_update - crl.last_update, timedelta(seconds=3600))
+        self.assertEqual([serial_from_int(r.serial_number) for r in crl], [cert.serial])
+        reason = crl[0].extensions.get_extension_for_class(x509.CRLReason).value.reason
+        self.assertEqual(reason, x509.ReasonFlags.key_compromise)
+        with open(path, 'rb') as stream:
+            der = stream.read()
+
+        # the file is replaced atomically, so an error leaves the previous CRL in place
+        with patch('django_ca.crl.write_crl', side_effect=RuntimeError('error')), \
+                self.assertRaises(RuntimeError):
+            self.cmd('dump_crl', path, format=crypto.FILETYPE_ASN1, stream=True,
+                     stdout=BytesIO(), stderr=BytesIO())
+        with open(path, 'rb') as stream:
+            self.assertEqual(stream.read(), der)
+        self.assertEqual([f for f in os.listdir(ca_settings.CA_DIR) if 'crl-test.der' in f],
+                         ['crl-test.der'])
+
+        # keys that can't be used for streaming (e.g. DSA with sha512) use get_crl()
+        with patch('django_ca.management.commands.dump_crl.can_stream_crl',
+                   return_value=False), patch('django_ca.crl.write_crl') as write_mock:
+            self.cmd('dump_crl', path, format=crypto.FILETYPE_ASN1, stream=True,
+                     stdout=BytesIO(), stderr=BytesIO())
+        write_mock.assert_not_called()
+        with open(path, 'rb') as stream:
+            crl = x509.load_der_x509_crl(stream.read(), default_backend())
+        self.assertEqual([serial_from_int(r.serial_number) for r in crl], [cert.serial])
+
+        # only complete DER CRLs written to a file can be streamed
+        msg = r'^--stream requires DER format and a path'
+        for args, kwargs in [((path, ), {'format': crypto.FILETYPE_PEM}),
+                             ((), {'format': crypto.FILETYPE_ASN1}),
+                             ((path, '--base'), {'format': crypto.FILETYPE_ASN1})]:
+            with self.assertRaisesRegex(CommandError, msg):
+                self.cmd('dump_crl', *args, stream=True, stdout=BytesIO(), stderr=BytesIO(),
+                         **kwargs)
+
+    def test_digest(self):
+        with self.assertRaisesRegex(CommandError, r'^foo: Unknown digest\.$'):
+            self.cmd('dump_crl', digest=['foo'], stdout=BytesIO(), stderr=BytesIO())
+        with self.assertRaisesRegex(CommandError, r'^foo: Unknown digest\.$'):
+            self.cmd('dump_crl', ca_settings.CA_DIR, all=True, digest=['sha256', 'foo'],
+                     stdout=BytesIO(), stderr=BytesIO())
+
     def test_revoked(self):
         cert = Certificate.objects.get(serial=self.cert.serial)
         cert.revoke()
@@ -85,3 +166,144 @@ class DumpCRLTestCase(DjangoCAWithCertTestCase):
             self.assertEqual(len(revoked), 1)
             self.assertEqual(revoked[0].get_reason(), readable_reason)
             self.assertSerial(revoked[0], cert)
+
+    @override_settings(CA_CRL_BACKEND='cryptography')
+    def test_cryptography_backend(self):
+        cert = Certificate.objects.get(serial=self.cert.serial)
+        cert.revoke('superseded')
+        stdout, stderr = self.cmd('dump_crl', expires=3600, stdout=BytesIO(), stderr=BytesIO())
+        self.assertEqual(stderr, b'')
+
+        revoked = crypto.load_crl(crypto.FILETYPE_PEM, stdout).get_revoked()
+        self.assertEqual(len(revoked), 1)
+        self.assertEqual(revoked[0].get_reason(), b'Superseded')
+        self.assertSerial(revoked[0], cert)
+
+        crl = x509.load_pem_x509_crl(stdout, default_backend())
+        self.assertTrue(crl.is_signature_valid(self.ca.x509.get_pubkey().to_cryptography_key()))
+        self.assertEqual(crl.next_update - crl.last_update, timedelta(seconds=3600))
+        self.assertEqual(len(crl.extensions), 0)
+
+        # PEM output does not depend on pyOpenSSL >= 16.1.0 (where crypto.dump_crl was added)
+        with patch('django_ca.crl.crypto.dump_crl', side_effect=AttributeError):
+            stdout, stderr = self.cmd('dump_crl', stdout=BytesIO(), stderr=BytesIO())
+        crl = x509.load_pem_x509_crl(stdout, default_backend())
+        self.assertEqual([serial_from_int(r.serial_number) for r in crl], [cert.serial])
+
+        # CRLs written with --all use the same backend
+        path = os.path.join(ca_settings.CA_DIR, 'crl-cryptography')
+        os.makedirs(path)
+        self.cmd('dump_crl', path, all=True, processes=1, stdout=BytesIO(), stderr=BytesIO())
+        crl_path = os.path.join(path, self.ca.serial.replace(':', ''), 'full-sha512.der')
+        with open(crl_path, 'rb') as stream:
+            crl = x509.load_der_x509_crl(stream.read(), default_backend())
+        self.assertEqual([serial_from_int(r.serial_number) for r in crl], [cert.serial])
+
+    def load_crl(self, data):
+        crl = x509.load_pem_x509_crl(data, default_backend())
+        number = crl.extensions.get_extension_for_class(x509.CRLNumber).value.crl_number
+        try:
+            base = crl.extensions.get_extension_for_class(x509.DeltaCRLIndicator).value.crl_number
+        except x509.ExtensionNotFound:
+            base = None
+        return number, base, [serial_from_int(r.serial_number) for r in crl]
+
+    def test_delta(self):
+        with self.assertRaisesRegex(CommandError, r'No base CRL was generated yet\.$'):
+            self.cmd('dump_crl', '--delta', stdout=BytesIO(), stderr=BytesIO())
+
+        stdout, stderr = self.cmd('dump_crl', '--base', stdout=BytesIO(), stderr=BytesIO())
+        self.assertEqual(self.load_crl(stdout), (1, None, []))
+        stdout, stderr = self.cmd('dump_crl', '--delta', stdout=BytesIO(), stderr=BytesIO())
+        self.assertEqual(self.load_crl(stdout), (2, 1, []))
+
+        # thisUpdate and nextUpdate are in UTC, regardless of TIME_ZONE
+        crl = x509.load_pem_x509_crl(stdout, default_backend())
+        self.assertLess(abs(crl.last_update - datetime.utcnow()), timedelta(seconds=10))
+        self.assertEqual(crl.next_update - crl.last_update, timedelta(days=1))
+
+        # a revoked certificate shows up in the next delta CRL
+        cert = Certificate.objects.get(serial=self.cert.serial)
+        cert.revoke('CACompromise')
+        stdout, stderr = self.cmd('dump_crl', '--delta', stdout=BytesIO(), stderr=BytesIO())
+        self.assertEqual(self.load_crl(stdout), (3, 1, [cert.serial]))
+        crl = x509.load_pem_x509_crl(stdout, default_backend())
+        reason = crl[0].extensions.get_extension_for_class(x509.CRLReason).value.reason
+        self.assertEqual(reason, x509.ReasonFlags.ca_compromise)
+
+        # base CRLs of the same period keep the number that delta CRLs refer to
+        stdout, stderr = self.cmd('dump_crl', '--base', stdout=BytesIO(), stderr=BytesIO())
+        self.assertEqual(self.load_crl(stdout), (1, None, [cert.serial]))
+
+        # ... and in the base CRL of the next period, but no longer in delta CRLs after that
+        CertificateAuthority.objects.filter(pk=self.ca.pk).update(
+            crl_base_date=F('crl_base_date') - timedelta(days=1))
+        stdout, stderr = self.cmd('dump_crl', '--base', stdout=BytesIO(), stderr=BytesIO())
+        self.assertEqual(self.load_crl(stdout), (4, None, [cert.serial]))
+        cert.revoked_date -= timedelta(seconds=120)
+        cert.save()
+        stdout, stderr = self.cmd('dump_crl', '--delta', stdout=BytesIO(), stderr=BytesIO())
+        self.assertEqual(self.load_crl(stdout), (5, 4, []))
+
+        ca = CertificateAuthority.objects.get(pk=self.ca.pk)
+        self.assertEqual((ca.crl_number, ca.crl_base_number), (5, 4))
+
+        # legacy CRLs have no CRL number and don't change the number
+        stdout, stderr = self.cmd('dump_crl', stdout=BytesIO(), stderr=BytesIO())
+        crl = x509.load_pem_x509_crl(stdout, default_backend())
+        with self.assertRaises(x509.ExtensionNotFound):
+            crl.extensions.get_extension_for_class(x509.CRLNumber)
+
+    def test_all(self):
+        path = os.path.join(ca_settings.CA_DIR, 'crl-all')
+        os.makedirs(path)
+        cert = Certificate.objects.get(serial=self.cert.serial)
+        cert.revoke()
+
+        stdout, stderr = self.cmd('dump_crl', path, all=True, digest=['sha256', 'sha512'],
+                                  processes=1, verbosity=2, stdout=BytesIO(), stderr=BytesIO())
+        self.assertEqual(stderr, b'')
+
+        cas = list(CertificateAuthority.objects.enabled())
+        self.assertEqual(sorted(os.listdir(path)),
+                         sorted(ca.serial.replace(':', '') for ca in cas))
+        for ca in cas:
+            for digest in ['sha256', 'sha512']:
+                crl_path = os.path.join(path, ca.serial.replace(':', ''), 'full-%s' % digest)
+                self.assertIn(('Wrote %s.der\n' % crl_path).encode('utf-8'), stdout)
+                with open('%s.pem' % crl_path, 'rb') as stream:
+                    crl = crypto.load_crl(crypto.FILETYPE_PEM, stream.read())
+                revoked = crl.get_revoked() or []
+                self.assertEqual(len(revoked), 1 if ca == self.ca else 0)
+
+        # other paths must be a directory
+        with self.assertRaisesRegex(CommandError, r'^-: Not a directory\.$'):
+            self.cmd('dump_crl', all=True, stdout=BytesIO(), stderr=BytesIO())
+        with self.assertRaisesRegex(CommandError, r'only be given once without --all\.$'):
+            self.cmd('dump_crl', path, digest=['sha256', 'sha512'], stdout=BytesIO(),
+                     stderr=BytesIO())
+
+    def test_all_delta(self):
+        path = os.path.join(ca_settings.CA_DIR, 'crl-delta')
+        os.makedirs(path)
+        ca_path = os.path.join(path, self.ca.serial.replace(':', ''))
+
+        # there is no base CRL yet
+        stdout, stderr = self.cmd('dump_crl', path, all=True, delta=True, processes=1,
+                                  stdout=BytesIO(), stderr=BytesIO())
+        self.assertIn(('%s: No base CRL was generated yet.' % self.ca.serial).encode('utf-8'),
+                      stderr)
+        self.assertEqual(os.listdir(path), [])
+
+        # CRLs are signed in a process pool, all digests get the same CRL number
+        with patch('multiprocessing.Pool', InlinePool):
+            self.cmd('dump_crl', path, all=True, base=True, digest=['sha256', 'sha512'],
+                     processes=4, stdout=BytesIO(), stderr=BytesIO())
+            self.cmd('dump_crl', path, all=True, delta=True, processes=4, stdout=BytesIO(),
+                     stderr=BytesIO())
+
+        for name, crl_number in [('base-sha256', 1), ('base-sha512', 1), ('delta-sha512', 2)]:
+            with open(os.path.join(ca_path, '%s.json' % name)) as stream:
+                self.assertEqual(json.load(stream)['crl_number'], crl_number)
+        with open(os.path.join(ca_path, 'delta-sha512.pem'), 'rb') as stream:
+            self.assertEqual(self.load_crl(stream.read()), (2, 1, []))
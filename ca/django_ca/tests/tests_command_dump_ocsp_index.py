@@ -17,15 +17,23 @@ import os
 
 from datetime import timedelta
 
+from mock import patch
+
+from django.core.management.base import CommandError
 from django.utils import timezone
 
 from .. import ca_settings
 from ..models import Certificate
 from ..ocsp import date_format
+from ..utils import format_date
 from .base import DjangoCAWithCertTestCase
 from .base import override_tmpcadir
 
 
+class StopWatch(Exception):
+    pass
+
+
 @override_tmpcadir(CA_MIN_KEY_SIZE=1024, CA_PROFILES={}, CA_DEFAULT_SUBJECT={})
 class OCSPIndexTestCase(DjangoCAWithCertTestCase):
     def line(self, cert):
@@ -41,12 +49,12 @@ class OCSPIndexTestCase(DjangoCAWithCertTestCase):
         else:
             status = 'V'
 
-        return '%s\t%s\t%s\t%s\tunknown\t%s' % (
+        return '%s\t%s\t%s\t%s\tunknown\t/CN=%s' % (
             status,
-            cert.x509.get_notAfter().decode('utf-8'),
+            format_date(cert.expires),
             revocation,
             cert.serial.replace(':', ''),
-            cert.distinguishedName(),
+            cert.cn,
         )
 
     def test_basic(self):
@@ -64,6 +72,50 @@ class OCSPIndexTestCase(DjangoCAWithCertTestCase):
         with open(path) as stream:
             self.assertEqual(stream.read(), '%s\n' % self.line(self.cert))
 
+    def test_unchanged(self):
+        path = os.path.join(ca_settings.CA_DIR, 'ocsp-index.txt')
+        self.cmd('dump_ocsp_index', path)
+        inode = os.stat(path).st_ino
+
+        # file is not replaced if the index did not change
+        self.cmd('dump_ocsp_index', path)
+        self.assertEqual(os.stat(path).st_ino, inode)
+        self.assertEqual(os.listdir(ca_settings.CA_DIR), ['ocsp-index.txt'])
+
+        cert = Certificate.objects.get(serial=self.cert.serial)
+        cert.revoke()
+        self.cmd('dump_ocsp_index', path)
+        self.assertNotEqual(os.stat(path).st_ino, inode)
+        with open(path) as stream:
+            self.assertEqual(stream.read(), '%s\n' % self.line(cert))
+
+    def test_watch(self):
+        path = os.path.join(ca_settings.CA_DIR, 'ocsp-index.txt')
+        cert = Certificate.objects.get(serial=self.cert.serial)
+        inodes = []
+
+        def sleep(seconds):
+            inodes.append(os.stat(path).st_ino)
+            if len(inodes) == 1:
+                # nothing changes after the first update
+                self.assertEqual(seconds, 30)
+            elif len(inodes) == 2:
+                self.assertEqual(inodes[0], inodes[1])
+                cert.revoke()
+            else:
+                raise StopWatch()
+
+        with patch('time.sleep', side_effect=sleep), self.assertRaises(StopWatch):
+            self.cmd('dump_ocsp_index', path, watch=True, interval=30)
+
+        self.assertNotEqual(inodes[1], inodes[2])
+        with open(path) as stream:
+            self.assertEqual(stream.read(), '%s\n' % self.line(cert))
+
+    def test_watch_stdout(self):
+        with self.assertRaisesRegex(CommandError, r'^--watch requires a path\.$'):
+            self.cmd('dump_ocsp_index', watch=True)
+
     def test_expired(self):
         cert = Certificate.objects.get(serial=self.cert.serial)
         cert.expires = timezone.now() - timedelta(days=3)
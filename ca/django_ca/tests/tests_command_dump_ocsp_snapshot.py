@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>
+
+import os
+
+from django.core.management.base import CommandError
+
+from .. import ca_settings
+from ..models import Certificate
+from ..ocsp import RevocationSnapshot
+from .base import DjangoCAWithCertTestCase
+from .base import override_tmpcadir
+
+
+@override_tmpcadir()
+class DumpOCSPSnapshotTestCase(DjangoCAWithCertTestCase):
+    def test_basic(self):
+        path = os.path.join(ca_settings.CA_DIR, 'snapshot')
+        stdout, stderr = self.cmd('dump_ocsp_snapshot', path)
+        self.assertEqual(stdout, '')
+        self.assertEqual(stderr, '')
+        self.assertEqual(os.listdir(ca_settings.CA_DIR), ['snapshot'])  # no temporary files
+
+        snapshot = RevocationSnapshot(path)
+        self.assertEqual(snapshot.count, 1)
+        self.assertEqual(snapshot.ca_serial, self.ca.serial)
+        self.assertEqual(snapshot.get([self.cert.serial, '12:34']),
+                         {self.cert.serial: ('good', None)})
+
+        cert = Certificate.objects.get(serial=self.cert.serial)
+        cert.revoke('keyCompromise')
+        self.cmd('dump_ocsp_snapshot', path)
+
+        # the old snapshot still works, the new one contains the revoked certificate
+        self.assertEqual(snapshot.get([cert.serial]), {cert.serial: ('good', None)})
+        status, revoked_date = RevocationSnapshot(path).get([cert.serial])[cert.serial]
+        self.assertEqual(status, 'key_compromise')
+        self.assertEqual(revoked_date, cert.revoked_date.replace(microsecond=0))
+
+    def test_lookup(self):
+        serials = ['01', 'A:BC', '0A:BD', '12:34', 'FF:FF:FF:FF']
+        for i, serial in enumerate(serials):
+            Certificate.objects.create(ca=self.ca, csr='none', pub=self.cert.pub, cn='cert%s' % i,
+                                       expires=self.cert.expires, serial=serial)
+
+        path = os.path.join(ca_settings.CA_DIR, 'snapshot')
+        self.cmd('dump_ocsp_snapshot', path)
+        snapshot = RevocationSnapshot(path)
+        self.assertEqual(snapshot.count, 6)
+
+        expected = {s: ('good', None) for s in serials + [self.cert.serial]}
+        self.assertEqual(snapshot.get(expected), expected)
+        self.assertEqual(snapshot.get(['00', '02', 'A:BB', 'FF:FF:FF:FF:FF']), {})
+
+        # records are merged from several sorted chunks
+        with open(path, 'wb') as stream:
+            RevocationSnapshot.write(self.ca, stream, chunk_size=2)
+        snapshot = RevocationSnapshot(path)
+        self.assertEqual(snapshot.count, 6)
+        self.assertEqual(snapshot.get(expected), expected)
+        records = [snapshot.mmap[snapshot.offset + i * RevocationSnapshot.record.size:
+                                 snapshot.offset + (i + 1) * RevocationSnapshot.record.size]
+                   for i in range(snapshot.count)]
+        self.assertEqual(records, sorted(records))
+
+    def test_errors(self):
+        path = os.path.join(ca_settings.CA_DIR, 'missing', 'snapshot')
+        with self.assertRaises(CommandError):
+            self.cmd('dump_ocsp_snapshot', path)
+
+        path = os.path.join(ca_settings.CA_DIR, 'snapshot')
+        with open(path, 'wb') as stream:
+            stream.write(RevocationSnapshot.magic)
+        with self.assertRaisesRegex(ValueError, r'Not a revocation snapshot\.$'):
+            RevocationSnapshot(path)
+
+        # serials longer than 20 bytes do not fit into a record
+        serial = ':'.join(['AB'] * 21)
+        Certificate.objects.create(ca=self.ca, csr='none', pub=self.cert.pub, cn='long',
+                                   expires=self.cert.expires, serial=serial)
+        with self.assertRaisesRegex(CommandError, r'Serial is longer than 20 bytes\.$'):
+            self.cmd('dump_ocsp_snapshot', path)
+        self.assertEqual(os.listdir(ca_settings.CA_DIR), ['snapshot'])  # no temporary files
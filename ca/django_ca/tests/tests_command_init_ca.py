@@ -13,6 +13,8 @@
 # You should have received a copy of the GNU General Public License along with django-ca.  If not,
 # see <http://www.gnu.org/licenses/>.
 
+from OpenSSL import crypto
+
 from django.core.management.base import CommandError
 from django.utils import six
 
@@ -65,6 +67,21 @@ class InitCATest(DjangoCATestCase):
         self.assertEqual(ca.crl_url, 'http://crl.example.com')
         self.assertEqual(ca.ocsp_url, 'http://ocsp.example.com')
 
+    @override_tmpcadir(CA_MIN_KEY_SIZE=1024)
+    def test_ec(self):
+        out, err = self.init_ca(algorithm='sha256', key_type='EC')
+        self.assertEqual(out, '')
+        self.assertEqual(err, '')
+
+        ca = CertificateAuthority.objects.first()
+        self.assertEqual(ca.x509.get_signature_algorithm(), six.b('ecdsa-with-SHA256'))
+        self.assertEqual(ca.key.type(), crypto.TYPE_EC)
+        self.assertEqual(ca.key.bits(), 256)
+
+        out, err = self.init_ca(name='Test CA 2', key_type='EC', ecc_curve='P-384')
+        ca = CertificateAuthority.objects.get(name='Test CA 2')
+        self.assertEqual(ca.key.bits(), 384)
+
     @override_tmpcadir(CA_MIN_KEY_SIZE=1024)
     def test_no_pathlen(self):
         out, err = self.init_ca(pathlen=False)
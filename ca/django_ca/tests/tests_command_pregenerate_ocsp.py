@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>
+
+import binascii
+import os
+import shutil
+import tempfile
+
+from asn1crypto import x509
+from asn1crypto.ocsp import OCSPResponse
+from mock import patch
+from OpenSSL import crypto
+
+from django.core.cache import cache
+from django.core.management.base import CommandError
+
+from ..models import Certificate
+from ..ocsp import _responder_contexts
+from ..ocsp import get_cert_id
+from ..utils import get_ocsp_cache_key
+from ..views import OCSPView
+from .base import DjangoCAWithCertTestCase
+from .base import fixtures_dir
+from .base import ocsp_pubkey
+from .base import ocsp_serial
+from .base import override_tmpcadir
+
+ocsp_key_path = os.path.join(fixtures_dir, 'ocsp.key')
+
+
+class StopWorker(Exception):
+    pass
+
+
+@override_tmpcadir(CA_MIN_KEY_SIZE=1024, CA_PROFILES={}, CA_DEFAULT_SUBJECT={})
+class PregenerateOCSPTestCase(DjangoCAWithCertTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super(PregenerateOCSPTestCase, cls).setUpClass()
+        cls.ocsp_cert = cls.load_cert(ca=cls.ca, x509=ocsp_pubkey)
+
+    def setUp(self):
+        super(PregenerateOCSPTestCase, self).setUp()
+        _responder_contexts.clear()
+        cache.clear()
+
+    def pregenerate(self, *args, **kwargs):
+        return self.cmd('pregenerate_ocsp', '--responder-key=%s' % ocsp_key_path,
+                        '--responder-cert=%s' % ocsp_serial, *args, **kwargs)
+
+    def get_cache_key(self, cert, status='good', revoked_date=None, expires=OCSPView.expires):
+        return get_ocsp_cache_key(self.ca.serial, cert.serial, status, revoked_date,
+                                  int(ocsp_serial.replace(':', ''), 16), expires)
+
+    def assertResponse(self, der, cert, status='good'):
+        ca_cert = x509.Certificate.load(
+            crypto.dump_certificate(crypto.FILETYPE_ASN1, self.ca.x509))
+        response = OCSPResponse.load(der)
+        self.assertEqual(response['response_status'].native, 'successful')
+
+        single = response.basic_ocsp_response['tbs_response_data']['responses'][0]
+        self.assertEqual(single['cert_id'].dump(), get_cert_id(ca_cert, cert.serial).dump())
+        self.assertEqual(single['cert_status'].name, status)
+        return single
+
+    def test_cache(self):
+        stdout, stderr = self.pregenerate('--processes=1')
+        self.assertEqual(stdout, '')
+        self.assertEqual(stderr, '')
+
+        for cert in [self.cert, self.ocsp_cert]:
+            der = cache.get(self.get_cache_key(cert))
+            self.assertResponse(der, cert)
+
+        # with default parameters, responses are used by views with default parameters
+        self.assertIsNone(cache.get(self.get_cache_key(self.cert, expires=3600)))
+
+        # responses are only used by views with the same parameters
+        cache.clear()
+        self.pregenerate('--processes=1', '--expires=3600')
+        self.assertResponse(cache.get(self.get_cache_key(self.cert, expires=3600)), self.cert)
+        self.assertIsNone(cache.get(self.get_cache_key(self.cert)))
+
+    def test_path(self):
+        path = tempfile.mkdtemp()
+        try:
+            self.pregenerate('--processes=2', '--path=%s' % path)
+            ca_cert = x509.Certificate.load(
+                crypto.dump_certificate(crypto.FILETYPE_ASN1, self.ca.x509))
+
+            files = sorted(os.listdir(path))
+            expected = sorted('%s.der' % binascii.hexlify(get_cert_id(ca_cert, c.serial).dump())
+                              .decode('utf-8') for c in [self.cert, self.ocsp_cert])
+            self.assertEqual(files, expected)
+
+            with open(os.path.join(path, expected[0]), 'rb') as stream:
+                self.assertEqual(OCSPResponse.load(stream.read())['response_status'].native,
+                                 'successful')
+        finally:
+            shutil.rmtree(path)
+
+        self.assertIsNone(cache.get(self.get_cache_key(self.cert)))
+
+    def test_worker(self):
+        cert = Certificate.objects.get(serial=self.cert.serial)
+        passes = []
+
+        def sleep(seconds):
+            # revoke a certificate after the first pass and stop after the second one
+            if passes:
+                raise StopWorker()
+            passes.append(seconds)
+            cert.revoke('keyCompromise')
+
+        with patch('time.sleep', side_effect=sleep), self.assertRaises(StopWorker):
+            self.pregenerate('--processes=1', '--worker', '--interval=30')
+        self.assertEqual(passes, [30])
+
+        # the worker generated the response for the new status immediately
+        cert = Certificate.objects.get(pk=cert.pk)
+        der = cache.get(self.get_cache_key(cert, 'key_compromise', cert.revoked_date))
+        self.assertResponse(der, cert, status='revoked')
+
+    def test_errors(self):
+        with self.assertRaisesRegex(CommandError, r'^2.0: --refresh must be between 0 and 1\.$'):
+            self.pregenerate('--refresh=2')
+
+        path = os.path.join(fixtures_dir, 'does-not-exist')
+        with self.assertRaisesRegex(CommandError, r'Not a directory\.$'):
+            self.pregenerate('--path=%s' % path)
+
+        with self.assertRaisesRegex(CommandError, r'Could not read private key\.$'):
+            self.cmd('pregenerate_ocsp', '--responder-key=%s' % path,
+                     '--responder-cert=%s' % ocsp_serial)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>
+
+from datetime import timedelta
+
+from django.utils import timezone
+
+from ..models import Certificate
+from .base import DjangoCAWithCertTestCase
+from .base import override_tmpcadir
+
+
+@override_tmpcadir(CA_MIN_KEY_SIZE=1024, CA_PROFILES={}, CA_DEFAULT_SUBJECT={})
+class UpdateCertStatusTestCase(DjangoCAWithCertTestCase):
+    def test_basic(self):
+        cert = Certificate.objects.get(serial=self.cert.serial)
+        self.assertEqual(cert.status, 'valid')
+        self.assertEqual(list(Certificate.objects.valid()), [cert])
+
+        stdout, stderr = self.cmd('update_cert_status', verbosity=2)
+        self.assertEqual(stdout, 'Marked 0 certificate(s) as expired.\n')
+        self.assertEqual(stderr, '')
+
+        # the certificate expires without being saved
+        Certificate.objects.filter(pk=cert.pk).update(expires=timezone.now() - timedelta(days=1))
+        self.assertEqual(list(Certificate.objects.valid()), [])
+        self.assertEqual(list(Certificate.objects.expired()), [cert])
+
+        stdout, stderr = self.cmd('update_cert_status', verbosity=2)
+        self.assertEqual(stdout, 'Marked 1 certificate(s) as expired.\n')
+        cert = Certificate.objects.get(pk=cert.pk)
+        self.assertEqual(cert.status, 'expired')
+        self.assertEqual(list(Certificate.objects.expired()), [cert])
+
+        # revoked certificates are never expired
+        cert.revoke()
+        cert = Certificate.objects.get(pk=cert.pk)
+        self.assertEqual(cert.status, 'revoked')
+        self.assertEqual(list(Certificate.objects.expired()), [])
+        self.assertEqual(list(Certificate.objects.revoked()), [cert])
+        self.assertEqual(Certificate.objects.update_status(), 0)
+
+        # the revoked flag decides, even if the certificate was revoked without being saved
+        Certificate.objects.filter(pk=cert.pk).update(status='valid', revoked=False)
+        Certificate.objects.filter(pk=cert.pk).update(
+            revoked=True, expires=timezone.now() + timedelta(days=1))
+        self.assertEqual(list(Certificate.objects.valid()), [])
+        self.assertEqual(list(Certificate.objects.revoked()), [cert])
+        self.assertEqual(Certificate.objects.update_status(), 1)
+        self.assertEqual(Certificate.objects.get(pk=cert.pk).status, 'revoked')
+
+        stdout, stderr = self.cmd('update_cert_status')
+        self.assertEqual((stdout, stderr), ('', ''))
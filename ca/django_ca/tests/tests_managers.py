@@ -13,10 +13,14 @@
 # You should have received a copy of the GNU General Public License along with django-ca.  If not,
 # see <http://www.gnu.org/licenses/>.
 
+from OpenSSL import crypto
+
+from ..crl import get_crl
 from ..models import Certificate
 from ..models import CertificateAuthority
 from ..utils import get_cert_profile_kwargs
 from .base import DjangoCAWithCSRTestCase
+from .base import override_settings
 from .base import override_tmpcadir
 
 
@@ -184,6 +188,28 @@ class GetCertTestCase(DjangoCAWithCSRTestCase):
             ca.crl_url.splitlines())
         self.assertEqual(self.get_extensions(cert)['crlDistributionPoints'], expected)
 
+    @override_settings(CA_CRL_SHARDS=4)
+    def test_crl_shards(self):
+        ca = CertificateAuthority.objects.first()
+        ca.crl_url = 'http://crl.example.com\nhttp://crl.example.com/{shards}/{shard}/'
+
+        kwargs = get_cert_profile_kwargs()
+        cert = Certificate.objects.init(
+            ca, self.csr_pem, expires=720, algorithm='sha256', subjectAltName=['example.com'],
+            **kwargs)
+        shard = cert.get_serial_number() % 4
+        expected = '\nFull Name:\n  URI:http://crl.example.com/4/%s/\n\n' \
+            'Full Name:\n  URI:http://crl.example.com\n' % shard
+        self.assertEqual(self.get_extensions(cert)['crlDistributionPoints'], expected)
+
+        # shard URLs are not added if shards are disabled
+        with override_settings(CA_CRL_SHARDS=None):
+            cert = Certificate.objects.init(
+                ca, self.csr_pem, expires=720, algorithm='sha256', subjectAltName=['example.com'],
+                **kwargs)
+        self.assertEqual(self.get_extensions(cert)['crlDistributionPoints'],
+                         '\nFull Name:\n  URI:http://crl.example.com\n')
+
     def test_issuer_alt_name(self):
         ca = CertificateAuthority.objects.first()
         ca.issuer_alt_name = 'http://ian.example.com'
@@ -225,3 +251,30 @@ class GetCertTestCase(DjangoCAWithCSRTestCase):
 
         self.assertEqual(self.get_extensions(cert)['authorityInfoAccess'],
                          'CA Issuers - URI:%s\n' % ca.issuer_url)
+
+    def test_ec(self):
+        ca = CertificateAuthority.objects.init(
+            name='EC CA', key_size=None, key_type='EC', ecc_curve='P-384', algorithm='sha384',
+            expires=720, parent=None, pathlen=0, subject={'CN': 'ec.example.com'})
+        self.assertEqual(ca.x509.get_signature_algorithm(), b'ecdsa-with-SHA384')
+
+        # sign a certificate with an EC public key
+        key, csr = self.create_csr(key_type='EC')
+        csr_pem = crypto.dump_certificate_request(crypto.FILETYPE_PEM, csr).decode('utf-8')
+        cert = self.create_cert(ca, csr_pem, {'CN': 'example.com'})
+        self.assertEqual(cert.x509.get_signature_algorithm(), b'ecdsa-with-SHA256')
+        self.assertEqual(cert.x509.get_pubkey().type(), crypto.TYPE_EC)
+
+        # CRLs are signed with the EC key as well
+        cert.revoke()
+        crl = crypto.load_crl(crypto.FILETYPE_PEM, get_crl(ca, digest=b'sha256'))
+        self.assertEqual([r.get_serial() for r in crl.get_revoked()],
+                         [cert.serial.replace(':', '').encode('utf-8')])
+        self.assertTrue(crl.to_cryptography().is_signature_valid(
+            ca.x509.get_pubkey().to_cryptography_key()))
+
+        with self.assertRaisesRegex(RuntimeError, r'^P-192: Unknown elliptic curve\.$'):
+            CertificateAuthority.objects.init(
+                name='EC CA 2', key_size=None, key_type='EC', ecc_curve='P-192',
+                algorithm='sha384', expires=720, parent=None, pathlen=0,
+                subject={'CN': 'ec2.example.com'})
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+from django.conf.urls import url
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test import Client
+from django.test import TestCase
+
+from .. import metrics
+from ..metrics import Counter
+from ..metrics import Gauge
+from ..metrics import Histogram
+from ..metrics import Registry
+from ..views import CertificateRevocationListView
+from ..views import MetricsView
+from .base import DjangoCAWithCertTestCase
+from .base import override_settings
+from .base import override_tmpcadir
+
+urlpatterns = [
+    url(r'^crl/(?P<serial>[0-9A-F:]+)/$', CertificateRevocationListView.as_view(), name='crl'),
+    url(r'^metrics/$', MetricsView.as_view(), name='metrics'),
+]
+
+
+class MetricsTestCase(TestCase):
+    def test_counter(self):
+        counter = Counter('test_total', 'Test counter.', ['status'])
+        counter.inc(status='good')
+        counter.inc(2, status='good')
+        counter.inc(status='bad"')
+        self.assertEqual(counter.render(), [
+            '# HELP test_total Test counter.',
+            '# TYPE test_total counter',
+            'test_total{status="bad\\""} 1.0',
+            'test_total{status="good"} 3.0',
+        ])
+
+        with self.assertRaisesRegex(ValueError, r'^test_total: Invalid labels: other$'):
+            counter.inc(other='foo')
+
+    def test_gauge(self):
+        gauge = Gauge('test', 'Test gauge.')
+        gauge.set(3)
+        gauge.set(2)
+        self.assertEqual(gauge.render()[2:], ['test 2.0'])
+
+    def test_histogram(self):
+        histogram = Histogram('test_seconds', 'Test histogram.', buckets=[0.1, 1])
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        self.assertEqual(histogram.render(), [
+            '# HELP test_seconds Test histogram.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{le="0.1"} 1.0',
+            'test_seconds_bucket{le="1.0"} 2.0',
+            'test_seconds_bucket{le="+Inf"} 3.0',
+            'test_seconds_sum 5.55',
+            'test_seconds_count 3.0',
+        ])
+
+        with histogram.time():
+            pass
+        self.assertEqual(histogram.values[()][0], [2, 3, 4])
+
+    def test_registry(self):
+        registry = Registry()
+        registry.register(Gauge('test', 'Test gauge.')).set(1)
+        self.assertEqual(registry.render(),
+                         '# HELP test Test gauge.\n# TYPE test gauge\ntest 1.0\n')
+
+        with override_settings(CA_SIGNING_PROCESSES=1):
+            self.assertNotIn('django_ca_signing_pool', registry.render())  # pool not created yet
+
+
+@override_tmpcadir(ROOT_URLCONF=__name__, CA_MIN_KEY_SIZE=1024)
+class MetricsViewTestCase(DjangoCAWithCertTestCase):
+    def setUp(self):
+        super(MetricsViewTestCase, self).setUp()
+        self.client = Client()
+        cache.clear()
+
+    def test_crl(self):
+        hits = metrics.CRL_CACHE.values.get(('hit', ), 0)
+        misses = metrics.CRL_CACHE.values.get(('miss', ), 0)
+
+        url = reverse('crl', kwargs={'serial': self.ca.serial})
+        crl = self.client.get(url).content
+        self.client.get(url)
+        self.assertEqual(metrics.CRL_CACHE.values[('hit', )], hits + 1)
+        self.assertEqual(metrics.CRL_CACHE.values[('miss', )], misses + 1)
+        self.assertEqual(metrics.CRL_SIZE_BYTES.values[(self.ca.serial, )], len(crl))
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        content = response.content.decode('utf-8')
+        self.assertIn('\ndjango_ca_crl_cache_total{result="hit"} %s\n' % float(hits + 1), content)
+        self.assertIn('\ndjango_ca_crl_size_bytes{ca="%s"} %s\n' % (self.ca.serial,
+                                                                   float(len(crl))), content)
+        self.assertIn('\n# TYPE django_ca_crl_generation_seconds histogram\n', content)
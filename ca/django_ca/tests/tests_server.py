@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>
+
+import base64
+import logging
+import os
+import socket
+import unittest
+
+from asn1crypto.ocsp import OCSPResponse
+from OpenSSL import crypto
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.six.moves.urllib.parse import quote
+
+from ..ocsp import _responder_contexts
+from .base import DjangoCAWithCertTestCase
+from .base import fixtures_dir
+from .base import ocsp_pubkey
+from .base import ocsp_serial
+from .base import override_settings
+from .base import override_tmpcadir
+
+try:
+    import asyncio
+    from concurrent.futures import Future
+    from ..server import Responder
+    from ..server import create_server
+except ImportError:  # pragma: no cover
+    asyncio = None
+
+ocsp_key_path = os.path.join(fixtures_dir, 'ocsp.key')
+with open(os.path.join(fixtures_dir, 'ocsp', 'req1'), 'rb') as stream:
+    req1 = stream.read()
+
+
+class InlineExecutor(object):
+    """Executor that runs functions immediately, so that tests see the test database."""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+# CRL code complains about 512 bit keys
+@unittest.skipIf(asyncio is None, 'asyncio is not available.')
+@override_tmpcadir(CA_MIN_KEY_SIZE=1024)
+class ServerTestCase(DjangoCAWithCertTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super(ServerTestCase, cls).setUpClass()
+        logging.disable(logging.CRITICAL)
+        cls.ocsp_cert = cls.load_cert(ca=cls.ca, x509=ocsp_pubkey)
+
+    def setUp(self):
+        super(ServerTestCase, self).setUp()
+        _responder_contexts.clear()
+        cache.clear()
+        self.responder = Responder(ocsp_urls={
+            'root': {
+                'ca': self.ca.serial,
+                'responder_key': ocsp_key_path,
+                'responder_cert': ocsp_serial,
+            },
+        }, crl=True, prefix='/django_ca/')
+
+    def assertOCSP(self, response, status='successful'):
+        self.assertEqual(response[0], 200)
+        self.assertEqual(dict(response[1])['Content-Type'], 'application/ocsp-response')
+        self.assertEqual(OCSPResponse.load(response[2])['response_status'].native, status)
+
+    def test_ocsp(self):
+        response = self.responder.handle('POST', '/django_ca/ocsp/root/', req1)
+        self.assertOCSP(response)
+        self.assertNotIn('ETag', dict(response[1]))
+
+        data = quote(base64.b64encode(req1).decode('utf-8'))
+        response = self.responder.handle('GET', '/django_ca/ocsp/root/%s' % data, b'')
+        self.assertOCSP(response)
+        self.assertIn('ETag', dict(response[1]))
+
+        response = self.responder.handle('GET', '/django_ca/ocsp/root/abc', b'')
+        self.assertOCSP(response, status='malformed_request')
+
+    def test_crl(self):
+        response = self.responder.handle('GET', '/django_ca/crl/%s/?foo=bar' % self.ca.serial, b'')
+        self.assertEqual(response[0], 200)
+        headers = dict(response[1])
+        self.assertEqual(headers['Content-Type'], 'application/pkix-crl')
+        crl = crypto.load_crl(crypto.FILETYPE_ASN1, response[2])
+        self.assertIsNone(crl.get_revoked())
+
+        # conditional requests
+        response = self.responder.handle('GET', '/django_ca/crl/%s/' % self.ca.serial, b'',
+                                         {'if-none-match': headers['ETag']})
+        self.assertEqual(response[0], 304)
+        self.assertEqual(response[2], b'')
+        self.assertEqual(dict(response[1])['ETag'], headers['ETag'])
+
+        self.assertEqual(self.responder.handle('GET', '/django_ca/crl/AB:CD/', b'')[0], 404)
+
+        # delta CRLs require a base CRL
+        self.assertEqual(self.responder.handle(
+            'GET', '/django_ca/crl/%s/delta/' % self.ca.serial, b'')[0], 404)
+        self.assertEqual(self.responder.handle(
+            'GET', '/django_ca/crl/%s/base/' % self.ca.serial, b'')[0], 200)
+        self.assertEqual(self.responder.handle(
+            'GET', '/django_ca/crl/%s/delta/' % self.ca.serial, b'')[0], 200)
+
+        # CRL shards require a CRL URL with a shard placeholder and CA_CRL_SHARDS
+        self.assertEqual(self.responder.handle(
+            'GET', '/django_ca/crl/%s/shard/4/1/' % self.ca.serial, b'')[0], 404)
+        self.ca.crl_url = 'http://crl.example.com/{shards}/{shard}/'
+        self.ca.save()
+        self.assertEqual(self.responder.handle(
+            'GET', '/django_ca/crl/%s/shard/4/1/' % self.ca.serial, b'')[0], 404)
+        with override_settings(CA_CRL_SHARDS=4):
+            self.assertEqual(self.responder.handle(
+                'GET', '/django_ca/crl/%s/shard/4/1/' % self.ca.serial, b'')[0], 200)
+            self.assertEqual(self.responder.handle(
+                'GET', '/django_ca/crl/%s/shard/8/1/' % self.ca.serial, b'')[0], 404)
+
+    def test_metrics(self):
+        self.assertEqual(self.responder.handle('GET', '/django_ca/metrics/', b'')[0], 404)
+
+        responder = Responder(ocsp_urls={}, metrics=True)
+        response = responder.handle('GET', '/metrics/', b'')
+        self.assertEqual(response[0], 200)
+        self.assertIn(b'\n# TYPE django_ca_ocsp_phase_seconds histogram\n', response[2])
+        self.assertEqual(responder.handle('POST', '/metrics/', b'')[0], 405)
+
+    def test_errors(self):
+        self.assertEqual(self.responder.handle('GET', '/django_ca/ocsp/root/', b'')[0], 405)
+        self.assertEqual(self.responder.handle('POST', '/django_ca/ocsp/root/abc', b'')[0], 405)
+        self.assertEqual(self.responder.handle('POST', '/django_ca/crl/AB/', b'')[0], 405)
+        self.assertEqual(self.responder.handle('POST', '/django_ca/ocsp/other/', b'')[0], 404)
+        self.assertEqual(self.responder.handle('GET', '/other/', b'')[0], 404)
+
+        responder = Responder(ocsp_urls={}, crl=False)
+        self.assertEqual(responder.handle('GET', '/crl/%s/' % self.ca.serial, b'')[0], 404)
+
+        with self.assertRaisesRegex(ImproperlyConfigured, r'^root: Invalid parameter'):
+            Responder(ocsp_urls={'root': {'wrong': True}})
+
+    def test_server(self):
+        loop = asyncio.new_event_loop()
+        try:
+            server = loop.run_until_complete(create_server(
+                self.responder, '127.0.0.1', 0, loop=loop, executor=InlineExecutor()))
+            port = server.sockets[0].getsockname()[1]
+
+            def client():
+                # send two pipelined keep-alive requests, the second one closes the connection
+                sock = socket.create_connection(('127.0.0.1', port))
+                sock.sendall(
+                    b'POST /django_ca/ocsp/root/ HTTP/1.1\r\n' +
+                    ('Content-Length: %s\r\n\r\n' % len(req1)).encode('utf-8') + req1 +
+                    b'GET /django_ca/wrong/ HTTP/1.1\r\nConnection: close\r\n\r\n')
+                data = b''
+                while True:
+                    chunk = sock.recv(65536)
+                    if not chunk:
+                        break
+                    data += chunk
+                sock.close()
+                return data
+
+            data = loop.run_until_complete(loop.run_in_executor(None, client))
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+        finally:
+            loop.close()
+
+        head, rest = data.split(b'\r\n\r\n', 1)
+        self.assertTrue(head.startswith(b'HTTP/1.1 200 OK\r\n'))
+        self.assertIn(b'Content-Type: application/ocsp-response', head)
+        length = int(head.split(b'Content-Length: ')[1].split(b'\r\n')[0])
+        self.assertEqual(OCSPResponse.load(rest[:length])['response_status'].native,
+                         'successful')
+
+        head, body = rest[length:].split(b'\r\n\r\n', 1)
+        self.assertTrue(head.startswith(b'HTTP/1.1 404 Not Found\r\n'))
+        self.assertIn(b'Connection: close', head)
+        self.assertEqual(body, b'Not Found')
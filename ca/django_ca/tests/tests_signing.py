@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>
+
+import os
+import shutil
+import tempfile
+import time
+
+from datetime import datetime
+from datetime import timedelta
+from io import BytesIO
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import dsa
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from OpenSSL import crypto
+from oscrypto import asymmetric
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.encoding import force_bytes
+
+from ..signing import SigningPool
+from ..signing import SigningQueueFull
+from ..signing import SigningTimeout
+from ..signing import build_crl
+from ..signing import can_write_crl
+from ..signing import export_crl
+from ..signing import get_signing_pool
+from ..signing import sign
+from ..signing import write_crl
+from .base import DjangoCATestCase
+from .base import fixtures_dir
+from .base import ocsp_pem
+from .base import override_settings
+from .base import root_pem
+
+ocsp_key_path = os.path.join(fixtures_dir, 'ocsp.key')
+root_key_path = os.path.join(fixtures_dir, 'root.key')
+
+
+class SigningTestCase(DjangoCATestCase):
+    def assertSignature(self, signature, data):
+        cert = asymmetric.load_certificate(ocsp_pem)
+        asymmetric.rsa_pkcs1v15_verify(cert, signature, data, 'sha256')  # raises on error
+
+    def test_sign(self):
+        self.assertSignature(sign(ocsp_key_path, b'foo', 'sha256'), b'foo')
+
+    def test_export_crl(self):
+        revoked = [(b'ABCD', b'keyCompromise', b'20170101120000Z'), (b'0123', None,
+                                                                     b'20170102120000Z')]
+        crl = crypto.load_crl(crypto.FILETYPE_PEM, export_crl(root_pem, root_key_path, revoked,
+                                                              digest=b'sha256'))
+        self.assertEqual([(r.get_serial(), r.get_reason()) for r in crl.get_revoked()],
+                         [(b'ABCD', b'Key Compromise'), (b'0123', None)])
+
+    def assertWriteCRL(self, ca_pem, key_path, revoked, next_update, digest, **kwargs):
+        # The streamed CRL is identical to the CRL built by cryptography, except for the signature
+        this_update = datetime(2017, 6, 1, 12)
+        args = (ca_pem, key_path, revoked, this_update, next_update, digest)
+        stream = BytesIO()
+        write_crl(stream, *args, **kwargs)
+        crl = x509.load_der_x509_crl(stream.getvalue(), default_backend())
+        expected = x509.load_der_x509_crl(build_crl(*args, **kwargs), default_backend())
+        self.assertEqual(crl.tbs_certlist_bytes, expected.tbs_certlist_bytes)
+        self.assertEqual(crl.signature_algorithm_oid, expected.signature_algorithm_oid)
+
+        ca_cert = x509.load_pem_x509_certificate(ca_pem, default_backend())
+        self.assertTrue(crl.is_signature_valid(ca_cert.public_key()))
+        return crl
+
+    def test_write_crl(self):
+        ca_pem = force_bytes(root_pem)
+        revoked = [('ABCD', 'keyCompromise', datetime(2017, 1, 1, 12)),
+                   ('0123', None, datetime(2017, 1, 2, 12)),
+                   ('FF', 'CACompromise', datetime(2017, 1, 3, 12))]
+        next_update = datetime(2017, 6, 2, 12)
+        crl = self.assertWriteCRL(ca_pem, root_key_path, revoked, next_update, 'sha256',
+                                  crl_number=1)
+        self.assertEqual([r.serial_number for r in crl], [0xABCD, 0x123, 0xFF])
+
+        self.assertWriteCRL(ca_pem, root_key_path, [], next_update, 'sha512', crl_number=2,
+                            delta_crl_indicator=1)
+
+        # GeneralizedTime after 2049 and long lists
+        revoked = [('%X' % i, 'superseded' if i % 2 else None, datetime(2017, 1, 1, 12))
+                   for i in range(1, 3000)]
+        self.assertWriteCRL(ca_pem, root_key_path, revoked, datetime(2050, 1, 1), 'sha512',
+                            crl_number=1000000)
+
+    def test_can_write_crl(self):
+        self.assertTrue(can_write_crl(root_key_path, 'sha512'))
+        self.assertFalse(can_write_crl(root_key_path, 'foo'))
+
+        # asn1crypto does not know sha384 or sha512 with DSA
+        key = dsa.generate_private_key(1024, default_backend())
+        tmpdir = tempfile.mkdtemp()
+        try:
+            key_path = os.path.join(tmpdir, 'dsa.key')
+            with open(key_path, 'wb') as stream:
+                stream.write(key.private_bytes(serialization.Encoding.PEM,
+                                               serialization.PrivateFormat.PKCS8,
+                                               serialization.NoEncryption()))
+            self.assertTrue(can_write_crl(key_path, 'sha256'))
+            self.assertFalse(can_write_crl(key_path, 'sha512'))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_write_crl_ec(self):
+        backend = default_backend()
+        key = ec.generate_private_key(ec.SECP256R1(), backend)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'example.com')])
+        now = datetime.utcnow()
+        cert = x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(
+            key.public_key()).serial_number(1).not_valid_before(now).not_valid_after(
+            now + timedelta(days=1)).sign(key, hashes.SHA256(), backend)
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            key_path = os.path.join(tmpdir, 'ec.key')
+            with open(key_path, 'wb') as stream:
+                stream.write(key.private_bytes(serialization.Encoding.PEM,
+                                               serialization.PrivateFormat.PKCS8,
+                                               serialization.NoEncryption()))
+            self.assertWriteCRL(cert.public_bytes(serialization.Encoding.PEM), key_path,
+                                [('01', None, datetime(2017, 1, 1))], datetime(2017, 6, 2),
+                                'sha384', crl_number=1)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_pool(self):
+        pool = SigningPool(1, 10)
+        try:
+            self.assertSignature(pool.sign(ocsp_key_path, b'foo', 'sha256'), b'foo')
+            self.assertEqual(pool.processes, 1)
+
+            crl = pool.export_crl(root_pem, root_key_path, [], digest=b'sha256')
+            self.assertIsNone(crypto.load_crl(crypto.FILETYPE_PEM, crl).get_revoked())
+
+            with self.assertRaises(IOError):
+                pool.sign('/does-not-exist', b'foo', 'sha256')
+
+            stats = pool.get_stats()
+            self.assertGreater(stats.pop('seconds'), 0)
+            self.assertEqual(stats, {'processes': 1, 'max_pending': 10, 'pending': 0,
+                                     'submitted': 3, 'rejected': 0, 'failed': 1})
+        finally:
+            pool.close()
+
+    def test_queue_full(self):
+        pool = SigningPool(1, 0)
+        try:
+            with self.assertRaisesRegex(SigningQueueFull, r'^0 signing requests are pending\.$'):
+                pool.sign(ocsp_key_path, b'foo', 'sha256')
+            self.assertEqual(pool.get_stats()['rejected'], 1)
+        finally:
+            pool.close()
+
+    def test_timeout(self):
+        pool = SigningPool(1, 10, timeout=0.1)
+        try:
+            with self.assertRaisesRegex(SigningTimeout, r'did not finish within 0\.1 seconds\.$'):
+                pool.apply(time.sleep, 2)
+            stats = pool.get_stats()
+            self.assertEqual((stats['pending'], stats['failed']), (0, 1))
+        finally:
+            pool.close()
+
+    def test_get_signing_pool(self):
+        self.addCleanup(self.close_signing_pool)
+        self.assertIsNone(get_signing_pool())
+
+        with override_settings(CA_SIGNING_PROCESSES=1):
+            pool = get_signing_pool()
+            self.assertEqual(pool.processes, 1)
+            self.assertEqual(pool.max_pending, 100)
+            self.assertEqual(pool.timeout, 30)
+            self.assertIs(get_signing_pool(), pool)
+
+        with override_settings(CA_SIGNING_PROCESSES=1, CA_SIGNING_QUEUE_SIZE=5):
+            new_pool = get_signing_pool()
+            self.assertIsNot(new_pool, pool)
+            self.assertEqual(new_pool.max_pending, 5)
+
+        with override_settings(CA_SIGNING_PROCESSES=0):
+            with self.assertRaisesRegex(ImproperlyConfigured, r'must be at least 1\.$'):
+                get_signing_pool()
@@ -19,6 +19,8 @@ from django_ca.utils import parse_subject
 from django_ca.utils import sort_subject_dict
 from django_ca.utils import get_basic_cert
 from django_ca.utils import get_cert_profile_kwargs
+from django_ca.utils import get_crl_shard
+from django_ca.utils import get_crl_shard_urls
 from django_ca.utils import is_power2
 from django_ca.utils import parse_date
 from django_ca.utils import get_subjectAltName
@@ -236,6 +238,21 @@ class GetCertProfileKwargsTestCase(DjangoCATestCase):
             self.assertEqual(get_cert_profile_kwargs('testprofile'), expected)
 
 
+class CRLShardTestCase(TestCase):
+    def test_shard(self):
+        self.assertEqual(get_crl_shard(10, 4), 2)
+        self.assertEqual(get_crl_shard('0A', 4), 2)
+        self.assertEqual(get_crl_shard('01:0A', 4), 2)
+        self.assertEqual(get_crl_shard('01:0A', 1), 0)
+
+    def test_urls(self):
+        self.assertEqual(get_crl_shard_urls(None, 4, 1), [])
+        self.assertEqual(get_crl_shard_urls('http://crl.example.com', 4, 1), [])
+
+        crl_url = 'http://crl.example.com\nhttp://crl.example.org/{shards}/{shard}.crl'
+        self.assertEqual(get_crl_shard_urls(crl_url, 4, 1), ['http://crl.example.org/4/1.crl'])
+
+
 class GetSubjectAltNamesTest(TestCase):
     def test_basic(self):
         self.assertEqual(get_subjectAltName(['https://example.com']), b'URI:https://example.com')
@@ -13,21 +13,39 @@
 # You should have received a copy of the GNU General Public License along with django-ca.  If not,
 # see <http://www.gnu.org/licenses/>.
 
+import calendar
+import json
+import os
 import re
+import time
 
 import dateparser
 
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+
+from mock import patch
+
 from OpenSSL import crypto
 
 from django.conf.urls import url
 from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
 from django.core.urlresolvers import reverse
 from django.test import Client
+from django.utils import timezone
 from django.utils.encoding import force_text
+from django.utils.http import http_date
+from django.utils.http import parse_http_date
 
+from .. import ca_settings
+from .. import metrics
 from ..views import CertificateRevocationListView
+from ..views import single_flight
 from ..models import Certificate
+from ..utils import get_crl_shard
 from .base import DjangoCAWithCertTestCase
+from .base import override_settings
 from .base import override_tmpcadir
 
 urlpatterns = [
@@ -41,14 +59,35 @@ urlpatterns = [
             type=crypto.FILETYPE_TEXT,
         ), 
         name='advanced'),
+    url(r'^refresh/(?P<serial>[0-9A-F:]+)/$',
+        CertificateRevocationListView.as_view(refresh=0.5, expires=10), name='refresh'),
+    url(r'^base/(?P<serial>[0-9A-F:]+)/$', CertificateRevocationListView.as_view(scope='base'),
+        name='base'),
+    url(r'^base-pem/(?P<serial>[0-9A-F:]+)/$',
+        CertificateRevocationListView.as_view(scope='base', type=crypto.FILETYPE_PEM),
+        name='base-pem'),
+    url(r'^delta/(?P<serial>[0-9A-F:]+)/$', CertificateRevocationListView.as_view(scope='delta'),
+        name='delta'),
+    url(r'^shard/(?P<serial>[0-9A-F:]+)/(?P<shards>[0-9]+)/(?P<shard>[0-9]+)/$',
+        CertificateRevocationListView.as_view(scope='shard'), name='shard'),
 ]
 
+
+class InlineThread(object):
+    def __init__(self, target):
+        self.target = target
+
+    def start(self):
+        self.target()
+
+
 # CRL code complains about 512 bit keys
 @override_tmpcadir(ROOT_URLCONF=__name__, CA_MIN_KEY_SIZE=1024)
 class GenericCRLViewTests(DjangoCAWithCertTestCase):
     def setUp(self):
         self.client = Client()
         super(GenericCRLViewTests, self).setUp()
+        cache.clear()
 
     def test_basic(self):
         # test the default view
@@ -59,9 +98,9 @@ class GenericCRLViewTests(DjangoCAWithCertTestCase):
         self.assertEqual(response['Content-Type'], 'application/pkix-crl')
         self.assertIsNone(crl.get_revoked())
 
-        # revoke a certificate
-        cert = Certificate.objects.get(serial=self.cert.serial)
-        cert.revoke()
+        # revoke a certificate without calling revoke()
+        Certificate.objects.filter(serial=self.cert.serial).update(
+            revoked=True, revoked_date=timezone.now())
 
         # fetch again - we should see a cached response
         response = self.client.get(reverse('default', kwargs={'serial': self.ca.serial}))
@@ -78,6 +117,302 @@ class GenericCRLViewTests(DjangoCAWithCertTestCase):
         crl = crypto.load_crl(crypto.FILETYPE_ASN1, response.content)
         self.assertEqual(len(crl.get_revoked()), 1)
 
+    def test_conditional(self):
+        url = reverse('default', kwargs={'serial': self.ca.serial})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        crl = x509.load_der_x509_crl(response.content, default_backend())
+        self.assertAlmostEqual(parse_http_date(response['Last-Modified']),
+                               calendar.timegm(crl.last_update.utctimetuple()), delta=1)
+        self.assertAlmostEqual(parse_http_date(response['Expires']),
+                               calendar.timegm(crl.next_update.utctimetuple()), delta=1)
+        self.assertIn(response['Cache-Control'], [
+            'max-age=%s, public, no-transform, must-revalidate' % age for age in (599, 600)])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"foo", %s' % etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        # If-Modified-Since is ignored if If-None-Match is present
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"foo"',
+                                   HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() - 3600))
+        self.assertEqual(response.status_code, 200)
+
+        # a new CRL has a new ETag
+        Certificate.objects.get(serial=self.cert.serial).revoke()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_revoke(self):
+        url = reverse('default', kwargs={'serial': self.ca.serial})
+        crl = crypto.load_crl(crypto.FILETYPE_ASN1, self.client.get(url).content)
+        self.assertIsNone(crl.get_revoked())
+
+        # revoke() invalidates cached CRLs
+        cert = Certificate.objects.get(serial=self.cert.serial)
+        cert.revoke()
+        crl = crypto.load_crl(crypto.FILETYPE_ASN1, self.client.get(url).content)
+        self.assertEqual(len(crl.get_revoked()), 1)
+
+    def test_refresh(self):
+        url = reverse('refresh', kwargs={'serial': self.ca.serial})
+        crl = crypto.load_crl(crypto.FILETYPE_ASN1, self.client.get(url).content)
+        self.assertIsNone(crl.get_revoked())
+        cert = Certificate.objects.get(serial=self.cert.serial)
+        cert.revoke()
+
+        # the outdated CRL is served while a new one is generated in the background
+        stale = metrics.CRL_CACHE.values.get(('stale', ), 0)
+        with patch('django_ca.views.threading.Thread', InlineThread):
+            crl = crypto.load_crl(crypto.FILETYPE_ASN1, self.client.get(url).content)
+        self.assertIsNone(crl.get_revoked())
+        self.assertEqual(metrics.CRL_CACHE.values[('stale', )], stale + 1)
+
+        crl = crypto.load_crl(crypto.FILETYPE_ASN1, self.client.get(url).content)
+        self.assertEqual(len(crl.get_revoked()), 1)
+
+        # CRLs are also regenerated after the given fraction of expires
+        with patch('time.time', return_value=time.time() + 6), \
+                patch('django_ca.views.threading.Thread') as thread:
+            self.client.get(url)
+        thread.return_value.start.assert_called_once_with()
+
+    def test_lock(self):
+        url = reverse('default', kwargs={'serial': self.ca.serial})
+        cache_key = 'crl_%s_%s_sha512' % (self.ca.serial, crypto.FILETYPE_ASN1)
+        crl = self.client.get(url).content
+        cache.clear()
+
+        # another process is generating the CRL, so we wait for it to appear in the cache
+        def sleep(seconds):
+            cache.set(cache_key, (b'other', time.time(), 'etag'))
+
+        with patch('django_ca.views.cache.add', return_value=False), \
+                patch('django_ca.views.time.sleep', side_effect=sleep) as sleep_mock:
+            self.assertEqual(self.client.get(url).content, b'other')
+        sleep_mock.assert_called_once_with(0.1)
+
+        # if the new CRL does not appear, the CRL is generated anyway
+        cache.clear()
+        with patch('django_ca.views.cache.add', return_value=False), \
+                patch.object(CertificateRevocationListView, 'lock_wait', 0):
+            self.assertEqual(self.client.get(url).content, crl)
+
+        # the previous CRL is served while another process regenerates it
+        Certificate.objects.get(serial=self.cert.serial).revoke()
+        with patch('django_ca.views.cache.add', return_value=False):
+            self.assertEqual(self.client.get(url).content, crl)
+        crl = crypto.load_crl(crypto.FILETYPE_ASN1, self.client.get(url).content)
+        self.assertEqual(len(crl.get_revoked()), 1)
+
+        # the lock is released after the CRL was generated
+        self.assertIsNone(cache.get('%s_lock' % cache_key))
+
+        # a lock taken over by another process (e.g. because ours expired) is not released
+        def generate():
+            cache.set('%s_lock' % cache_key, 'other-token')
+            return b'generated'
+
+        self.assertEqual(single_flight(cache_key, generate), b'generated')
+        self.assertEqual(cache.get('%s_lock' % cache_key), 'other-token')
+
+    def test_signing_pool(self):
+        self.addCleanup(self.close_signing_pool)
+        cert = Certificate.objects.get(serial=self.cert.serial)
+        cert.revoke('keyCompromise')
+
+        with override_settings(CA_SIGNING_PROCESSES=1):
+            response = self.client.get(reverse('default', kwargs={'serial': self.ca.serial}))
+            self.assertEqual(response.status_code, 200)
+            crl = crypto.load_crl(crypto.FILETYPE_ASN1, response.content)
+            self.assertEqual([r.get_serial() for r in crl.get_revoked()],
+                             [cert.serial.replace(':', '').encode('utf-8')])
+
+        cache.clear()
+        with override_settings(CA_SIGNING_PROCESSES=1, CA_SIGNING_QUEUE_SIZE=0):
+            response = self.client.get(reverse('default', kwargs={'serial': self.ca.serial}))
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '1')
+
+    def test_queries(self):
+        # one query for the CA and one for revoked certificates, no matter how many certificates
+        url = reverse('default', kwargs={'serial': self.ca.serial})
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_delta(self):
+        delta_url = reverse('delta', kwargs={'serial': self.ca.serial})
+        self.assertEqual(self.client.get(delta_url).status_code, 404)  # no base CRL yet
+
+        response = self.client.get(reverse('base', kwargs={'serial': self.ca.serial}))
+        self.assertEqual(response.status_code, 200)
+        crl = x509.load_der_x509_crl(response.content, default_backend())
+        ext = crl.extensions.get_extension_for_class(x509.CRLNumber)
+        self.assertEqual(ext.value.crl_number, 1)
+        with self.assertRaises(x509.ExtensionNotFound):
+            crl.extensions.get_extension_for_class(x509.FreshestCRL)
+
+        response = self.client.get(delta_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pkix-crl')
+        crl = x509.load_der_x509_crl(response.content, default_backend())
+        ext = crl.extensions.get_extension_for_class(x509.CRLNumber)
+        self.assertEqual(ext.value.crl_number, 2)
+        ext = crl.extensions.get_extension_for_class(x509.DeltaCRLIndicator)
+        self.assertTrue(ext.critical)
+        self.assertEqual(ext.value.crl_number, 1)
+
+        # delta CRLs are cached too
+        self.assertEqual(self.client.get(delta_url).content, response.content)
+
+    def test_delta_base_number(self):
+        kwargs = {'serial': self.ca.serial}
+
+        def get_numbers(name, load=x509.load_der_x509_crl):
+            crl = load(self.client.get(reverse(name, kwargs=kwargs)).content, default_backend())
+            number = crl.extensions.get_extension_for_class(x509.CRLNumber).value.crl_number
+            try:
+                ext = crl.extensions.get_extension_for_class(x509.DeltaCRLIndicator)
+                return number, ext.value.crl_number
+            except x509.ExtensionNotFound:
+                return number, None
+
+        # DER and PEM base CRLs (and base CRLs of other processes) all match the delta CRL
+        self.assertEqual(get_numbers('base'), (1, None))
+        self.assertEqual(get_numbers('delta'), (2, 1))
+        self.assertEqual(get_numbers('base-pem', x509.load_pem_x509_crl), (1, None))
+        cache.clear()
+        self.assertEqual(get_numbers('base'), (1, None))
+        self.assertEqual(get_numbers('delta'), (3, 1))
+
+    @override_settings(CA_CRL_DELTA_URL='http://crl.example.com/{serial}/delta/')
+    def test_freshest_crl(self):
+        cache.clear()
+        response = self.client.get(reverse('base', kwargs={'serial': self.ca.serial}))
+        crl = x509.load_der_x509_crl(response.content, default_backend())
+        ext = crl.extensions.get_extension_for_class(x509.FreshestCRL)
+        self.assertFalse(ext.critical)
+        self.assertEqual([dp.full_name for dp in ext.value], [[
+            x509.UniformResourceIdentifier('http://crl.example.com/%s/delta/' % self.ca.serial)]])
+
+        # delta CRLs do not point to themselves
+        response = self.client.get(reverse('delta', kwargs={'serial': self.ca.serial}))
+        crl = x509.load_der_x509_crl(response.content, default_backend())
+        with self.assertRaises(x509.ExtensionNotFound):
+            crl.extensions.get_extension_for_class(x509.FreshestCRL)
+
+    @override_settings(CA_CRL_SHARDS=4)
+    def test_shard(self):
+        kwargs = {'serial': self.ca.serial, 'shards': 4}
+        # the CA has no CRL URL with a shard placeholder
+        response = self.client.get(reverse('shard', kwargs=dict(kwargs, shard=0)))
+        self.assertEqual(response.status_code, 404)
+
+        self.ca.crl_url = 'http://crl.example.com\nhttp://crl.example.com/{shards}/{shard}/'
+        self.ca.save()
+        Certificate.objects.get(serial=self.cert.serial).revoke()
+        shard = get_crl_shard(self.cert.serial, 4)
+
+        for i in range(4):
+            response = self.client.get(reverse('shard', kwargs=dict(kwargs, shard=i)))
+            self.assertEqual(response.status_code, 200)
+            crl = x509.load_der_x509_crl(response.content, default_backend())
+            self.assertEqual(len(crl), 1 if i == shard else 0)
+
+            ext = crl.extensions.get_extension_for_class(x509.IssuingDistributionPoint)
+            self.assertTrue(ext.critical)
+            self.assertEqual(ext.value.full_name, [
+                x509.UniformResourceIdentifier('http://crl.example.com/4/%s/' % i)])
+            self.assertTrue(ext.value.only_contains_user_certs)
+
+        response = self.client.get(reverse('shard', kwargs=dict(kwargs, shard=4)))
+        self.assertEqual(response.status_code, 404)
+
+        # only shards of the current configuration are served
+        response = self.client.get(reverse('shard', kwargs=dict(kwargs, shards=8, shard=1)))
+        self.assertEqual(response.status_code, 404)
+        with override_settings(CA_CRL_SHARDS=None):
+            response = self.client.get(reverse('shard', kwargs=dict(kwargs, shard=1)))
+            self.assertEqual(response.status_code, 404)
+
+    def test_crl_dir(self):
+        crl_dir = os.path.join(ca_settings.CA_DIR, 'crl')
+        url = reverse('default', kwargs={'serial': self.ca.serial})
+        path = os.path.join(crl_dir, self.ca.serial.replace(':', ''), 'full-sha512')
+
+        with override_settings(CA_CRL_DIR=crl_dir):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/pkix-crl')
+            der = b''.join(response.streaming_content)
+            self.assertIsNone(crypto.load_crl(crypto.FILETYPE_ASN1, der).get_revoked())
+
+            with open('%s.der' % path, 'rb') as stream:
+                self.assertEqual(stream.read(), der)
+            with open('%s.pem' % path, 'rb') as stream:
+                crl = crypto.load_crl(crypto.FILETYPE_PEM, stream.read())
+            self.assertIsNone(crl.get_revoked())
+            with open('%s.json' % path) as stream:
+                metadata = json.load(stream)
+            self.assertEqual(metadata['size'], len(der))
+            self.assertIsNone(metadata['crl_number'])
+
+            self.assertEqual(response['ETag'], '"%s-der"' % metadata['sha256'])
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+            # the stored CRL is used as long as it is valid
+            Certificate.objects.filter(serial=self.cert.serial).update(
+                revoked=True, revoked_date=timezone.now())
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertEqual(b''.join(response.streaming_content), der)
+
+            # expired CRLs are regenerated
+            metadata['next_update'] = '20000101000000Z'
+            with open('%s.json' % path, 'w') as stream:
+                json.dump(metadata, stream)
+            response = self.client.get(url)
+            crl = crypto.load_crl(crypto.FILETYPE_ASN1, b''.join(response.streaming_content))
+            self.assertEqual(len(crl.get_revoked()), 1)
+
+            # revoke() also regenerates stored CRLs
+            self.assertIsNone(crl.get_revoked()[0].get_reason())
+            Certificate.objects.get(serial=self.cert.serial).revoke('keyCompromise')
+            response = self.client.get(url)
+            crl = crypto.load_crl(crypto.FILETYPE_ASN1, b''.join(response.streaming_content))
+            self.assertEqual(crl.get_revoked()[0].get_reason(), b'Key Compromise')
+
+        with override_settings(CA_CRL_DIR=crl_dir, CA_CRL_SENDFILE='X-Accel-Redirect',
+                               CA_CRL_SENDFILE_PREFIX='/crl-files/'):
+            response = self.client.get(url)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response['X-Accel-Redirect'], '/crl-files/%s/full-sha512.der' %
+                             self.ca.serial.replace(':', ''))
+
+        with override_settings(CA_CRL_DIR=crl_dir, CA_CRL_SENDFILE='X-Sendfile'):
+            response = self.client.get(url)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response['X-Sendfile'], '%s.der' % path)
+
+        with override_settings(CA_CRL_DIR=crl_dir, CA_CRL_SENDFILE='X-Accel-Redirect'):
+            with self.assertRaisesRegex(ImproperlyConfigured, r'^CA_CRL_SENDFILE_PREFIX'):
+                self.client.get(url)
+
+        # TEXT CRLs are not stored
+        with override_settings(CA_CRL_DIR=crl_dir):
+            response = self.client.get(reverse('advanced', kwargs={'serial': self.ca.serial}))
+            self.assertIn('Certificate Revocation List', force_text(response.content))
+
     def test_overwrite(self):
         response = self.client.get(reverse('advanced', kwargs={'serial': self.ca.serial}))
         self.assertEqual(response.status_code, 200)
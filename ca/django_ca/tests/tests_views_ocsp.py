@@ -14,34 +14,59 @@
 # see <http://www.gnu.org/licenses/>
 
 import base64
+import calendar
+import hashlib
 import logging
 import os
+import re
+import shutil
+import tempfile
 
 from datetime import timedelta
 
 import asn1crypto
+from mock import patch
+from OpenSSL import crypto
 from oscrypto import asymmetric
 
 from django.conf.urls import url
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
 from django.core.urlresolvers import reverse
+from django.db import DatabaseError
 from django.test import Client
+from django.utils.http import http_date
 
+from .. import metrics
 from ..models import Certificate
-from ..models import CertificateAuthority
+from ..utils import get_ocsp_cache_key
 from ..utils import serial_from_int
+from ..ocsp import _responder_contexts
+from ..ocsp import _revocation_indexes
+from ..ocsp import _revocation_snapshots
+from ..ocsp import RevocationSnapshot
+from ..ocsp import get_cert_id
+from ..ocsp import get_issuer_index
+from ..ocsp import get_revocation_index
+from ..views import MultiCAOCSPView
 from ..views import OCSPView
 from .base import DjangoCAWithCertTestCase
+from .base import cert2_pubkey
+from .base import child_pubkey
 from .base import fixtures_dir
 from .base import ocsp_pem
 from .base import ocsp_pubkey
 from .base import ocsp_serial
 from .base import override_settings
+from .base import root_pem
 from .base import root_serial
 
 
 #openssl ocsp -issuer django_ca/tests/fixtures/root.pem -serial 123  \
 #        -reqout django_ca/tests/fixtures/ocsp/unknown-serial -resp_text
+#openssl ocsp -issuer django_ca/tests/fixtures/root.pem \
+#        -cert django_ca/tests/fixtures/cert1.pem -cert django_ca/tests/fixtures/cert2.pem \
+#        -reqout django_ca/tests/fixtures/ocsp/multiple-known
 def _load_req(req):
     path = os.path.join(fixtures_dir, 'ocsp', req)
     with open(path, 'rb') as stream:
@@ -52,6 +77,8 @@ req1_nonce = b'\xedf\x00S\xbef\x16Y\xcc\xe9\xe9\xa3\x08\xf7\xc2\xda'
 no_nonce_req = _load_req('req-no-nonce')
 unknown_req = _load_req('unknown-serial')
 multiple_req = _load_req('multiple-serial')
+multiple_known_req = _load_req('multiple-known')
+multiple_known_nonce = b'V\xa5M\x00p\xcd\xb6\xb4\xe6#\xa2\xe5\xa92\xd2\xc9'
 
 ocsp_key_path = os.path.join(fixtures_dir, 'ocsp.key')
 urlpatterns = [
@@ -68,6 +95,30 @@ urlpatterns = [
         responder_cert=ocsp_serial,
     ), name='get'),
 
+    url(r'^ocsp-bucket/(?P<data>[a-zA-Z0-9=+/]+)$', OCSPView.as_view(
+        ca=root_serial,
+        responder_key=ocsp_key_path,
+        responder_cert=ocsp_serial,
+        this_update_bucket=300,
+        cache_margin=None,
+    ), name='bucket'),
+
+    url(r'^ocsp-index/$', OCSPView.as_view(
+        ca=root_serial,
+        responder_key=ocsp_key_path,
+        responder_cert=ocsp_serial,
+        index_refresh=60,
+    ), name='index'),
+
+    url(r'^ocsp-multi/$', MultiCAOCSPView.as_view(
+        responders={
+            root_serial: {'responder_key': ocsp_key_path, 'responder_cert': ocsp_serial},
+        },
+    ), name='multi'),
+
+    url(r'^ocsp-multi-self/$', MultiCAOCSPView.as_view(use_ca_key=True), name='multi-self'),
+    url(r'^ocsp-multi-none/$', MultiCAOCSPView.as_view(), name='multi-none'),
+
     url(r'^ocsp-unknown/(?P<data>[a-zA-Z0-9=+/]+)$', OCSPView.as_view(
         ca='unknown',
         responder_key=ocsp_key_path,
@@ -98,6 +149,15 @@ class OCSPTestView(DjangoCAWithCertTestCase):
         # used for verifying signatures
         cls.ocsp_private_key = asymmetric.load_private_key(ocsp_key_path)
 
+    def setUp(self):
+        super(OCSPTestView, self).setUp()
+
+        # contexts and indexes cache the CA, which is different in every test class
+        _responder_contexts.clear()
+        _revocation_indexes.clear()
+        _revocation_snapshots.clear()
+        get_issuer_index().last_refresh = None
+
     def assertAlmostEqualDate(self, got, expected):
         # Sometimes next_update timestamps are of by a second or so, so we test
         # if they are just close
@@ -254,23 +314,414 @@ class OCSPTestView(DjangoCAWithCertTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertOCSP(response, requested=[self.cert], nonce=req1_nonce, expires=1200)
 
+    def test_cached(self):
+        cache.clear()
+        response = self.client.post(reverse('post'), no_nonce_req,
+                                    content_type='application/ocsp-request')
+        self.assertEqual(response.status_code, 200)
+        self.assertOCSP(response, requested=[self.cert], expires=1200)
+
+        # the response is cached only for views with the same parameters
+        responder_serial = int(ocsp_serial.replace(':', ''), 16)
+        self.assertIsNotNone(cache.get(get_ocsp_cache_key(
+            self.ca.serial, self.cert.serial, 'good', None, responder_serial, 1200)))
+        self.assertIsNone(cache.get(get_ocsp_cache_key(
+            self.ca.serial, self.cert.serial, 'good', None, responder_serial, 600)))
+
+        # the second response is served from the cache, so it is exactly the same
+        cached = self.client.post(reverse('post'), no_nonce_req,
+                                  content_type='application/ocsp-request')
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(cached.content, response.content)
+
+        # requests with a nonce are never served from the cache
+        response = self.client.post(reverse('post'), req1, content_type='application/ocsp-request')
+        self.assertEqual(response.status_code, 200)
+        self.assertOCSP(response, requested=[self.cert], nonce=req1_nonce, expires=1200)
+
+        # after revoking the certificate, the cached response is no longer used
+        cert = Certificate.objects.get(pk=self.cert.pk)
+        cert.revoke()
+        response = self.client.post(reverse('post'), no_nonce_req,
+                                    content_type='application/ocsp-request')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.content, cached.content)
+        self.assertOCSP(response, requested=[self.cert], expires=1200)
+
+    def test_lock(self):
+        cache.clear()
+        response = self.client.post(reverse('post'), no_nonce_req,
+                                    content_type='application/ocsp-request')
+        self.assertEqual(response.status_code, 200)
+        cache_key = get_ocsp_cache_key(self.ca.serial, self.cert.serial, 'good', None,
+                                       int(ocsp_serial.replace(':', ''), 16), 1200)
+        self.assertIsNotNone(cache.get(cache_key))
+        cache.clear()
+
+        # another process is signing the same response, so we wait for it to appear in the cache
+        def sleep(seconds):
+            cache.set(cache_key, response.content)
+
+        with patch('django_ca.views.cache.add', return_value=False), \
+                patch('django_ca.views.time.sleep', side_effect=sleep) as sleep_mock:
+            cached = self.client.post(reverse('post'), no_nonce_req,
+                                      content_type='application/ocsp-request')
+        self.assertEqual(cached.content, response.content)
+        sleep_mock.assert_called_once_with(0.1)
+
+        # if the response does not appear, it is signed anyway
+        cache.clear()
+        with patch('django_ca.views.cache.add', return_value=False), \
+                patch.object(OCSPView, 'lock_wait', 0):
+            signed = self.client.post(reverse('post'), no_nonce_req,
+                                      content_type='application/ocsp-request')
+        self.assertEqual(signed.status_code, 200)
+        self.assertOCSP(signed, requested=[self.cert], expires=1200)
+        self.assertIsNone(cache.get('%s_lock' % cache_key))
+
+    def test_http_cache_headers(self):
+        cache.clear()
+        data = base64.b64encode(no_nonce_req).decode('utf-8')
+        response = self.client.get(reverse('get', kwargs={'data': data}))
+        self.assertEqual(response.status_code, 200)
+        self.assertOCSP(response, requested=[self.cert])
+
+        ocsp_response = asn1crypto.ocsp.OCSPResponse.load(response.content)
+        tbs_response_data = ocsp_response['response_bytes']['response'].parsed['tbs_response_data']
+        single = tbs_response_data['responses'][0]
+        this_update = calendar.timegm(single['this_update'].native.utctimetuple())
+        next_update = calendar.timegm(single['next_update'].native.utctimetuple())
+
+        self.assertEqual(response['ETag'], '"%s"' % hashlib.sha1(response.content).hexdigest())
+        self.assertEqual(response['Last-Modified'], http_date(this_update))
+        self.assertEqual(response['Expires'], http_date(next_update))
+        max_age = int(re.match('max-age=([0-9]+), public, no-transform, must-revalidate$',
+                               response['Cache-Control']).group(1))
+        self.assertTrue(590 <= max_age <= 600)
+
+        # POST requests and failed requests don't get any cache headers
+        response = self.client.post(reverse('post'), no_nonce_req,
+                                    content_type='application/ocsp-request')
+        self.assertFalse(response.has_header('ETag'))
+        data = base64.b64encode(unknown_req).decode('utf-8')
+        response = self.client.get(reverse('get', kwargs={'data': data}))
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_this_update_bucket(self):
+        data = base64.b64encode(no_nonce_req).decode('utf-8')
+        response = self.client.get(reverse('bucket', kwargs={'data': data}))
+        self.assertEqual(response.status_code, 200)
+
+        ocsp_response = asn1crypto.ocsp.OCSPResponse.load(response.content)
+        tbs_response_data = ocsp_response['response_bytes']['response'].parsed['tbs_response_data']
+        this_update = tbs_response_data['responses'][0]['this_update'].native
+        self.assertEqual(calendar.timegm(this_update.utctimetuple()) % 300, 0)
+        self.assertEqual(tbs_response_data['produced_at'].native, this_update)
+
+        # Responses are not cached, but still identical
+        response2 = self.client.get(reverse('bucket', kwargs={'data': data}))
+        self.assertEqual(response.content, response2.content)
+        self.assertEqual(response['ETag'], response2['ETag'])
+
+        # responses would already have expired at the end of the bucket
+        msg = r'^this_update_bucket \(600\) must be smaller than expires \(600\)\.$'
+        with self.assertRaisesRegex(ImproperlyConfigured, msg):
+            OCSPView(ca=root_serial, responder_key=ocsp_key_path, responder_cert=ocsp_serial,
+                     this_update_bucket=600)
+
+    def test_index(self):
+        response = self.client.post(reverse('index'), req1,
+                                    content_type='application/ocsp-request')
+        self.assertEqual(response.status_code, 200)
+        self.assertOCSP(response, requested=[self.cert], nonce=req1_nonce)
+
+        index = get_revocation_index(self.ca)
+        self.assertEqual(index.statuses, {
+            self.cert.serial: ('good', None),
+            self.ocsp_cert.serial: ('good', None),
+        })
+
+        # revoke the certificate - the index is not refreshed yet
+        cert = Certificate.objects.get(pk=self.cert.pk)
+        cert.revoke('keyCompromise')
+        response = self.client.post(reverse('index'), req1,
+                                    content_type='application/ocsp-request')
+        ocsp_response = asn1crypto.ocsp.OCSPResponse.load(response.content)
+        single = ocsp_response['response_bytes']['response'].parsed['tbs_response_data']
+        self.assertIsNone(single['responses'][0]['cert_status'].native)
+
+        # refresh the index, now the certificate shows up as revoked
+        index.last_refresh = 0
+        response = self.client.post(reverse('index'), req1,
+                                    content_type='application/ocsp-request')
+        self.assertEqual(response.status_code, 200)
+        self.assertOCSP(response, requested=[cert], nonce=req1_nonce)
+        self.assertEqual(index.statuses[cert.serial][0], 'key_compromise')
+
+        # certificates that are not yet in the index are looked up in the database
+        cert2 = self.load_cert(ca=self.ca, x509=cert2_pubkey)
+        response = self.client.post(reverse('index'), multiple_known_req,
+                                    content_type='application/ocsp-request')
+        self.assertEqual(response.status_code, 200)
+        self.assertOCSP(response, requested=[cert, cert2], nonce=multiple_known_nonce)
+
+        # If the database is not available, the old data is used
+        index.last_refresh = 0
+        with patch('django_ca.ocsp.RevocationIndex.refresh', side_effect=DatabaseError('down')):
+            self.assertEqual(index.get([cert.serial], 60),
+                             {cert.serial: index.statuses[cert.serial]})
+        self.assertNotEqual(index.last_refresh, 0)
+
     def test_kwargs(self):
         # test kwargs to the view function
         view = OCSPView.as_view(ca=root_serial, responder_key=ocsp_key_path,
                                 responder_cert=ocsp_serial)
         kwargs = view.view_initkwargs
-        CertificateAuthority.objects.get(serial=kwargs['ca'])
-        self.assertEqual(kwargs['responder_cert'], ocsp_pem)
+        self.assertEqual(kwargs['responder_key'], ocsp_key_path)
+        self.assertEqual(kwargs['responder_cert'], ocsp_serial)
+
+        context = OCSPView(**kwargs).get_responder_context()
+        self.assertEqual(context.ca, self.ca)
+        self.assertEqual(context.ca_cert.asn1.dump(),
+                         asymmetric.load_certificate(root_pem).asn1.dump())
+        self.assertEqual(context.responder_cert.asn1.dump(),
+                         asymmetric.load_certificate(ocsp_pem).asn1.dump())
+
+        # the context is shared by all views with the same configuration
+        view = OCSPView(ca=root_serial, responder_key=ocsp_key_path, responder_cert=ocsp_serial)
+        self.assertIs(view.get_responder_context(), context)
+
+        # responder certificate can also be a path
+        view = OCSPView(ca=root_serial, responder_key=ocsp_key_path,
+                        responder_cert=os.path.join(fixtures_dir, 'ocsp.pem'))
+        self.assertEqual(view.get_responder_context().responder_cert.asn1.dump(),
+                         context.responder_cert.asn1.dump())
+
+    def test_reload(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            key_path = os.path.join(tmpdir, 'ocsp.key')
+            shutil.copy(ocsp_key_path, key_path)
+            view = OCSPView(ca=root_serial, responder_key=key_path, responder_cert=ocsp_serial)
+            context = view.get_responder_context()
+            self.assertIs(view.get_responder_context(), context)
+
+            # context is reloaded when the mtime of the key changes
+            os.utime(key_path, (0, context.key_mtime + 10))
+            new_context = view.get_responder_context()
+            self.assertIsNot(new_context, context)
+            self.assertIs(view.get_responder_context(), new_context)
+
+            # the old key is still used if the key is removed
+            os.remove(key_path)
+            self.assertIs(view.get_responder_context(), new_context)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_snapshot(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'snapshot')
+            with open(path, 'wb') as stream:
+                RevocationSnapshot.write(self.ca, stream)
+
+            view = OCSPView(ca=None, responder_key=ocsp_key_path,
+                            responder_cert=os.path.join(fixtures_dir, 'ocsp.pem'), snapshot=path,
+                            snapshot_refresh=0)
+            with self.assertNumQueries(0):
+                response = view.process_ocsp_request(req1)
+                self.assertEqual(view.process_ocsp_request(unknown_req).status_code, 200)
+            self.assertOCSP(response, requested=[self.cert], nonce=req1_nonce)
+            self.assertEqual(view.get_responder_context().ca_serial, self.ca.serial)
+
+            # revoke the certificate and replace the snapshot
+            cert = Certificate.objects.get(pk=self.cert.pk)
+            cert.revoke('keyCompromise')
+            with open('%s.tmp' % path, 'wb') as stream:
+                RevocationSnapshot.write(self.ca, stream)
+            os.rename('%s.tmp' % path, path)
+
+            with self.assertNumQueries(0):
+                response = view.process_ocsp_request(req1)
+            self.assertOCSP(response, requested=[cert], nonce=req1_nonce)
+
+            # the old snapshot is used if the new one is broken
+            snapshot = view.get_snapshot()
+            with open(path, 'wb') as stream:
+                stream.write(b'wrong')
+            self.assertIs(view.get_snapshot(), snapshot)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def get_request(self, *cert_ids):
+        return asn1crypto.ocsp.OCSPRequest({
+            'tbs_request': {'request_list': [{'req_cert': cert_id} for cert_id in cert_ids]},
+        }).dump()
+
+    def get_ocsp_response(self, http_response):
+        self.assertEqual(http_response.status_code, 200)
+        return asn1crypto.ocsp.OCSPResponse.load(http_response.content)
+
+    def test_multi_ca(self):
+        ca_cert = asymmetric.load_certificate(root_pem).asn1
+        for algo in ['sha1', 'sha256']:
+            req = self.get_request(get_cert_id(ca_cert, self.cert.serial, algo))
+            response = self.client.post(reverse('multi'), req,
+                                        content_type='application/ocsp-request')
+            self.assertOCSP(response, requested=[self.cert])
+
+            single = self.get_ocsp_response(response).basic_ocsp_response[
+                'tbs_response_data']['responses'][0]
+            self.assertEqual(single['cert_id'].dump(), get_cert_id(
+                ca_cert, self.cert.serial, algo).dump())
+
+        # CAs without a responder are not served by default
+        cache.clear()
+        req = self.get_request(get_cert_id(ca_cert, self.cert.serial))
+        response = self.get_ocsp_response(self.client.post(
+            reverse('multi-none'), req, content_type='application/ocsp-request'))
+        self.assertEqual(response['response_status'].native, 'unauthorized')
+
+        # ... but may sign responses themselves if enabled (the cache would return the response
+        # signed by the responder certificate)
+        response = self.get_ocsp_response(self.client.post(
+            reverse('multi-self'), req, content_type='application/ocsp-request'))
+        self.assertEqual(response['response_status'].native, 'successful')
+        self.assertEqual(response.basic_ocsp_response['certs'][0].dump(), ca_cert.dump())
+
+    def test_multi_ca_unauthorized(self):
+        ca_cert = asymmetric.load_certificate(root_pem).asn1
+        child = self.load_ca(name='child', x509=child_pubkey, parent=self.ca)
+        child_cert = asymmetric.load_certificate(child.pub.encode('utf-8')).asn1
+
+        # certificates from different CAs
+        req = self.get_request(get_cert_id(ca_cert, self.cert.serial),
+                               get_cert_id(child_cert, self.cert.serial))
+        response = self.client.post(reverse('multi'), req, content_type='application/ocsp-request')
+        self.assertEqual(self.get_ocsp_response(response)['response_status'].native,
+                         'unauthorized')
+
+        # unknown issuer
+        cert_id = get_cert_id(ca_cert, self.cert.serial)
+        cert_id['issuer_key_hash'] = b'x' * 20
+        response = self.client.post(reverse('multi'), self.get_request(cert_id),
+                                    content_type='application/ocsp-request')
+        self.assertEqual(self.get_ocsp_response(response)['response_status'].native,
+                         'unauthorized')
+
+        # disabled CAs are not served
+        child.enabled = False
+        child.save()
+        get_issuer_index().last_refresh = None
+        req = self.get_request(get_cert_id(child_cert, self.cert.serial))
+        response = self.client.post(reverse('multi'), req, content_type='application/ocsp-request')
+        self.assertEqual(self.get_ocsp_response(response)['response_status'].native,
+                         'unauthorized')
+
+    def test_foreign_issuer(self):
+        ca_cert = asymmetric.load_certificate(root_pem).asn1
+        child = self.load_ca(name='child', x509=child_pubkey, parent=self.ca)
+        child_cert = asymmetric.load_certificate(child.pub.encode('utf-8')).asn1
+        cache.clear()
+
+        # CertIDs naming another issuer are neither answered nor cached
+        for cert_id in [get_cert_id(child_cert, self.cert.serial),
+                        get_cert_id(ca_cert, self.cert.serial, 'sha256')]:
+            cert_id['issuer_key_hash'] = b'x' * len(cert_id['issuer_key_hash'].native)
+            with patch('django_ca.views.cache.set') as cache_set:
+                response = self.client.post(reverse('post'), self.get_request(cert_id),
+                                            content_type='application/ocsp-request')
+            self.assertEqual(self.get_ocsp_response(response)['response_status'].native,
+                             'unauthorized')
+            self.assertFalse(cache_set.called)
+
+        # a valid request for the same serial is still answered
+        response = self.client.post(reverse('post'),
+                                    self.get_request(get_cert_id(ca_cert, self.cert.serial)),
+                                    content_type='application/ocsp-request')
+        self.assertOCSP(response, requested=[self.cert], expires=1200)
+
+    def test_signing_pool(self):
+        self.addCleanup(self.close_signing_pool)
+        with override_settings(CA_SIGNING_PROCESSES=1):
+            response = self.client.post(reverse('post'), req1,
+                                        content_type='application/ocsp-request')
+            self.assertOCSP(response, requested=[self.cert], nonce=req1_nonce, expires=1200)
+
+        with override_settings(CA_SIGNING_PROCESSES=1, CA_SIGNING_QUEUE_SIZE=0):
+            response = self.client.post(reverse('post'), req1,
+                                        content_type='application/ocsp-request')
+            self.assertEqual(self.get_ocsp_response(response)['response_status'].native,
+                             'try_later')
+
+    def test_metrics(self):
+        def count(status):
+            return metrics.OCSP_RESPONSES.values.get((status, ), 0)
+
+        def phases():
+            return {k[0]: v[0][-1] for k, v in metrics.OCSP_PHASE_SECONDS.values.items()}
+
+        good, revoked, malformed = count('good'), count('revoked'), count('malformed_request')
+        before = phases()
+
+        self.client.post(reverse('post'), req1, content_type='application/ocsp-request')
+        self.client.post(reverse('post'), b'foo', content_type='application/ocsp-request')
+        cert = Certificate.objects.get(pk=self.cert.pk)
+        cert.revoke()
+        self.client.post(reverse('post'), req1, content_type='application/ocsp-request')
+
+        self.assertEqual(count('good'), good + 1)
+        self.assertEqual(count('revoked'), revoked + 1)
+        self.assertEqual(count('malformed_request'), malformed + 1)
+
+        after = phases()
+        self.assertEqual(after['parse'], before.get('parse', 0) + 3)
+        for phase in ['key_load', 'db', 'sign']:
+            self.assertEqual(after[phase], before.get(phase, 0) + 2)
+
+    def test_ec_responder(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            key, csr = self.create_csr(key_type='EC')
+            csr_pem = crypto.dump_certificate_request(crypto.FILETYPE_PEM, csr).decode('utf-8')
+            responder = self.create_cert(self.ca, csr_pem, {'CN': 'ocsp-ec.example.com'})
+            key_path = os.path.join(tmpdir, 'ocsp-ec.key')
+            with open(key_path, 'wb') as stream:
+                stream.write(crypto.dump_privatekey(crypto.FILETYPE_PEM, key))
+
+            view = OCSPView(ca=root_serial, responder_key=key_path,
+                            responder_cert=responder.serial)
+            response = self.get_ocsp_response(view.process_ocsp_request(req1))
+            basic_response = response.basic_ocsp_response
+            self.assertEqual(basic_response['signature_algorithm']['algorithm'].native,
+                             'sha256_ecdsa')
+
+            # raises an exception if the signature is invalid
+            asymmetric.ecdsa_verify(asymmetric.load_certificate(responder.pub.encode('utf-8')),
+                                    basic_response['signature'].native,
+                                    basic_response['tbs_response_data'].dump(), 'sha256')
+        finally:
+            shutil.rmtree(tmpdir)
 
     def test_bad_kwarg(self):
+        # no error is raised when the view is created
+        OCSPView.as_view(ca=root_serial, responder_key='/gone', responder_cert=ocsp_serial)
+
+        view = OCSPView(ca=root_serial, responder_key='/gone', responder_cert=ocsp_serial)
         with self.assertRaises(ImproperlyConfigured) as e:
-            OCSPView.as_view(ca=root_serial, responder_key='/gone', responder_cert=ocsp_serial)
+            view.get_responder_context()
         self.assertEqual(e.exception.args, ('/gone: Could not read private key.', ))
 
+        view = OCSPView(ca=root_serial, responder_key=ocsp_key_path, responder_cert='gone')
         with self.assertRaises(ImproperlyConfigured) as e:
-            OCSPView.as_view(ca=root_serial, responder_key=ocsp_key_path, responder_cert='gone')
+            view.get_responder_context()
         self.assertEqual(e.exception.args, ('gone: Could not read public key.', ))
 
+        view = OCSPView(ca='unknown', responder_key=ocsp_key_path, responder_cert=ocsp_serial)
+        with self.assertRaises(ImproperlyConfigured) as e:
+            view.get_responder_context()
+        self.assertEqual(e.exception.args, ('unknown: Unknown certificate authority.', ))
+
     def test_bad_ca(self):
         data = base64.b64encode(req1).decode('utf-8')
         response = self.client.get(reverse('unknown', kwargs={'data': data}))
@@ -293,8 +744,25 @@ class OCSPTestView(DjangoCAWithCertTestCase):
         self.assertEqual(ocsp_response['response_status'].native, 'malformed_request')
 
     def test_multiple(self):
+        # all serials are unknown
         data = base64.b64encode(multiple_req).decode('utf-8')
         response = self.client.get(reverse('get', kwargs={'data': data}))
         self.assertEqual(response.status_code, 200)
         ocsp_response = asn1crypto.ocsp.OCSPResponse.load(response.content)
-        self.assertEqual(ocsp_response['response_status'].native, 'malformed_request')
+        self.assertEqual(ocsp_response['response_status'].native, 'internal_error')
+
+    def test_multiple_known(self):
+        cert2 = self.load_cert(ca=self.ca, x509=cert2_pubkey)
+
+        data = base64.b64encode(multiple_known_req).decode('utf-8')
+        response = self.client.get(reverse('get', kwargs={'data': data}))
+        self.assertEqual(response.status_code, 200)
+        self.assertOCSP(response, requested=[self.cert, cert2], nonce=multiple_known_nonce)
+
+        # revoke one of the certificates
+        cert2.revoke('keyCompromise')
+        response = self.client.post(reverse('post'), multiple_known_req,
+                                    content_type='application/ocsp-request')
+        self.assertEqual(response.status_code, 200)
+        self.assertOCSP(response, requested=[self.cert, cert2], nonce=multiple_known_nonce,
+                        expires=1200)
@@ -28,11 +28,25 @@ CA_OCSP_URLS = getattr(settings, 'CA_OCSP_URLS', {})
 if ca_settings.CA_PROVIDE_GENERIC_CRL is True:  # pragma: no branch
     urlpatterns.append(
         url(r'^crl/(?P<serial>[0-9A-F:]+)/$', views.CertificateRevocationListView.as_view(), name='crl'))
+    urlpatterns += [
+        url(r'^crl/(?P<serial>[0-9A-F:]+)/base/$',
+            views.CertificateRevocationListView.as_view(scope='base', expires=86400),
+            name='crl-base'),
+        url(r'^crl/(?P<serial>[0-9A-F:]+)/delta/$',
+            views.CertificateRevocationListView.as_view(scope='delta'), name='crl-delta'),
+        url(r'^crl/(?P<serial>[0-9A-F:]+)/shard/(?P<shards>[0-9]+)/(?P<shard>[0-9]+)/$',
+            views.CertificateRevocationListView.as_view(scope='shard'), name='crl-shard'),
+    ]
+
+if ca_settings.CA_PROVIDE_METRICS is True:
+    urlpatterns.append(url(r'^metrics/$', views.MetricsView.as_view(), name='metrics'))
 
 for name, kwargs in CA_OCSP_URLS.items():
+    # Entries with a "responders" key serve all certificate authorities
+    view = views.MultiCAOCSPView if 'responders' in kwargs else views.OCSPView
     urlpatterns += [
-        url(r'ocsp/%s/$' % name, views.OCSPView.as_view(**kwargs),
+        url(r'ocsp/%s/$' % name, view.as_view(**kwargs),
             name='ocsp-post-%s' % name),
-        url(r'ocsp/%s/(?P<data>[a-zA-Z0-9=+/]+)$' % name, views.OCSPView.as_view(**kwargs),
+        url(r'ocsp/%s/(?P<data>[a-zA-Z0-9=+/]+)$' % name, view.as_view(**kwargs),
             name='ocsp-get-%s' % name)
     ]
@@ -15,6 +15,7 @@
 
 """Central functions to load CA key and cert as PKey/X509 objects."""
 
+import calendar
 import re
 import uuid
 
@@ -25,11 +26,15 @@ from ipaddress import ip_address
 
 from django.core.validators import URLValidator
 from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import six
 from django.utils.encoding import force_bytes
 from django.utils.encoding import force_text
 from django.utils.functional import Promise
 from django.utils.translation import ugettext_lazy as _
 
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
 from OpenSSL import crypto
 
 from django_ca import ca_settings
@@ -41,6 +46,12 @@ SUBJECT_FIELDS = ['C', 'ST', 'L', 'O', 'OU', 'CN', 'emailAddress', ]
 EXTENDED_KEY_USAGE_DESC = _('Purposes for which the certificate public key can be used for.')
 KEY_USAGE_DESC = _('Permitted key usages.')
 SAN_OPTIONS_RE = '(email|URI|IP|DNS|RID|dirName|otherName):'
+
+# Elliptic curves supported for EC keys, by their NIST name
+ECC_CURVES = {
+    'P-256': ec.SECP256R1,
+    'P-384': ec.SECP384R1,
+}
 _datetime_format = '%Y%m%d%H%M%SZ'
 
 
@@ -61,6 +72,37 @@ def parse_date(date):
     return datetime.strptime(date, _datetime_format)
 
 
+def generate_private_key(key_type, key_size, ecc_curve='P-256'):
+    """Generate a new private key.
+
+    Parameters
+    ----------
+
+    key_type : {'RSA', 'DSA', 'EC'}
+        The type of the key.
+    key_size : int
+        The size of the key in bits, ignored for EC keys.
+    ecc_curve : {'P-256', 'P-384'}, optional
+        The elliptic curve used for EC keys, the default is ``"P-256"``.
+
+    Returns
+    -------
+
+    :py:class:`OpenSSL.crypto.PKey`
+    """
+    if key_type == 'EC':
+        # PKey.from_cryptography_key() does not support EC keys in older versions of pyOpenSSL
+        key = ec.generate_private_key(ECC_CURVES[ecc_curve](), default_backend())
+        pem = key.private_bytes(encoding=serialization.Encoding.PEM,
+                                format=serialization.PrivateFormat.PKCS8,
+                                encryption_algorithm=serialization.NoEncryption())
+        return crypto.load_privatekey(crypto.FILETYPE_PEM, pem)
+
+    private_key = crypto.PKey()
+    private_key.generate_key(getattr(crypto, 'TYPE_%s' % key_type), key_size)
+    return private_key
+
+
 def format_date(date):
     """Format date as ASN1 GENERALIZEDTIME, as required by various fields."""
     return date.strftime(_datetime_format)
@@ -184,6 +226,59 @@ def serial_from_int(i):
     return ':'.join(a+b for a, b in zip(s[::2], s[1::2]))
 
 
+def get_ocsp_cache_key(ca_serial, serial, status, revoked_date, responder_serial, expires,
+                       this_update_bucket=None):
+    """Get the cache key for a pre-signed OCSP response.
+
+    The key includes the status of the certificate, so a response is never served after the
+    status changed, and all parameters of the response, so responders with different
+    configurations never serve each other's responses.
+
+    Parameters
+    ----------
+
+    ca_serial : str
+        Serial of the certificate authority that issued the certificate.
+    serial : str
+        Serial of the certificate, in the same format as stored in the database.
+    status : str
+        The OCSP status of the certificate, as returned by
+        :py:attr:`~django_ca.models.Certificate.ocsp_status`.
+    revoked_date : datetime
+        When the certificate was revoked, ``None`` if it is not revoked.
+    responder_serial : int
+        Serial of the certificate used for signing the response.
+    expires : int
+        Time in seconds that the response remains valid.
+    this_update_bucket : int, optional
+        The ``this_update_bucket`` of :py:class:`~django_ca.views.OCSPView`.
+    """
+    revoked = calendar.timegm(revoked_date.utctimetuple()) if revoked_date else 0
+    return 'ocsp_%s_%s_%s_%s_%x_%s_%s' % (ca_serial, serial, status, revoked, responder_serial,
+                                         expires, this_update_bucket or 0)
+
+
+def get_crl_shard(serial, shards):
+    """Get the CRL shard of a certificate, a number between ``0`` and ``shards - 1``.
+
+    ``serial`` is either an int or a hex-encoded serial as stored in the database.
+    """
+    if isinstance(serial, six.string_types):
+        serial = int(serial.replace(':', ''), 16)
+    return serial % shards
+
+
+def get_crl_shard_urls(crl_url, shards, shard):
+    """Get the URLs of a CRL shard.
+
+    ``crl_url`` is the value of :py:attr:`~django_ca.models.CertificateAuthority.crl_url`. Only
+    URLs that contain a ``{shard}`` placeholder are returned, with ``{shards}`` and ``{shard}``
+    replaced by the number of shards and the shard.
+    """
+    return [url.replace('{shards}', str(shards)).replace('{shard}', str(shard))
+            for url in (crl_url or '').split() if '{shard}' in url]
+
+
 def get_basic_cert(expires, now=None):
     """Get a basic X509 cert object.
 
@@ -14,45 +14,171 @@
 # see <http://www.gnu.org/licenses/>.
 
 import base64
+import calendar
+import hashlib
 import logging
+import os
+import threading
+import time
+import uuid
 
 from datetime import datetime
 from datetime import timedelta
+from functools import partial
 
 import asn1crypto
 
 from OpenSSL import crypto
 from ocspbuilder import OCSPResponseBuilder
-from oscrypto.asymmetric import load_certificate
-from oscrypto.asymmetric import load_private_key
 
 from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
 from django.core.urlresolvers import reverse
+from django.db import close_old_connections
+from django.http import FileResponse
+from django.http import Http404
 from django.http import HttpResponse
-from django.utils.decorators import classonlymethod
+from django.http import HttpResponseNotModified
 from django.utils.decorators import method_decorator
 from django.utils.encoding import force_bytes
+from django.utils.http import http_date
+from django.utils.http import parse_http_date_safe
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic.base import View
 from django.views.generic.detail import SingleObjectMixin
 from django.views.generic.edit import UpdateView
 
+from . import ca_settings
+from . import metrics
+from .crl import get_base_crl
 from .crl import get_crl
+from .crl import get_crl_path
+from .crl import get_delta_crl
+from .crl import get_invalidation_time
+from .crl import get_shard_crl
+from .crl import read_crl_metadata
+from .crl import write_crl_files
 from .forms import RevokeCertificateForm
 from .models import Certificate
 from .models import CertificateAuthority
+from .ocsp import get_issuer_index
+from .ocsp import get_responder_context
+from .ocsp import get_revocation_index
+from .ocsp import get_revocation_snapshot
+from .ocsp import get_single_response
+from .ocsp import is_issuer
+from .ocsp import sign_ocsp_response
+from .signing import SigningQueueFull
+from .signing import get_signing_pool
+from .utils import get_ocsp_cache_key
 from .utils import serial_from_int
 
 log = logging.getLogger(__name__)
 
+# Keys of CRLs currently regenerated in a background thread
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def refresh_in_background(key, func, *args):
+    """Call ``func`` in a background thread, unless a thread for the same key is still running."""
+
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def run():
+        try:
+            func(*args)
+        except Exception:
+            log.exception('Error regenerating %s in the background.', key)
+        finally:
+            close_old_connections()
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+
+
+def single_flight(key, func, wait=None, poll=None, timeout=60):
+    """Call ``func`` unless another process is already doing so for the same ``key``.
+
+    The lock is acquired with ``cache.add()``, so it is shared by all processes using the same
+    cache backend. It expires after ``timeout`` seconds in case its owner dies. The lock stores a
+    unique token and is only released by its owner, so a process that took longer than
+    ``timeout`` does not release the lock of another process.
+
+    If the lock is held by somebody else and ``wait`` is ``None``, ``None`` is returned
+    immediately, so that the caller can serve the previous value. Otherwise ``poll`` is called
+    every 0.1 seconds for up to ``wait`` seconds and its first return value other than ``None`` is
+    returned. If no value appeared, ``func`` is called anyway.
+    """
+    lock_key = '%s_lock' % key
+    token = uuid.uuid4().hex
+    if cache.add(lock_key, token, timeout):
+        try:
+            return func()
+        finally:
+            # NOTE: Django's cache API has no atomic compare-and-delete, but this only leaves a
+            #       very small window instead of the whole time func() exceeds the timeout.
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    if wait is None:
+        return None
+
+    deadline = time.time() + wait
+    while True:
+        value = poll()
+        if value is not None:
+            return value
+        if time.time() >= deadline:
+            break
+        time.sleep(0.1)
+
+    log.warning('%s: Lock was not released within %s seconds.', key, wait)
+    return func()
+
+
+def get_crl_cache_headers(etag, this_update, next_update):
+    """Get HTTP caching headers for a CRL.
+
+    ``this_update`` and ``next_update`` are timestamps, responses may be cached until the CRL
+    expires. Returns a list of tuples of header name and value.
+    """
+    max_age = max(int(next_update - time.time()), 0)
+    return [
+        ('ETag', '"%s"' % etag),
+        ('Last-Modified', http_date(this_update)),
+        ('Expires', http_date(next_update)),
+        ('Cache-Control', 'max-age=%s, public, no-transform, must-revalidate' % max_age),
+    ]
+
+
+def is_not_modified(if_none_match, if_modified_since, etag, last_modified):
+    """Check the ``If-None-Match`` and ``If-Modified-Since`` request headers.
+
+    Returns ``True`` if a ``304 Not Modified`` response should be sent. As required by RFC 7232,
+    ``If-Modified-Since`` is ignored if ``If-None-Match`` is present.
+    """
+    if if_none_match:
+        etags = [value.strip() for value in if_none_match.split(',')]
+        return '*' in etags or '"%s"' % etag in etags or 'W/"%s"' % etag in etags
+    if if_modified_since:
+        if_modified_since = parse_http_date_safe(if_modified_since)
+        return if_modified_since is not None and last_modified <= if_modified_since
+    return False
+
 
 class CertificateRevocationListView(View, SingleObjectMixin):
     """Generic view that provides Certificate Revocation Lists (CRLs)."""
 
     slug_field = 'serial'
     slug_url_kwarg = 'serial'
-    queryset = CertificateAuthority.objects.all().prefetch_related('certificate_set')
+    queryset = CertificateAuthority.objects.all()
 
     # parameters for the CRL itself
     type = crypto.FILETYPE_ASN1
@@ -65,20 +191,218 @@ class CertificateRevocationListView(View, SingleObjectMixin):
     digest = 'sha512'
     """Digest used for generating the CRL."""
 
+    scope = None
+    """Set to ``"base"`` to serve a complete CRL with a CRL number that delta CRLs refer to or to
+    ``"delta"`` to serve delta CRLs (see :py:func:`~django_ca.crl.get_delta_crl`). The default is
+    a complete CRL without a CRL number. With ``"shard"``, the view serves the CRL for a shard of
+    the certificates (see :py:func:`~django_ca.crl.get_shard_crl`) given by the ``shards`` and
+    ``shard`` URL parameters. ``shards`` must be equal to ``CA_CRL_SHARDS``."""
+
+    refresh = None
+    """If set, CRLs are regenerated in the background once this fraction of ``expires`` has passed
+    or a certificate was revoked, while the previous CRL is still served. By default, CRLs are
+    regenerated while the request waits when they expire or a certificate was revoked."""
+
+    lock_wait = 5
+    """Only one process regenerates a CRL at any time. If a CRL has expired while another process
+    is regenerating it, wait this many seconds for the new CRL before generating it anyway. Other
+    processes serve the previous CRL, if there is one."""
+
     # header used in the request
     content_type = 'application/pkix-crl'
     """The value of the Content-Type header used in the response. For CRLs in
     PEM format, use ``"text/plain"``."""
 
-    def get(self, request, serial):
+    def get(self, request, serial, **kwargs):
+        try:
+            crl, path, etag, this_update, next_update = self.get_crl_info(serial)
+        except SigningQueueFull as e:
+            log.warning('Could not sign CRL: %s', e)
+            response = HttpResponse('Service Unavailable', status=503, content_type='text/plain')
+            response['Retry-After'] = 1
+            return response
+
+        headers = get_crl_cache_headers(etag, this_update, next_update)
+        if is_not_modified(request.META.get('HTTP_IF_NONE_MATCH'),
+                           request.META.get('HTTP_IF_MODIFIED_SINCE'), etag, this_update):
+            response = HttpResponseNotModified()
+        elif path is None:
+            response = HttpResponse(crl, content_type=self.content_type)
+
+        # Let the web server send the file if configured
+        elif ca_settings.CA_CRL_SENDFILE == 'X-Accel-Redirect':
+            if ca_settings.CA_CRL_SENDFILE_PREFIX is None:
+                raise ImproperlyConfigured(
+                    'CA_CRL_SENDFILE_PREFIX is required for X-Accel-Redirect.')
+            response = HttpResponse(content_type=self.content_type)
+            response['X-Accel-Redirect'] = '%s%s' % (
+                ca_settings.CA_CRL_SENDFILE_PREFIX,
+                os.path.relpath(path, ca_settings.CA_CRL_DIR).replace(os.path.sep, '/'))
+        elif ca_settings.CA_CRL_SENDFILE == 'X-Sendfile':
+            response = HttpResponse(content_type=self.content_type)
+            response['X-Sendfile'] = os.path.abspath(path)
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=self.content_type)
+
+        for name, value in headers:
+            response[name] = value
+        return response
+
+    def get_crl_info(self, serial):
+        """Get the CRL for the certificate authority with the given serial and its metadata.
+
+        Returns a tuple of the CRL, the path to the CRL (if stored in ``CA_CRL_DIR``, the CRL is
+        ``None`` in this case), its ETag and the timestamps of ``thisUpdate`` and ``nextUpdate``.
+        Raises ``Http404`` for shards other than those of the current ``CA_CRL_SHARDS`` setting.
+        """
+        if self.scope == 'shard':
+            # Clients must not be able to generate (and store) CRLs for arbitrary numbers of shards
+            shards, shard = int(self.kwargs['shards']), int(self.kwargs['shard'])
+            if shards != ca_settings.CA_CRL_SHARDS or shard >= shards:
+                raise Http404('Unknown CRL shard: %s/%s' % (shard, shards))
+
+        crl_file = self.get_crl_file(serial)
+        if crl_file is None:
+            crl, created, etag = self.get_cached_crl(serial)
+            return crl, None, etag, int(created), int(created) + self.expires
+
+        path, metadata = crl_file
+        etag = '%s-%s' % (metadata['sha256'], os.path.splitext(path)[1][1:])
+        return (None, path, etag, calendar.timegm(metadata['this_update'].utctimetuple()),
+                calendar.timegm(metadata['next_update'].utctimetuple()))
+
+    def get_crl_file(self, serial):
+        """Get the path and metadata of the CRL stored in ``CA_CRL_DIR``.
+
+        A new CRL is generated and stored if there is no CRL or it has expired. Returns ``None`` if
+        ``CA_CRL_DIR`` is not set or the CRL type is neither PEM nor DER, in which case CRLs are
+        not stored. Otherwise a tuple of the path and the metadata as returned by
+        :py:func:`~django_ca.crl.write_crl_files` is returned.
+        """
+        extension = {crypto.FILETYPE_ASN1: 'der', crypto.FILETYPE_PEM: 'pem'}.get(self.type)
+        if ca_settings.CA_CRL_DIR is None or extension is None:
+            return None
+
+        path = get_crl_path(ca_settings.CA_CRL_DIR, serial, self.get_scope_name(), self.digest)
+        metadata = self.get_crl_file_metadata(path)
+        if metadata is None:
+            metrics.CRL_CACHE.inc(result='miss')
+            metadata = single_flight(path, lambda: self.update_crl_file(path),
+                                     wait=self.lock_wait,
+                                     poll=lambda: self.get_crl_file_metadata(path))
+        elif self.is_outdated(serial, calendar.timegm(metadata['this_update'].utctimetuple())):
+            # The current file is served if another process is already regenerating it
+            if self.refresh is None:
+                metrics.CRL_CACHE.inc(result='miss')
+                metadata = single_flight(path, lambda: self.update_crl_file(path)) or metadata
+            else:
+                metrics.CRL_CACHE.inc(result='stale')
+                refresh_in_background(path, single_flight, path,
+                                      lambda: self.update_crl_file(path))
+        else:
+            metrics.CRL_CACHE.inc(result='hit')
+        return '%s.%s' % (path, extension), metadata
+
+    def get_crl_file_metadata(self, path):
+        """Get the metadata of the CRL stored at ``path`` or ``None`` if there is no valid CRL."""
+
+        metadata = read_crl_metadata(path)
+        if metadata is not None and metadata['next_update'] > datetime.utcnow():
+            return metadata
+
+    def update_crl_file(self, path):
+        return write_crl_files(path, self.generate_crl(self.get_object(), crypto.FILETYPE_ASN1))
+
+    def get_crl(self, serial):
+        """Get the CRL for the certificate authority with the given serial.
+
+        The CRL is cached for ``expires`` seconds or stored in ``CA_CRL_DIR``, if set. Raises
+        :py:class:`~django.http.Http404` if the certificate authority does not exist or if a delta
+        CRL is requested but no base CRL was generated yet.
+        """
+        crl_file = self.get_crl_file(serial)
+        if crl_file is not None:
+            with open(crl_file[0], 'rb') as stream:
+                return stream.read()
+        return self.get_cached_crl(serial)[0]
+
+    def get_cached_crl(self, serial):
+        """Get the cached CRL, generating it if necessary.
+
+        Returns a tuple of the CRL, the timestamp when it was created and its ETag.
+        """
         cache_key = 'crl_%s_%s_%s' % (serial, self.type, self.digest)
-        crl = cache.get(cache_key)
-        if crl is None:
-            ca = self.get_object()
-            crl = get_crl(ca, type=self.type, expires=self.expires, digest=force_bytes(self.digest))
-            cache.set(cache_key, crl, self.expires)
+        if self.scope is not None:
+            cache_key += '_%s' % self.get_scope_name()
+
+        cached = cache.get(cache_key)
+        if cached is None:
+            metrics.CRL_CACHE.inc(result='miss')
+            return single_flight(cache_key, lambda: self.update_cache(cache_key),
+                                 wait=self.lock_wait, poll=lambda: cache.get(cache_key))
+
+        if self.is_outdated(serial, cached[1]):
+            # The previous CRL is served if another process is already regenerating it
+            if self.refresh is None:
+                metrics.CRL_CACHE.inc(result='miss')
+                return single_flight(cache_key, lambda: self.update_cache(cache_key)) or cached
+            metrics.CRL_CACHE.inc(result='stale')
+            refresh_in_background(cache_key, single_flight, cache_key,
+                                  lambda: self.update_cache(cache_key))
+        else:
+            metrics.CRL_CACHE.inc(result='hit')
+        return cached
+
+    def update_cache(self, cache_key):
+        created = time.time()
+        crl = self.generate_crl(self.get_object(), self.type)
+        cached = (crl, created, hashlib.sha256(crl).hexdigest())
+        cache.set(cache_key, cached, self.expires)
+        return cached
+
+    def get_scope_name(self):
+        if self.scope == 'shard':
+            return 'shard-%s-%s' % (int(self.kwargs['shards']), int(self.kwargs['shard']))
+        return self.scope
+
+    def is_outdated(self, serial, created):
+        """Check if a CRL created at the given timestamp should be regenerated.
+
+        A CRL is outdated if a certificate was revoked after it was created or, if ``refresh`` is
+        set, if it is older than this fraction of ``expires``.
+        """
+        invalidated = get_invalidation_time(serial)
+        if invalidated is not None and invalidated >= created:
+            return True
+        return self.refresh is not None and time.time() - created > self.expires * self.refresh
+
+    def generate_crl(self, ca, type):
+        """Generate a new CRL of the given type for the certificate authority."""
+
+        func = {None: get_crl, 'base': get_base_crl, 'delta': get_delta_crl}.get(self.scope)
+        if self.scope == 'shard':
+            func = partial(get_shard_crl, shards=int(self.kwargs['shards']),
+                           shard=int(self.kwargs['shard']))
+
+        try:
+            with metrics.CRL_GENERATION_SECONDS.time():
+                crl = func(ca, type=type, expires=self.expires, digest=force_bytes(self.digest))
+        except ValueError as e:  # e.g. delta CRL requested, but there is no base CRL yet
+            raise Http404(e)
+        metrics.CRL_SIZE_BYTES.set(len(crl), ca=ca.serial)
+        return crl
 
-        return HttpResponse(crl, content_type=self.content_type)
+
+class MetricsView(View):
+    """View to provide metrics of OCSP responders and CRLs in the Prometheus text format.
+
+    Metrics are collected per process, see :py:mod:`django_ca.metrics`.
+    """
+
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def get(self, request):
+        return HttpResponse(metrics.registry.render(), content_type=self.content_type)
 
 
 class RevokeCertificateView(UpdateView):
@@ -124,96 +448,188 @@ class OCSPView(View):
     """Time in seconds that the responses remain valid. The default is 600 seconds or ten
     minutes."""
 
-    @classonlymethod
-    def as_view(cls, **kwargs):
-        # Preload the responder key and certificate for faster access.
+    cache_margin = 60
+    """Responses to requests without a nonce are cached until this many seconds before they
+    expire. Set to ``None`` to disable caching of responses."""
 
-        responder_key = kwargs.get('responder_key')
-        try:
-            # mistakenly reported by coverage 4.0.3 as missed branch, fixed in 4.1:
-            # https://bitbucket.org/ned/coveragepy/issues/146/context-managers-confuse-branch-coverage#comment-24552176
-            with open(responder_key, 'rb') as stream:  # pragma: no branch
-                kwargs['responder_key'] = stream.read()
-        except:
-            raise ImproperlyConfigured('%s: Could not read private key.' % responder_key)
+    lock_wait = 1
+    """Only one process signs a response that is cached. Other processes receiving the same request
+    wait up to this many seconds for the response to appear in the cache before signing it
+    themselves."""
 
-        responder_cert = kwargs.get('responder_cert')
-        try:
-            cert = Certificate.objects.get(serial=responder_cert)
-            kwargs['responder_cert'] = force_bytes(cert.pub)
-        except Certificate.DoesNotExist:
-            try:
-                # mistakenly reported by coverage 4.0.3 as missed branch, fixed in 4.1:
-                # https://bitbucket.org/ned/coveragepy/issues/146/context-managers-confuse-branch-coverage#comment-24552176
-                with open(responder_cert, 'rb') as stream:  # pragma: no branch
-                    kwargs['responder_cert'] = stream.read()
-            except:
-                raise ImproperlyConfigured('%s: Could not read public key.' % responder_cert)
-
-        return super(OCSPView, cls).as_view(**kwargs)
+    this_update_bucket = None
+    """If set, ``thisUpdate`` (and thus ``nextUpdate``) of responses is rounded down to a multiple
+    of this many seconds. Responses to requests without a nonce are then identical on all servers
+    within this time window, which makes them easy to cache for HTTP caches and CDNs. The value
+    must be smaller than ``expires``."""
+
+    index_refresh = None
+    """If set, the status of certificates is looked up in an in-memory index (see
+    :py:class:`~django_ca.ocsp.RevocationIndex`) that is refreshed at most every this many
+    seconds. The default is ``None``, meaning that the database is queried on every request."""
+
+    snapshot = None
+    """Path to a snapshot written by ``manage.py dump_ocsp_snapshot``. If set, the status of
+    certificates is looked up in the snapshot (see :py:class:`~django_ca.ocsp.RevocationSnapshot`)
+    and the database is not used at all. ``ca`` is ignored and ``responder_cert`` must be a
+    path."""
+
+    snapshot_refresh = 10
+    """Check if the snapshot was replaced at most every this many seconds."""
+
+    def get_snapshot(self):
+        """Get the :py:class:`~django_ca.ocsp.RevocationSnapshot` for this view or ``None``."""
+
+        if self.snapshot is None:
+            return None
+        return get_revocation_snapshot(self.snapshot, self.snapshot_refresh)
+
+    def get_responder_context(self):
+        """Get the :py:class:`~django_ca.ocsp.OCSPResponderContext` for this view.
+
+        The context is loaded on first use and shared by all views with the same configuration.
+        """
+        return get_responder_context(self.ca, self.responder_key, self.responder_cert,
+                                     snapshot=self.get_snapshot())
+
+    def __init__(self, **kwargs):
+        super(OCSPView, self).__init__(**kwargs)
+
+        # Responses signed late in a bucket would otherwise already have expired
+        if self.this_update_bucket and self.this_update_bucket >= self.expires:
+            raise ImproperlyConfigured(
+                'this_update_bucket (%s) must be smaller than expires (%s).' % (
+                    self.this_update_bucket, self.expires))
+
+    def get_request_context(self, cert_ids):
+        """Get the :py:class:`~django_ca.ocsp.OCSPResponderContext` for the given CertIDs.
+
+        Returns ``None`` if this responder cannot answer the request. This implementation always
+        returns the context of the configured certificate authority.
+        """
+        return self.get_responder_context()
 
     @method_decorator(csrf_exempt)
     def dispatch(self, *args, **kwargs):
         return super(OCSPView, self).dispatch(*args, **kwargs)
 
     def get(self, request, data):
-        return self.process_ocsp_request(base64.b64decode(data))
+        return self.process_ocsp_request(base64.b64decode(data), http_cache=True)
 
     def post(self, request):
         return self.process_ocsp_request(request.body)
 
-    def fail(self, reason):
+    def fail(self, reason, status=None):
+        metrics.OCSP_RESPONSES.inc(status=status or reason)
         builder = OCSPResponseBuilder(response_status=reason)
         return builder.build()
 
-    def process_ocsp_request(self, data):
-        status = 200
+    def process_ocsp_request(self, data, http_cache=False):
+        status, response = self.handle_ocsp_request(data)
+        http_response = HttpResponse(response.dump(), status=status,
+                                     content_type='application/ocsp-response')
+        if http_cache is True and response['response_status'].native == 'successful':
+            for header, value in self.get_cache_headers(response, http_response.content):
+                http_response[header] = value
+        return http_response
+
+    def handle_ocsp_request(self, data):
+        """Handle a DER encoded OCSP request.
+
+        Returns a tuple of the HTTP status code and the
+        :py:class:`~asn1crypto.ocsp.OCSPResponse`. This method never raises an exception, errors
+        are returned as unsuccessful OCSP responses.
+        """
         try:
-            response = self.get_ocsp_response(data)
+            return 200, self.get_ocsp_response(data)
         except:
-            response = self.fail('internal_error')
-            status = 500
-
-        return HttpResponse(response.dump(), status=status,
-                            content_type='application/ocsp-response')
+            log.exception('Error creating OCSP response.')
+            return 500, self.fail('internal_error')
+
+    def get_cache_headers(self, response, content):
+        """Get HTTP caching headers for a successful response as described in RFC 5019, section
+        6.2.
+
+        Returns a list of tuples of header name and value.
+        """
+
+        single = response['response_bytes']['response'].parsed['tbs_response_data']['responses'][0]
+        this_update = calendar.timegm(single['this_update'].native.utctimetuple())
+        next_update = calendar.timegm(single['next_update'].native.utctimetuple())
+        max_age = max(int(next_update - time.time()), 0)
+
+        return [
+            ('ETag', '"%s"' % hashlib.sha1(content).hexdigest()),
+            ('Last-Modified', http_date(this_update)),
+            ('Expires', http_date(next_update)),
+            ('Cache-Control', 'max-age=%s, public, no-transform, must-revalidate' % max_age),
+        ]
+
+    def get_statuses(self, ca, serials):
+        """Get the OCSP status and revocation date for the given serials.
+
+        Returns a dictionary mapping serials to a tuple of status and revocation date. Unknown
+        serials are not included.
+        """
+        if self.snapshot is not None:
+            return self.get_snapshot().get(serials)
+
+        statuses = {}
+        if self.index_refresh is not None:
+            statuses = get_revocation_index(ca).get(serials, self.index_refresh)
+            serials = serials - set(statuses)
+
+            if not serials:
+                return statuses
+
+        # Certificates not (yet) in the index are looked up in the database
+        qs = Certificate.objects.filter(ca=ca, serial__in=serials).only(
+            'serial', 'revoked', 'revoked_date', 'revoked_reason')
+        for cert in qs:
+            statuses[cert.serial] = (cert.ocsp_status, cert.revoked_date)
+        return statuses
+
+    def count_responses(self, statuses):
+        for status, revoked_date in statuses:
+            metrics.OCSP_RESPONSES.inc(status='good' if status == 'good' else 'revoked')
 
     def get_ocsp_response(self, data):
         try:
-            ocsp_request = asn1crypto.ocsp.OCSPRequest.load(data)
-
-            tbs_request = ocsp_request['tbs_request']
-            request_list = tbs_request['request_list']
-            if len(request_list) != 1:
-                log.error('Received OCSP request with multiple sub requests')
-                raise NotImplemented('Combined requests not yet supported')
-            single_request = request_list[0]  # TODO: Support more than one request
-            req_cert = single_request['req_cert']
-            serial = serial_from_int(req_cert['serial_number'].native)
+            with metrics.OCSP_PHASE_SECONDS.time(phase='parse'):
+                ocsp_request = asn1crypto.ocsp.OCSPRequest.load(data)
+
+                tbs_request = ocsp_request['tbs_request']
+                request_list = tbs_request['request_list']
+                if len(request_list) < 1:
+                    raise ValueError('OCSP request contains no sub requests')
+                cert_ids = [single_request['req_cert'] for single_request in request_list]
+                serials = [serial_from_int(cert_id['serial_number'].native)
+                           for cert_id in cert_ids]
         except Exception as e:
             log.exception('Error parsing OCSP request: %s', e)
             return self.fail('malformed_request')
 
-        # Get CA and certificate
-        ca = CertificateAuthority.objects.get(serial=self.ca)
-        try:
-            cert = Certificate.objects.filter(ca=ca).get(serial=serial)
-        except Certificate.DoesNotExist:
+        # Get CA and certificates
+        with metrics.OCSP_PHASE_SECONDS.time(phase='key_load'):
+            context = self.get_request_context(cert_ids)
+        if context is None:
+            log.warning('OCSP request for unknown or multiple issuers received.')
+            return self.fail('unauthorized')
+
+        # CertIDs are echoed in the response, so we must not vouch for CertIDs of other issuers
+        if not all(is_issuer(context.ca_cert.asn1, cert_id) for cert_id in cert_ids):
+            log.warning('OCSP request for a different issuer received.')
+            return self.fail('unauthorized')
+
+        ca = context.ca
+        with metrics.OCSP_PHASE_SECONDS.time(phase='db'):
+            statuses = self.get_statuses(ca, set(serials))
+        if len(statuses) != len(set(serials)):
             log.warn('OCSP request for unknown cert received.')
-            return self.fail('internal_error')
-
-        # load ca cert and responder key/cert
-        ca_cert = load_certificate(force_bytes(ca.pub))
-        responder_key = load_private_key(self.responder_key)
-        responder_cert = load_certificate(self.responder_cert)
-
-        builder = OCSPResponseBuilder(
-            response_status='successful',  # ResponseStatus.successful.value,
-            certificate=load_certificate(force_bytes(cert.pub)),
-            certificate_status=cert.ocsp_status,
-            revocation_date=cert.revoked_date,
-        )
+            return self.fail('internal_error', status='unknown')
 
         # Parse extensions
+        nonce = None
         for extension in tbs_request['request_extensions']:
             extn_id = extension['extn_id'].native
             critical = extension['critical'].native
@@ -224,7 +640,7 @@ class OCSPView(View):
 
             # Handle nonce extension
             if extn_id == 'nonce':
-                builder.nonce = value.native
+                nonce = value.native
 
             # That's all we know
             else:  # pragma: no cover
@@ -242,6 +658,106 @@ class OCSPView(View):
             elif unknown is True:  # pragma: no cover
                 log.info('Ignored unknown non-critical extension: %r', dict(extension.native))
 
-        builder.certificate_issuer = ca_cert
-        builder.next_update = datetime.utcnow() + timedelta(seconds=self.expires)
-        return builder.build(responder_key, responder_cert)
+        # Responses to requests without a nonce do not depend on the request, so we can serve a
+        # pre-signed response from the cache. Only single requests with SHA-1 CertIDs (as
+        # required by RFC 5019) are cached, since the CertID is included in the response.
+        cache_key = None
+        if nonce is None and self.cache_margin is not None and len(cert_ids) == 1 \
+                and cert_ids[0]['hash_algorithm']['algorithm'].native == 'sha1':
+            status, revoked_date = statuses[serials[0]]
+            cache_key = get_ocsp_cache_key(
+                context.ca_serial, serials[0], status, revoked_date,
+                context.responder_cert.asn1.serial_number, self.expires, self.this_update_bucket)
+            cached = self.get_cached(cache_key)
+            if cached is not None:
+                self.count_responses([statuses[serials[0]]])
+                return cached
+
+        this_update = datetime.utcnow().replace(microsecond=0)
+        if self.this_update_bucket:
+            this_update -= timedelta(
+                seconds=calendar.timegm(this_update.utctimetuple()) % self.this_update_bucket)
+        next_update = this_update + timedelta(seconds=self.expires)
+        responses = []
+        for cert_id, serial in zip(cert_ids, serials):
+            status, revoked_date = statuses[serial]
+            responses.append(get_single_response(
+                cert_id, status, revoked_date, this_update=this_update,
+                next_update=next_update, issuer=context.ca_cert.asn1))
+
+        def sign():
+            response = sign_ocsp_response(
+                responses, context.responder_key, context.responder_cert, nonce=nonce,
+                produced_at=this_update, signing_pool=get_signing_pool(),
+                responder_key_path=context.responder_key_path)
+
+            if cache_key is not None:
+                timeout = (next_update - datetime.utcnow()).total_seconds() - self.cache_margin
+                if timeout > 0:
+                    cache.set(cache_key, response.dump(), int(timeout))
+            return response
+
+        try:
+            with metrics.OCSP_PHASE_SECONDS.time(phase='sign'):
+                if cache_key is None:
+                    response = sign()
+                else:
+                    # Only one process signs a cacheable response, others wait for the result
+                    response = single_flight(cache_key, sign, wait=self.lock_wait,
+                                             poll=lambda: self.get_cached(cache_key))
+        except SigningQueueFull as e:
+            log.warning('Could not sign OCSP response: %s', e)
+            return self.fail('try_later')
+
+        self.count_responses([statuses[serial] for serial in serials])
+        return response
+
+    def get_cached(self, cache_key):
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return asn1crypto.ocsp.OCSPResponse.load(cached)
+
+
+class MultiCAOCSPView(OCSPView):
+    """View to provide an OCSP responder for all enabled certificate authorities.
+
+    The certificate authority is looked up by the issuer name and key hash in the CertIDs of the
+    request (see :py:class:`~django_ca.ocsp.IssuerIndex`). SHA-1 and SHA-256 CertIDs are
+    supported. All certificates in a request must be issued by the same certificate authority,
+    otherwise an ``unauthorized`` response is returned. The ``ca``, ``responder_key`` and
+    ``responder_cert`` parameters are not used.
+    """
+
+    responders = {}
+    """Dictionary mapping serials of certificate authorities to a dictionary with the
+    ``responder_key`` and ``responder_cert`` used for this certificate authority. Requests for
+    certificate authorities not listed here get an ``unauthorized`` response, unless
+    :py:attr:`use_ca_key` is set."""
+
+    use_ca_key = False
+    """Set to ``True`` to let certificate authorities not listed in :py:attr:`responders` sign
+    responses with their own private key.
+
+    .. WARNING::
+
+       This loads the private key of the certificate authority (which may be a root CA) in the web
+       server for every request. Use a dedicated responder certificate instead whenever possible.
+    """
+
+    issuer_refresh = 300
+    """Reload the list of certificate authorities at most every this many seconds."""
+
+    def get_request_context(self, cert_ids):
+        issuers = set(get_issuer_index().get(cert_id, self.issuer_refresh) for cert_id in cert_ids)
+        if len(issuers) != 1 or None in issuers:
+            return None
+
+        serial, private_key_path = issuers.pop()
+        responder = self.responders.get(serial)
+        if responder is None and self.use_ca_key is True:
+            return get_responder_context(serial, private_key_path, serial)
+        elif responder is None:
+            log.warning('%s: No OCSP responder configured for this certificate authority.', serial)
+            return None
+        return get_responder_context(serial, responder['responder_key'],
+                                     responder['responder_cert'])
@@ -54,7 +54,7 @@ class BaseCommand(Command):
     def finalize_options(self):
         pass
 
-    def run_tests(self):
+    def setup_django(self):
         work_dir = os.path.join(_rootdir, 'ca')
 
         os.chdir(work_dir)
@@ -64,6 +64,9 @@ class BaseCommand(Command):
         import django
         django.setup()
 
+    def run_tests(self):
+        self.setup_django()
+
         suite = 'django_ca'
         if self.suite:
             suite += '.tests.%s' % self.suite
@@ -102,6 +105,63 @@ class CoverageCommand(BaseCommand):
 
         cov.html_report(directory=report_dir)
 
+class BenchmarkCRLCommand(BaseCommand):
+    description = 'Benchmark CRL backends (revoked certificates per second).'
+    user_options = [
+        ('entries=', None, 'Number of revoked certificates (default: 10000).', )
+    ]
+
+    def initialize_options(self):
+        self.entries = 10000
+
+    def run(self):
+        self.setup_django()
+
+        import time
+        from datetime import datetime
+        from datetime import timedelta
+        from io import BytesIO
+
+        from OpenSSL import crypto
+
+        from django.utils.encoding import force_bytes
+
+        from django_ca.signing import build_crl
+        from django_ca.signing import export_crl
+        from django_ca.signing import write_crl
+        from django_ca.utils import format_date
+
+        fixtures_dir = os.path.join('django_ca', 'tests', 'fixtures')
+        key_path = os.path.join(fixtures_dir, 'root.key')
+        with open(os.path.join(fixtures_dir, 'root.pem'), 'rb') as stream:
+            ca_pem = stream.read()
+
+        now = datetime.utcnow().replace(microsecond=0)
+        next_update = now + timedelta(days=1)
+        revoked = [('%X' % i, 'keyCompromise' if i % 2 else None, now - timedelta(seconds=i))
+                   for i in range(1, int(self.entries) + 1)]
+
+        def pyopenssl():
+            # Includes the conversion done by django_ca.crl.get_crl()
+            entries = [(force_bytes(serial), force_bytes(reason) if reason else None,
+                        force_bytes(format_date(date))) for serial, reason, date in revoked]
+            export_crl(ca_pem, key_path, entries, type=crypto.FILETYPE_ASN1, days=1,
+                       digest=b'sha512')
+
+        def cryptography():
+            build_crl(ca_pem, key_path, revoked, now, next_update, 'sha512')
+
+        def stream():
+            write_crl(BytesIO(), ca_pem, key_path, iter(revoked), now, next_update, 'sha512')
+
+        for name, func in [('pyopenssl', pyopenssl), ('cryptography', cryptography),
+                           ('stream', stream)]:
+            start = time.time()
+            func()
+            seconds = time.time() - start
+            print('%-12s %d entries in %.3f seconds (%d entries/second)' % (
+                name, len(revoked), seconds, len(revoked) / seconds))
+
 
 setup(
     name='django-ca',
@@ -121,11 +181,13 @@ setup(
     zip_safe=False,  # because of the static files
     install_requires=[
         'Django>=1.8',
+        'cryptography>=2.5',
         'ocspbuilder==0.10.1',
         'oscrypto==0.15.0',
         'pyOpenSSL>=16.0',
     ],
     cmdclass={
+        'benchmark_crl': BenchmarkCRLCommand,
         'coverage': CoverageCommand,
         'test': TestCommand,
     },